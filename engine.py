@@ -13,7 +13,11 @@ A Toolkit engine for Mari
 """
 
 import os
+import time
+import uuid
 import logging
+import weakref
+import contextlib
 import mari
 import mari.utils
 import sgtk
@@ -22,11 +26,45 @@ from sgtk import TankError
 SHOTGUN_APP_PALETTE_PREFIX = "panel_"
 MARI_MAIN_WINDOW_WIDGET_NAME = "MainWindow"
 
+# Formatters used to give a standard format to log messages:
+#     Shotgun <basename>: <message>
+# where "basename" is the leaf part of the logging record name,
+# for example "tk-multi-shotgunpanel" or "qt_importer".
+DEBUG_LOG_FORMATTER = logging.Formatter("Debug: Shotgun %(basename)s: %(message)s")
+LOG_FORMATTER = logging.Formatter("Shotgun %(basename)s: %(message)s")
+
 class MariEngine(sgtk.platform.Engine):
     """
     The engine class
     """
 
+    # log sinks - these are created once the engine has been initialized and
+    # until then, log messages are written straight to the script console:
+    __console_log_sink = None
+    __file_log_handler = None
+    __debug_logging = None
+    __error_reporter = None
+
+    # panel widgets created by show_panel keyed by panel id, together with the Mari main
+    # window once found, so that the widget tree doesn't have to be searched each time:
+    __panel_widgets = None
+    __main_window = None
+
+    __session_exporter = None
+    __startup_command_queue = None
+
+    # the job being run when this is a headless worker process:
+    __worker_job = None
+
+    __mari_api_tracer = None
+    __command_timings = None
+    __command_profiler = None
+    __publish_cache = None
+    __geometry_contents_index = None
+    __shotgun_pool = None
+    __main_thread_dispatcher = None
+    __scheduler = None
+
     @property
     def context_change_allowed(self):
         """
@@ -77,6 +115,35 @@ class MariEngine(sgtk.platform.Engine):
         """
         self.log_debug("%s: Initializing..." % self)
 
+        tk_mari = self.import_module("tk_mari")
+
+        self.__debug_logging = self.get_setting("debug_logging", False)
+        self.__create_log_sinks()
+
+        if self.get_setting("trace_mari_api"):
+            # count calls into the Mari API made by the engine and apps:
+            self.__mari_api_tracer = tk_mari.MariApiTracer()
+            self.__mari_api_tracer.install()
+
+        # calls to Mari from worker threads are dispatched to the main thread:
+        self.__main_thread_dispatcher = tk_mari.MainThreadDispatcher()
+
+        # long running work on the main thread is split into time slices:
+        self.__scheduler = tk_mari.CooperativeScheduler()
+
+        # time and optionally profile the commands run from the Shotgun menu:
+        self.__command_timings = tk_mari.CommandTimings(self.get_setting("command_history_size"))
+        profile_output_dir = (os.path.expandvars(self.get_setting("profile_output_dir"))
+                              or os.path.join(self.cache_location, "profiles"))
+        self.__command_profiler = tk_mari.CommandProfiler(profile_output_dir)
+
+        if not self.has_ui:
+            self.__worker_job = tk_mari.get_current_job()
+
+        if self.has_ui:
+            # errors are collected and shown in a single non-modal panel:
+            self.__error_reporter = tk_mari.ErrorReporter(self.get_setting("error_report_interval"))
+
         # check that this version of Mari is supported:
         MIN_VERSION = (2,6,1) # completely unsupported below this!
         MAX_VERSION = (4,5) # untested above this so display a warning
@@ -107,7 +174,17 @@ class MariEngine(sgtk.platform.Engine):
             self.log_warning(msg)
 
         # cache handles to the various manager instances:
-        tk_mari = self.import_module("tk_mari")
+        if self.get_setting("use_publish_cache"):
+            db_path = os.path.join(self.cache_location, "publish_cache.db")
+            try:
+                self.__publish_cache = tk_mari.PublishCache(db_path, self.get_setting("publish_cache_max_age"))
+            except Exception, e:
+                self.log_warning("Failed to open the publish cache '%s': %s" % (db_path, e))
+        db_path = os.path.join(self.cache_location, "geometry_contents.db")
+        try:
+            self.__geometry_contents_index = tk_mari.GeometryContentsIndex(db_path)
+        except Exception, e:
+            self.log_warning("Failed to open the geometry contents index '%s': %s" % (db_path, e))
         self.__geometry_mgr = tk_mari.GeometryManager()
         self.__project_mgr = tk_mari.ProjectManager()
         self.__metadata_mgr = tk_mari.MetadataManager()
@@ -120,7 +197,15 @@ class MariEngine(sgtk.platform.Engine):
 
         # connect to Mari project events:
         mari.utils.connect(mari.projects.opened, self.__on_project_opened)
-        # mari.utils.connect(mari.projects.saved, self.__on_project_saved)
+        mari.utils.connect(mari.projects.aboutToClose, self.__on_project_about_to_close)
+        mari.utils.connect(mari.geo.entityAdded, self.__geometry_mgr.geometry_changed)
+        mari.utils.connect(mari.geo.entityRemoved, self.__geometry_mgr.geometry_changed)
+
+        if self.has_ui and self.get_setting("export_session_on_save"):
+            tk_mari = self.import_module("tk_mari")
+            self.__session_exporter = tk_mari.SessionExporter(self.__get_session_export_info,
+                                                              self.get_setting("session_export_delay"))
+            mari.utils.connect(mari.projects.saved, self.__on_project_saved)
 
         self._run_app_instance_commands()
 
@@ -138,7 +223,7 @@ class MariEngine(sgtk.platform.Engine):
             self._menu_generator.destroy_menu()
 
         self.create_menu()
-        self._run_app_instance_commands()
+        self._run_app_instance_commands(first_launch=False)
 
     def destroy_engine(self):
         """
@@ -146,13 +231,44 @@ class MariEngine(sgtk.platform.Engine):
         """
         self.log_debug("%s: Destroying..." % self)
 
+        if self.__startup_command_queue:
+            self.__startup_command_queue.cancel()
+
         if self.has_ui:
             # destroy the menu:
             self._menu_generator.destroy_menu()
 
         # disconnect from Mari project events:
         mari.utils.disconnect(mari.projects.opened, self.__on_project_opened)
-        # mari.utils.disconnect(mari.projects.saved, self.__on_project_saved)
+        mari.utils.disconnect(mari.projects.aboutToClose, self.__on_project_about_to_close)
+        mari.utils.disconnect(mari.geo.entityAdded, self.__geometry_mgr.geometry_changed)
+        mari.utils.disconnect(mari.geo.entityRemoved, self.__geometry_mgr.geometry_changed)
+        self.__geometry_mgr.cancel_proxy_swaps()
+        if self.__session_exporter:
+            mari.utils.disconnect(mari.projects.saved, self.__on_project_saved)
+            self.__session_exporter.close()
+            self.__session_exporter = None
+
+        if self.__error_reporter:
+            self.__error_reporter.close()
+            self.__error_reporter = None
+
+        if self.__mari_api_tracer:
+            self.__mari_api_tracer.uninstall()
+            self.__mari_api_tracer = None
+
+        if self.__shotgun_pool:
+            self.__shotgun_pool.shutdown()
+            self.__shotgun_pool = None
+
+        if self.__main_thread_dispatcher:
+            self.__main_thread_dispatcher.close()
+            self.__main_thread_dispatcher = None
+
+        if self.__scheduler:
+            self.__scheduler.cancel_all()
+
+        self.__destroy_log_sinks()
 
     @property
     def has_ui(self):
@@ -206,22 +322,22 @@ class MariEngine(sgtk.platform.Engine):
         widget_id = SHOTGUN_APP_PALETTE_PREFIX + panel_id
 
         # Get the panel widget and main window widget
-        main_window = None
-        shotgun_widget = None
-        for widget in QtGui.QApplication.allWidgets():
-            widget_name = widget.objectName()
-            if widget_name == widget_id:
-                shotgun_widget = widget
-            elif widget_name == MARI_MAIN_WINDOW_WIDGET_NAME:
-                main_window = widget
-
+        main_window = self.__get_main_window()
         if not main_window:
             raise Exception("Unable to get the '%s' widget!" % MARI_MAIN_WINDOW_WIDGET_NAME)
 
+        if self.__panel_widgets is None:
+            self.__panel_widgets = weakref.WeakValueDictionary()
+        shotgun_widget = self.__panel_widgets.get(panel_id)
+        if shotgun_widget is not None and not self.__is_widget_valid(shotgun_widget):
+            shotgun_widget = None
+
         # If the widget doesn't already exist, create it
         if not shotgun_widget:
             self.logger.debug("Creating new widget %s", widget_id)
             shotgun_widget = widget_class(*args, **kwargs)
+            shotgun_widget.setObjectName(widget_id)
+            self.__panel_widgets[panel_id] = shotgun_widget
         else:
             # Reparent the Shotgun app panel widget under Mari main window
             # to prevent it from being deleted with the existing Mari palette.
@@ -245,6 +361,91 @@ class MariEngine(sgtk.platform.Engine):
 
         return shotgun_widget
 
+    def __get_main_window(self):
+        """
+        Get the Mari main window widget.  The main window is searched for amongst the top level
+        widgets the first time this is called and then cached.
+
+        :returns:   The Mari main window widget if found, otherwise None
+        """
+        if self.__main_window is not None and self.__is_widget_valid(self.__main_window):
+            return self.__main_window
+
+        from tank.platform.qt import QtGui
+
+        self.__main_window = None
+        for widget in QtGui.QApplication.topLevelWidgets():
+            if widget.objectName() == MARI_MAIN_WINDOW_WIDGET_NAME:
+                self.__main_window = widget
+                break
+        else:
+            # fall back to searching all widgets:
+            for widget in QtGui.QApplication.allWidgets():
+                if widget.objectName() == MARI_MAIN_WINDOW_WIDGET_NAME:
+                    self.__main_window = widget
+                    break
+
+        return self.__main_window
+
+    def __is_widget_valid(self, widget):
+        """
+        Check that the underlying Qt object for a widget hasn't been deleted.
+
+        :param widget:  The widget to check
+        :returns:       True if the widget can still be used, otherwise False
+        """
+        try:
+            widget.objectName()
+        except RuntimeError:
+            # the C++ object has been deleted
+            return False
+        return True
+
+    @property
+    def main_thread_dispatcher(self):
+        """
+        The dispatcher used to run Mari API calls on the main thread from worker threads,
+        e.g. engine.main_thread_dispatcher.call(geo.name).result()
+        """
+        return self.__main_thread_dispatcher
+
+    @property
+    def scheduler(self):
+        """
+        The scheduler used to run long running work on the main thread in time slices so that
+        Mari keeps redrawing.  Work is written as a generator that yields between units of
+        work, e.g. engine.scheduler.run_sync(my_generator()).  Note that run_sync() doesn't
+        process user input so Mari isn't interactive until it returns.
+        """
+        return self.__scheduler
+
+    @property
+    def shotgun_pool(self):
+        """
+        The pool of Shotgun connections to use for Shotgun queries made from threads other
+        than the main thread, e.g. engine.shotgun_pool.find_async(...).  This is created the
+        first time it's used.
+        """
+        if not self.__shotgun_pool:
+            tk_mari = self.import_module("tk_mari")
+            self.__shotgun_pool = tk_mari.ShotgunConnectionPool(self.get_setting("shotgun_pool_size"))
+        return self.__shotgun_pool
+
+    @property
+    def publish_cache(self):
+        """
+        The local cache of Shotgun publish records or None if it isn't enabled
+        """
+        return self.__publish_cache
+
+    @property
+    def geometry_contents_index(self):
+        """
+        The local index of the objects contained in geometry publishes or None if it couldn't
+        be opened
+        """
+        return self.__geometry_contents_index
+
     def find_geometry_for_publish(self, sg_publish):
         """
         Find the geometry and version info for the specified publish if it exists in the current project
@@ -255,6 +456,17 @@ class MariEngine(sgtk.platform.Engine):
         """
         return self.__geometry_mgr.find_geometry_for_publish(sg_publish)
 
+    def find_stale_geometry(self):
+        """
+        Find all Shotgun aware geometry in the current project where a newer version has been
+        published than the version currently in use.
+
+        :returns:   A list of dictionaries, one for each out of date geo, containing the "geo", its
+                    current "geo_version", the "sg_publish" the current version was loaded from and
+                    the "latest_publish" available in Shotgun.
+        """
+        return self.__geometry_mgr.find_stale_geometry()
+
     def list_geometry(self):
         """
         Find all Shotgun aware geometry in the scene.  Any non-Shotgun aware geometry is ignored!
@@ -275,6 +487,45 @@ class MariEngine(sgtk.platform.Engine):
         """
         return self.__geometry_mgr.list_geometry_versions(geo)
 
+    def get_geometry_manifest(self, mari_project=None):
+        """
+        Get the manifest of all geometry in a project.  This is stored as a single value on the
+        project so is much quicker to read than walking the Shotgun info on every geo and version.
+        It's kept in memory once read and is updated there if it's missing or geo has been added or
+        removed outside of the engine - reading it never modifies the project.
+
+        :param mari_project:    The mari Project to get the manifest for.  Defaults to the current
+                                project.
+        :returns:               The manifest dictionary or None if there is no project.  The "geo"
+                                entry maps each geo name to the Shotgun "project", "entity" and "task"
+                                of the geo together with "versions", mapping each version name to its
+                                "path", "publish_id" and "version".  Geo and versions that aren't
+                                Shotgun aware map to None.
+        """
+        return self.__geometry_mgr.get_geometry_manifest(mari_project)
+
+    def list_geometry_objects(self, sg_publish):
+        """
+        List the objects contained in a geometry publish.  These are read from the published file
+        the first time they are requested and then indexed locally so this can be used to choose
+        the objects_to_load for load_geometry or create_project without loading the geometry.  The
+        file is read in the background, e.g.
+
+            engine.list_geometry_objects(sg_publish).add_done_callback(on_listed)
+
+        Note that done callbacks are run on the worker thread - use the main_thread_dispatcher to
+        update any UI from them.
+
+        :param sg_publish:  The Shotgun publish to list the objects for.  This should be a Shotgun entity
+                            dictionary containing at least the entity "type" and "id".
+        :returns:           A Future for a list of dictionaries, one for each object, containing the
+                            object "name" together with the number of "polygons" and the list of
+                            "uv_tiles" used by the object where these can be determined, otherwise
+                            None.  The result is None if the objects can't be read from the publish's
+                            file format.
+        """
+        return self.__geometry_mgr.list_geometry_objects(sg_publish)
+
     def load_geometry(self, sg_publish, options=None, objects_to_load=None):
         """
         Wraps the Mari GeoManager.load() method and additionally tags newly loaded geometry with Shotgun
@@ -286,7 +537,26 @@ class MariEngine(sgtk.platform.Engine):
         :param objects_to_load: [Mari arg] - A list of objects to load from the file
         :returns:               A list of the loaded GeoEntity instances that were created
         """
-        return self.__geometry_mgr.load_geometry(sg_publish, options, objects_to_load)
+        with self.collect_errors():
+            return self.__geometry_mgr.load_geometry(sg_publish, options, objects_to_load)
+
+    def load_geometry_progressive(self, sg_publish, options=None, objects_to_load=None):
+        """
+        Load geometry progressively - if a proxy has been published for the same entity (see the
+        proxy_geometry_publish_types setting) then this is loaded immediately and swapped for the
+        full resolution publish in the background, keeping any channels, layers and shaders that
+        were created on the proxy.  If there is no proxy then the publish is just loaded.
+
+        :param sg_publish:      The shotgun publish to load.  This should be a Shotgun entity dictionary
+                                containing at least the entity "type" and "id".
+        :param options:         [Mari arg] - Options to be passed to the file loader when loading the geometry
+        :param objects_to_load: [Mari arg] - A list of objects to load from the file.  This is only used
+                                when loading the full resolution publish.
+        :returns:               Tuple containing the list of GeoEntity instances that were loaded and a
+                                Future for the list of GeoEntity instances once the full resolution
+                                publish has been loaded
+        """
+        return self.__geometry_mgr.load_geometry_progressive(sg_publish, options, objects_to_load)
 
     def swap_geometry(self, geo, sg_publish, options=None):
         """
@@ -365,12 +635,217 @@ class MariEngine(sgtk.platform.Engine):
         :param objects_to_load:         [Mari arg] - A list of objects to load from the files
         :returns:                       The newly created Project instance
         """
-        return self.__project_mgr.create_project(name, sg_publishes, channels_to_create, channels_to_import,
-                                       project_meta_options, objects_to_load)
+        with self.collect_errors():
+            return self.__project_mgr.create_project(name, sg_publishes, channels_to_create, channels_to_import,
+                                                     project_meta_options, objects_to_load)
+
+    ##########################################################################################
+    # Worker Processes
+
+    @property
+    def worker_job(self):
+        """
+        The job dictionary when the engine is running in a headless worker process launched
+        by launch_worker(), otherwise None.
+        """
+        return self.__worker_job
+
+    def launch_worker(self, command, job, on_event=None, env=None, temp_paths=None):
+        """
+        Launch a headless worker process to run a job in the current context.
+
+        :param command:     The command line used to run the worker.  "{mari}", "{script}" and
+                            "{job}" are replaced with the path to the Mari executable, the worker
+                            script and the job file respectively.
+        :param job:         The job dictionary to run.  This must be JSON serializable and contain
+                            the "kind" of job to run.
+        :param on_event:    Callback run for each event reported by the worker.  This is passed the
+                            event dictionary and is called from a background thread.
+        :param env:         Additional environment variables to set for the worker
+        :param temp_paths:  Files and directories used by the job that are removed once the worker
+                            exits
+        :returns:           The WorkerProcess instance for the launched worker
+        """
+        job_path = os.path.join(self.cache_location, "worker_jobs", "%s.json" % uuid.uuid4().hex)
+        tk_mari = self.import_module("tk_mari")
+        return tk_mari.WorkerProcess(command, job, job_path, self.context, on_event,
+                                     env=env, temp_paths=temp_paths)
+
+    def emit_worker_event(self, event, **data):
+        """
+        Report an event to the process that launched this worker.  This does nothing if the engine
+        isn't running in a worker process.
+
+        :param event:   The name of the event
+        :param data:    Additional JSON serializable data to include with the event
+        """
+        if not self.__worker_job:
+            return
+        tk_mari = self.import_module("tk_mari")
+        tk_mari.emit_event(event, **data)
+
+    def run_worker_job(self):
+        """
+        Run the job this worker process was launched for.  This is called by the worker
+        script once Mari has started the engine.
+
+        :returns:   True if the job completed successfully, otherwise False
+        """
+        job = self.__worker_job
+        if not job:
+            self.log_error("No job found to run - the engine isn't running in a worker process!")
+            return False
+
+        tk_mari = self.import_module("tk_mari")
+        job_runners = {
+            "texture_publish": tk_mari.run_texture_publish_job,
+            "build_project": tk_mari.run_build_project_job,
+        }
+
+        runner = job_runners.get(job.get("kind"))
+        if not runner:
+            self.log_error("Unknown worker job kind '%s'" % job.get("kind"))
+            self.emit_worker_event("job_failed", message="Unknown job kind '%s'" % job.get("kind"))
+            return False
+
+        self.emit_worker_event("job_started", kind=job["kind"])
+        try:
+            with self.trace_mari_api("Worker job: %s" % job["kind"]):
+                runner(job)
+        except Exception, e:
+            self.log_exception("Worker job failed: %s" % e)
+            self.emit_worker_event("job_failed", message=str(e))
+            return False
+
+        self.emit_worker_event("job_finished")
+        return True
+
+    ##########################################################################################
+    # Instrumentation
+
+    def start_mari_api_trace(self, name):
+        """
+        Start counting the calls made into the Mari API under the specified name.  This does
+        nothing unless the 'trace_mari_api' setting is enabled.
+
+        :param name:    The name to record the calls under, e.g. the command being run
+        """
+        if self.__mari_api_tracer:
+            self.__mari_api_tracer.start_scope(name)
+
+    def pause_mari_api_trace(self, name):
+        """
+        Stop counting the calls made into the Mari API under the specified name until the
+        trace is resumed.  The calls counted so far are kept.
+
+        :param name:    The name the calls are recorded under
+        """
+        if self.__mari_api_tracer:
+            self.__mari_api_tracer.pause_scope(name)
+
+    def resume_mari_api_trace(self, name):
+        """
+        Resume counting the calls made into the Mari API under the specified name after it
+        was paused.
+
+        :param name:    The name the calls are recorded under
+        """
+        if self.__mari_api_tracer:
+            self.__mari_api_tracer.resume_scope(name)
+
+    def stop_mari_api_trace(self, name):
+        """
+        Stop counting the calls made into the Mari API under the specified name and log a
+        summary of the calls that were made.
+
+        :param name:    The name the calls were recorded under
+        :returns:       The dictionary of recorded calls returned by MariApiTracer.stop_scope()
+                        or None if nothing was recorded
+        """
+        if not self.__mari_api_tracer:
+            return None
+
+        trace = self.__mari_api_tracer.stop_scope(name)
+        if trace:
+            tk_mari = self.import_module("tk_mari")
+            call_count = sum([count for count, _ in trace["calls"].values()])
+            api_time = sum([seconds for _, seconds in trace["calls"].values()])
+            self.log_info("Mari API calls for '%s': %d calls taking %.3fs of %.3fs\n%s"
+                          % (name, call_count, api_time, trace["duration"],
+                             tk_mari.format_api_trace(trace)))
+        return trace
+
+    def execute_menu_command(self, name, callback):
+        """
+        Run a command from the Shotgun menu, recording how long it takes and profiling it
+        if 'Profile Next Command' has been enabled.
+
+        :param name:        The name of the command
+        :param callback:    The callback to run
+        """
+        start_time = time.time()
+        try:
+            with self.trace_mari_api(name):
+                self.__command_profiler.run(name, callback)
+        finally:
+            duration = time.time() - start_time
+            self.__command_timings.record(name, duration)
+            self.log_debug("Command '%s' took %.3fs" % (name, duration))
+
+    def toggle_command_profiling(self):
+        """
+        Toggle whether the next command run from the Shotgun menu is profiled.
+
+        :returns:   True if the next command will be profiled, otherwise False
+        """
+        self.__command_profiler.armed = not self.__command_profiler.armed
+        if self.__command_profiler.armed:
+            self.log_info("The next Shotgun command run will be profiled.")
+        else:
+            self.log_info("Command profiling cancelled.")
+        return self.__command_profiler.armed
+
+    def get_command_timings(self):
+        """
+        Get a summary of the time taken by each command run from the Shotgun menu.
+
+        :returns:   A dictionary of summaries keyed by command name.  See CommandTimings.summary()
+                    for the contents of each summary.
+        """
+        return dict([(name, self.__command_timings.summary(name))
+                     for name in self.__command_timings.commands()])
+
+    @contextlib.contextmanager
+    def trace_mari_api(self, name):
+        """
+        Context manager that counts the calls made into the Mari API inside the block
+        and logs a summary when the block exits.
+
+        :param name:    The name to record the calls under
+        """
+        self.start_mari_api_trace(name)
+        try:
+            yield
+        finally:
+            self.stop_mari_api_trace(name)
 
     ##########################################################################################
     # Logging
 
+    @contextlib.contextmanager
+    def collect_errors(self):
+        """
+        Context manager to use around batch operations.  Any errors logged inside the block
+        are held back and summarised once in the error panel when the block exits rather
+        than being shown as they happen.
+        """
+        if not self.__error_reporter:
+            yield
+            return
+
+        with self.__error_reporter.batch():
+            yield
+
     def _emit_log_message(self, handler, record):
         """
         Called by the engine to log messages in Maya script editor.
@@ -382,23 +857,68 @@ class MariEngine(sgtk.platform.Engine):
         :param record: Standard python logging record.
         :type record: :class:`~python.logging.LogRecord`
         """
-        # Give a standard format to the message:
-        #     Shotgun <basename>: <message>
-        # where "basename" is the leaf part of the logging record name,
-        # for example "tk-multi-shotgunpanel" or "qt_importer".
+        # Drop debug messages before doing any work on them if they aren't wanted:
+        if record.levelno < logging.INFO and self.__debug_logging == False:
+            return
+
+        if self.__file_log_handler:
+            self.__file_log_handler.handle(record)
+
         if record.levelno < logging.INFO:
-            formatter = logging.Formatter("Debug: Shotgun %(basename)s: %(message)s")
+            msg = DEBUG_LOG_FORMATTER.format(record)
         else:
-            formatter = logging.Formatter("Shotgun %(basename)s: %(message)s")
-
-        msg = formatter.format(record)
+            msg = LOG_FORMATTER.format(record)
 
         # Select Mari output to use according to the logging record level.
         if record.levelno >= logging.ERROR:
-            mari.utils.message(msg)
+            if self.__error_reporter:
+                self.__error_reporter.report(msg)
+            else:
+                mari.utils.message(msg)
 
         # Send the message to the script editor.
-        print msg
+        if self.__console_log_sink:
+            self.__console_log_sink.write(msg)
+        else:
+            print msg
+
+    def __create_log_sinks(self):
+        """
+        Create the console and (optional) file sinks that log messages are written to.
+        """
+        tk_mari = self.import_module("tk_mari")
+
+        log_file = self.get_setting("log_file")
+        if log_file:
+            try:
+                self.__file_log_handler = tk_mari.create_file_log_handler(
+                    log_file,
+                    self.get_setting("log_file_max_bytes"),
+                    self.get_setting("log_file_backup_count")
+                )
+            except Exception, e:
+                self.log_warning("Failed to open log file '%s': %s" % (log_file, e))
+
+        # console output is only batched when there is an event loop to flush it:
+        if self.has_ui:
+            self.__console_log_sink = tk_mari.ConsoleLogSink(
+                self.get_setting("log_flush_interval"),
+                self.get_setting("log_buffer_size")
+            )
+
+    def __destroy_log_sinks(self):
+        """
+        Flush and close the log sinks created by the engine.
+        """
+        if self.__console_log_sink:
+            console_log_sink = self.__console_log_sink
+            self.__console_log_sink = None
+            console_log_sink.close()
+
+        if self.__file_log_handler:
+            file_log_handler = self.__file_log_handler
+            self.__file_log_handler = None
+            file_log_handler.close()
 
     def __on_project_opened(self, opened_project, is_new):
         """
@@ -430,6 +950,14 @@ class MariEngine(sgtk.platform.Engine):
         if not self.__metadata_mgr.get_project_version(opened_project):
             self.__metadata_mgr.set_project_version(opened_project, 1)
 
+        # index the geometry in the project up front - this only walks the geometry if the
+        # project doesn't have a manifest (e.g. it was created by an older engine) and doesn't
+        # modify the project:
+        manifest = self.__geometry_mgr.get_geometry_manifest(opened_project)
+        if manifest:
+            self.log_debug("Opened project contains %d Shotgun aware geo"
+                           % len([e for e in manifest["geo"].values() if e]))
+
         # try to determine the project context from the metadata:
         ctx_entity = None
         if md.get("task_id"):
@@ -461,16 +989,49 @@ class MariEngine(sgtk.platform.Engine):
         # change current engine context:
         sgtk.platform.change_context(ctx)
 
+    def __on_project_about_to_close(self, closing_project=None):
+        """
+        Called when a project is about to be closed in Mari.  Any proxy geometry that is still
+        waiting to be swapped for the full resolution publish is left as it is and the geometry
+        manifest held in memory for the project is released.
+
+        :param closing_project: The mari Project instance that is being closed
+        """
+        self.__geometry_mgr.cancel_proxy_swaps()
+        closing_project = closing_project or mari.projects.current()
+        if closing_project:
+            self.__geometry_mgr.release_geometry_manifest(closing_project)
+
     def __on_project_saved(self, saved_project):
+        """
+        Called when a project is saved in Mari.  If the project is Shotgun aware then an export
+        of the session file to the work area is scheduled.
+
+        :param saved_project:   The mari Project instance that was saved
+        """
+        if not self.__session_exporter:
+            return
+
         if not self.__metadata_mgr.get_metadata(saved_project):
             # this is not an sgtk compliant project
             return
 
+        self.__session_exporter.schedule(saved_project)
+
+    def __get_session_export_info(self, saved_project):
+        """
+        Determine the work template and fields to use when exporting the session file
+        for a project.
+
+        :param saved_project:   The mari Project instance to export the session for
+        :returns:               A tuple containing the work template and the fields to apply
+                                to it or None if the session shouldn't be exported
+        """
         workfiles_app = self.apps.get("tk-multi-workfiles2")
         proj_mgr_app = self.apps.get("tk-mari-projectmanager")
         if not workfiles_app or not proj_mgr_app:
             self.log_error("Unable to find workfiles or projectmanager app. Not exporting msf file.")
-            return
+            return None
 
         fields = self.context.as_template_fields()
 
@@ -478,22 +1039,22 @@ class MariEngine(sgtk.platform.Engine):
         project_name_template = proj_mgr_app.get_template("template_new_project_name")
         if not project_name_template.validate(saved_project.name()):
             # this is not an sgtk compliant project
-            return
+            return None
         fields.update(project_name_template.get_fields(saved_project.name()))
 
         # use project metadata to get the "version" field
         fields["version"] = self.__metadata_mgr.get_project_version(saved_project)
 
-        work_template = workfiles_app.get_template("template_work")
-        work_file_path = work_template.apply_fields(fields)
-
-        self.log_debug("Exporting mari session file to: %s" % work_file_path)
-        mari.session.exportSession(work_file_path)
+        return (workfiles_app.get_template("template_work"), fields)
 
-    def _run_app_instance_commands(self):
+    def _run_app_instance_commands(self, first_launch=True):
         """
         Runs the series of app instance commands listed in the 'run_at_startup' setting
         of the environment configuration yaml file.
+
+        :param first_launch:    False if the commands are being run following a change of
+                                context, in which case any commands flagged as
+                                'first_launch_only' are skipped.
         """
 
         # Build a dictionary mapping app instance names to dictionaries of commands they registered with the engine.
@@ -513,6 +1074,11 @@ class MariEngine(sgtk.platform.Engine):
             # Menu name of the command to run or '' to run all commands of the given app instance.
             setting_command_name = app_setting_dict["name"]
 
+            if not first_launch and app_setting_dict.get("first_launch_only"):
+                self.logger.debug("%s skipping first launch only app '%s' command '%s' on context change.",
+                                  self.name, app_instance_name, setting_command_name)
+                continue
+
             # Retrieve the command dictionary of the given app instance.
             command_dict = app_instance_commands.get(app_instance_name)
 
@@ -528,7 +1094,7 @@ class MariEngine(sgtk.platform.Engine):
                     for (command_name, command_function) in command_dict.iteritems():
                         self.logger.debug("%s startup running app '%s' command '%s'.",
                                        self.name, app_instance_name, command_name)
-                        commands_to_run.append(command_function)
+                        commands_to_run.append((command_name, command_function))
                 else:
                     # Run the command whose name is listed in the 'run_at_startup' setting.
                     # Run this command once Maya will have completed its UI update and be idle
@@ -537,7 +1103,7 @@ class MariEngine(sgtk.platform.Engine):
                     if command_function:
                         self.logger.debug("%s startup running app '%s' command '%s'.",
                                        self.name, app_instance_name, setting_command_name)
-                        commands_to_run.append(command_function)
+                        commands_to_run.append((setting_command_name, command_function))
                     else:
                         known_commands = ', '.join("'%s'" % name for name in command_dict)
                         self.logger.warning(
@@ -547,7 +1113,11 @@ class MariEngine(sgtk.platform.Engine):
 
         # Run the commands once Mari will have completed its UI update and be idle
         # in order to run it after the ones that restore the persisted Shotgun app panels.
-        # Set the _callback_from_non_pane_menu hint so that the show_panel method knows this
-        # was invoked not from the pane menu.
-        for command in commands_to_run:
-            command()
+        # Each command is run from the Qt event loop one at a time so that Mari can keep
+        # updating between commands.
+        if self.__startup_command_queue:
+            # cancel any commands still waiting from a previous context:
+            self.__startup_command_queue.cancel()
+        tk_mari = self.import_module("tk_mari")
+        self.__startup_command_queue = tk_mari.StartupCommandQueue()
+        self.__startup_command_queue.run(commands_to_run, run_now=not self.has_ui)
@@ -83,8 +83,39 @@ class MariSessionCollector(HookBaseClass):
             "texture.png"
         )
 
-        layers_item = None
         thumbnail = self._extract_mari_thumbnail()
+
+        # index of the live Mari objects for every collected item, keyed by
+        # (geo name, channel name, layer path).  This is stored on the root item
+        # so that the publish plugins can resolve items without searching Mari:
+        session_index = {}
+        parent_item.properties["mari_session_index"] = session_index
+
+        # Collect the items in time slices so that Mari keeps redrawing for projects
+        # with many geo, channels and layers.  User input isn't processed until the
+        # collection has completed:
+        publisher.engine.scheduler.run_sync(
+            self._collect_texture_items(parent_item, session_index, thumbnail,
+                                        icon_path, layers_icon_path, layer_icon_path),
+            "Collect Mari session"
+        )
+
+    def _collect_texture_items(self, parent_item, session_index, thumbnail,
+                               icon_path, layers_icon_path, layer_icon_path):
+        """
+        Generator that creates items for the flattened channels and the individual
+        layers of all geometry in the project, yielding after each item is created.
+
+        :param parent_item:         Root item instance
+        :param session_index:       Index of the live Mari objects for each item
+                                    that is populated as items are created
+        :param thumbnail:           Path of the thumbnail to use for the items
+        :param icon_path:           Path of the icon for channel items
+        :param layers_icon_path:    Path of the icon for the layers item
+        :param layer_icon_path:     Path of the icon for layer items
+        """
+        layers_item = None
+
         # Look for all layers for all channels on all geometry.  Create items for both
         # the flattened channel as well as the individual layers
         for geo in mari.geo.list():
@@ -94,7 +125,7 @@ class MariSessionCollector(HookBaseClass):
                 channel_name = channel.name()
 
                 # find all collected layers:
-                collected_layers = self._find_layers_r(channel.layerList())
+                collected_layers = self._find_layer_paths_r(channel.layerList())
                 if not collected_layers:
                     # no layers to publish!
                     self.logger.warning("Channel '%s' has no layers. The channel will not be collected" % channel_name)
@@ -111,7 +142,10 @@ class MariSessionCollector(HookBaseClass):
                 channel_item.set_icon_from_path(icon_path)
                 channel_item.properties["mari_geo_name"] = geo_name
                 channel_item.properties["mari_channel_name"] = channel_name
+                channel_item.properties["mari_index_key"] = (geo_name, channel_name, None)
                 channel_item.set_thumbnail_from_path(thumbnail)
+                session_index[(geo_name, channel_name, None)] = (geo, channel, None)
+                yield
 
                 if len(collected_layers) > 0 and layers_item is None:
                     layers_item = channel_item.create_item("mari.layers",
@@ -121,14 +155,15 @@ class MariSessionCollector(HookBaseClass):
 
                 # add item for each collected layer:
                 found_layer_names = set()
-                for layer in collected_layers:
-                    
-                    # for now, duplicate layer names aren't allowed!
+                for layer_path, layer in collected_layers:
+
+                    # for now, duplicate layer names aren't allowed as the layer name
+                    # is used in the publish path!
                     layer_name = layer.name()
                     if layer_name in found_layer_names:
                         # we might want to handle this one day...
-                        self.logger.warning("Duplicate layer name found: %s. Layer will not be exported" % layer_name)
-                        pass
+                        self.logger.warning("Duplicate layer name found: %s. Layer will not be exported" % layer_path)
+                        continue
                     found_layer_names.add(layer_name)
 
                     item_name = "%s, %s (%s)" % (geo.name(), channel.name(), layer_name)
@@ -142,7 +177,11 @@ class MariSessionCollector(HookBaseClass):
                     layer_item.properties["mari_geo_name"] = geo_name
                     layer_item.properties["mari_channel_name"] = channel_name
                     layer_item.properties["mari_layer_name"] = layer_name
+                    layer_item.properties["mari_layer_path"] = layer_path
+                    layer_item.properties["mari_index_key"] = (geo_name, channel_name, layer_path)
                     layer_item.set_thumbnail_from_path(thumbnail)
+                    session_index[(geo_name, channel_name, layer_path)] = (geo, channel, layer)
+                    yield
 
     def _find_layers_r(self, layers):
         """
@@ -152,18 +191,34 @@ class MariSessionCollector(HookBaseClass):
         :param layers:  The list of layers to inspect
         :returns:       A list of all collected layers
         """
+        return [layer for _, layer in self._find_layer_paths_r(layers)]
+
+    def _find_layer_paths_r(self, layers, parent_path=None):
+        """
+        Find all layers within the specified list of layers together with their
+        paths.  A layer's path is the names of any groups it's in followed by its
+        own name, separated by '/', e.g. 'Dirt/Scratches'.
+        :param layers:      The list of layers to inspect
+        :param parent_path: The path of the group containing the layers
+        :returns:           A list of (layer path, layer) tuples for all collected layers
+        """
         collected_layers = []
         for layer in layers:
+            if parent_path:
+                layer_path = "%s/%s" % (parent_path, layer.name())
+            else:
+                layer_path = layer.name()
+
             # Note, only paintable or procedural layers are exportable from Mari - all
             # other layer types are only used within Mari.
             if layer.isPaintableLayer() or layer.isProceduralLayer():
                 # these are the only types of layers that can be collected
-                collected_layers.append(layer)
+                collected_layers.append((layer_path, layer))
             elif layer.isGroupLayer():
                 # recurse over all layers in the group looking for exportable layers:
-                grouped_layers = self._find_layers_r(layer.layerStack().layerList())
+                grouped_layers = self._find_layer_paths_r(layer.layerStack().layerList(), layer_path)
                 collected_layers.extend(grouped_layers or [])
-    
+
         return collected_layers
 
     def _extract_mari_thumbnail(self):
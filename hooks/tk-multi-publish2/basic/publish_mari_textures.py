@@ -8,14 +8,57 @@
 # agreement to the Shotgun Pipeline Toolkit Source Code License. All rights 
 # not expressly granted therein are reserved by Shotgun Software Inc.
 
+import collections
+import contextlib
+import ctypes
+import fnmatch
+import functools
+import glob
+import hashlib
+import json
 import mari
+import multiprocessing
+import multiprocessing.pool
 import os
 import pprint
 import re
+import struct
+import subprocess
+import time
+import uuid
 import sgtk
 
 HookBaseClass = sgtk.get_hook_baseclass()
 
+# the name the Mari API calls made during a publish are recorded under:
+MARI_API_TRACE_NAME = "Publish Mari Textures"
+
+
+def _traced_phase(method):
+    """
+    Decorator for the validate, publish and finalize methods that counts the
+    calls made into the Mari API by the method in the trace for the whole
+    publish.  The trace is restarted by the validation of the first item and
+    is paused whenever the method returns or raises, so a publish that is
+    aborted part way through doesn't leave the trace recording.  Errors logged
+    by the method, e.g. for each tile that fails to convert, are summarised
+    once when it returns.
+    """
+    @functools.wraps(method)
+    def wrapper(self, settings, item):
+        engine = self.parent.engine
+        texture_items = self._get_texture_items(item)
+        if method.__name__ == "validate" and (not texture_items or texture_items[0] is item):
+            engine.start_mari_api_trace(MARI_API_TRACE_NAME)
+        else:
+            engine.resume_mari_api_trace(MARI_API_TRACE_NAME)
+        try:
+            with engine.collect_errors():
+                return method(self, settings, item)
+        finally:
+            engine.pause_mari_api_trace(MARI_API_TRACE_NAME)
+    return wrapper
+
 
 class MariTexturesPublishPlugin(HookBaseClass):
     """
@@ -126,6 +169,203 @@ class MariTexturesPublishPlugin(HookBaseClass):
                 "description": "Template path for published work files. Should"
                                "correspond to a template defined in "
                                "templates.yml.",
+            },
+            "Batch Conflict Clearing": {
+                "type": "bool",
+                "default": False,
+                "description": "If True, the status of publishes that conflict with "
+                               "the new publishes is cleared for all items at once "
+                               "during finalize, using batched Shotgun requests, "
+                               "rather than item by item.  Each publish is still "
+                               "registered individually through register_publish so "
+                               "that the path cache and dependencies are kept up "
+                               "to date.",
+            },
+            "Batch Size": {
+                "type": "int",
+                "default": 50,
+                "description": "The maximum number of Shotgun requests to submit in a "
+                               "single batch call when Batch Conflict Clearing is "
+                               "enabled.",
+            },
+            "Batch Retries": {
+                "type": "int",
+                "default": 2,
+                "description": "The number of times a failed batch is retried before "
+                               "its requests are submitted individually.",
+            },
+            "Export Format": {
+                "type": "str",
+                "default": "",
+                "description": "The file format (extension) to export textures as, "
+                               "e.g. 'exr', 'tif' or 'png'. If empty, the extension "
+                               "of the publish template is used.  The format is "
+                               "written through the template's {extension} key if "
+                               "it has one, otherwise it must match the extension "
+                               "of the template.",
+            },
+            "Export Bit Depth": {
+                "type": "str",
+                "default": "",
+                "description": "The bit depth to write the exported textures with. "
+                               "One of '8', '16', 'half' or 'float'. If empty, the "
+                               "depth Mari exports is kept.",
+            },
+            "Export Compression": {
+                "type": "str",
+                "default": "",
+                "description": "The compression to write the exported textures with, "
+                               "e.g. 'dwaa', 'zip' or 'piz' for EXR files. If empty, "
+                               "the compression Mari exports with is kept.",
+            },
+            "Channel Export Overrides": {
+                "type": "dict",
+                "default": {},
+                "description": "Per-channel overrides of the export settings. Keys "
+                               "are channel names (glob patterns are supported) and "
+                               "values are dictionaries with any of the keys "
+                               "'format', 'bit_depth' and 'compression', e.g. "
+                               "{'*Mask*': {'format': 'png', 'bit_depth': '8'}}",
+            },
+            "Recompress Command": {
+                "type": "str",
+                "default": 'oiiotool "{input}" {bit_depth_args} {compression_args} -o "{output}"',
+                "description": "The command used to convert exported tiles to the "
+                               "export bit depth and compression. {input}, {output}, "
+                               "{bit_depth_args} and {compression_args} are replaced "
+                               "for each tile.",
+            },
+            "Post Export Processes": {
+                "type": "int",
+                "default": 0,
+                "description": "The maximum number of processes used to post-process "
+                               "exported tiles in parallel. If 0, the number of CPUs "
+                               "is used.",
+            },
+            "Convert To Tiled": {
+                "type": "bool",
+                "default": False,
+                "description": "If True, the exported tiles are also converted to "
+                               "tiled, mip-mapped textures for rendering.",
+            },
+            "Tiled Converter Command": {
+                "type": "str",
+                "default": 'maketx "{input}" -o "{output}"',
+                "description": "The command used to convert each exported tile to a "
+                               "tiled, mip-mapped texture. {input} and {output} are "
+                               "replaced for each tile.",
+            },
+            "Tiled Extension": {
+                "type": "str",
+                "default": "tx",
+                "description": "The file extension of the converted tiled textures, "
+                               "e.g. 'tx' or 'tex'.",
+            },
+            "Tiled Publish Type": {
+                "type": "shotgun_publish_type",
+                "default": "Tiled Texture",
+                "description": "SG publish type to register the converted tiled "
+                               "textures with. If empty, the converted textures are "
+                               "not registered as a separate publish.",
+            },
+            "Proxy Resolutions": {
+                "type": "list",
+                "values": {"type": "int"},
+                "default": [],
+                "description": "Resolutions of the downscaled proxy tile sets to "
+                               "create next to the full resolution set, e.g. "
+                               "[1024, 2048]. Proxies are only created for "
+                               "resolutions below the channel resolution.",
+            },
+            "Proxy Publish Template": {
+                "type": "template",
+                "default": None,
+                "description": "Template path for the proxy tile sets. This should "
+                               "contain a 'resolution' key which is set to the proxy "
+                               "resolution, e.g. '2k'. If not set, the Publish "
+                               "Template is used.",
+            },
+            "Proxy Publish Type": {
+                "type": "shotgun_publish_type",
+                "default": "UDIM Image Proxy",
+                "description": "SG publish type to register proxy tile sets with.",
+            },
+            "Proxy Resize Command": {
+                "type": "str",
+                "default": 'oiiotool "{input}" --fit {size}x{size} -o "{output}"',
+                "description": "The command used to downscale each exported tile. "
+                               "{input}, {output} and {size} are replaced for each "
+                               "tile.",
+            },
+            "Write Manifest": {
+                "type": "bool",
+                "default": False,
+                "description": "If True, a JSON manifest listing every tile of the "
+                               "publish, including any tiled and proxy tiles, with "
+                               "their sizes, checksums and resolutions is written "
+                               "next to the published textures.",
+            },
+            "Manifest Publish Type": {
+                "type": "shotgun_publish_type",
+                "default": "Texture Manifest",
+                "description": "The publish type the manifest is registered with. "
+                               "The texture publish lists the manifest publish as "
+                               "an upstream dependency so that it can be found from "
+                               "the publish record.",
+            },
+            "Manifest Field": {
+                "type": "str",
+                "default": "",
+                "description": "Optional Shotgun field on the publish entity to store "
+                               "the path of the manifest in, e.g. 'sg_manifest'.  If "
+                               "set, this is used instead of registering the "
+                               "manifest as a publish.",
+            },
+            "Check Disk Space": {
+                "type": "bool",
+                "default": True,
+                "description": "If True, validation estimates the size of every "
+                               "texture being published and fails if there isn't "
+                               "enough free space on the destination volumes.",
+            },
+            "Estimated Compression Ratio": {
+                "type": "float",
+                "default": 1.0,
+                "description": "The expected ratio of uncompressed to compressed "
+                               "texture size used when estimating the size of the "
+                               "publish, e.g. 2.0 if files are expected to be half "
+                               "their uncompressed size.",
+            },
+            "Timing Report Path": {
+                "type": "str",
+                "default": "",
+                "description": "Optional path of a JSON report to write the time "
+                               "taken by each stage of every item's publish to, "
+                               "together with the bytes written and throughput.  "
+                               "Environment variables are expanded and strftime "
+                               "codes (e.g. %Y%m%d_%H%M%S) are replaced.",
+            },
+            "Background Publish": {
+                "type": "bool",
+                "default": False,
+                "description": "If True, the project is saved and the export and "
+                               "registration of the textures is handed to a headless "
+                               "Mari worker process so that the interactive session "
+                               "can carry on being used.  Progress is reported to the "
+                               "Shotgun log.  The worker publishes from an archived "
+                               "copy of the saved project as Mari won't open the "
+                               "project while it's open in this session.  If the "
+                               "project can't be archived, the items are published "
+                               "in this session instead.",
+            },
+            "Background Worker Command": {
+                "type": "str",
+                "default": '"{mari}" -t "{script}"',
+                "description": "The command used to launch the background publish "
+                               "worker.  {mari}, {script} and {job} are replaced with "
+                               "the Mari executable, the engine's worker script and "
+                               "the path of the job file.  Any process that follows "
+                               "the engine's worker job protocol can be used.",
             }
         }
 
@@ -177,6 +417,7 @@ class MariTexturesPublishPlugin(HookBaseClass):
             "checked": True
         }
 
+    @_traced_phase
     def validate(self, settings, item):
         """
         Validates the given item to check that it is ok to publish. Returns a
@@ -191,6 +432,12 @@ class MariTexturesPublishPlugin(HookBaseClass):
 
         publisher = self.parent
 
+        # remove any project archive left by an earlier publish pass that
+        # didn't reach finalize:
+        stale_archive = item.properties.pop("background_archive", None)
+        if stale_archive and os.path.exists(stale_archive):
+            os.remove(stale_archive)
+
         # populate the publish template on the item if found
         publish_template_setting = settings.get("Publish Template")
         publish_template = publisher.engine.get_template_by_name(publish_template_setting.value)
@@ -201,29 +448,51 @@ class MariTexturesPublishPlugin(HookBaseClass):
             self.logger.error(error_msg)
             raise Exception(error_msg)
 
+        geo, channel, layer = self._resolve_item(item)
+
         geo_name = item.properties["mari_geo_name"]
-        geo = mari.geo.find(geo_name)
         if not geo:
-            error_msg = "Failed to find geometry in the project! Validation failed." % geo_name
+            error_msg = "Failed to find geometry '%s' in the project! Validation failed." % geo_name
             self.logger.error(error_msg)
             raise Exception(error_msg)
-        
+
         channel_name = item.properties["mari_channel_name"]
-        channel = geo.findChannel(channel_name)
         if not channel:
-            error_msg = "Failed to find channel on geometry! Validation failed." % channel_name
+            error_msg = "Failed to find channel '%s' on geometry! Validation failed." % channel_name
             self.logger.error(error_msg)
             raise Exception(error_msg)
-        
+
         layer_name = item.properties.get("mari_layer_name")
-        if layer_name:
-            layer = channel.findLayer(layer_name)
-            if not layer:
-                error_msg = "Failed to find layer for channel: %s Validation failed." % layer_name
-                self.logger.error(error_msg)
-                raise Exception(error_msg)
+        if layer_name and not layer:
+            error_msg = "Failed to find layer for channel: %s Validation failed." % (
+                item.properties.get("mari_layer_path") or layer_name)
+            self.logger.error(error_msg)
+            raise Exception(error_msg)
+
+        # make sure the export format can be written to the publish paths:
+        export_options = self._get_export_options(settings, channel_name)
+        templates = [publish_template]
+        if settings["Proxy Resolutions"].value and settings["Proxy Publish Template"].value:
+            proxy_template = publisher.engine.get_template_by_name(
+                settings["Proxy Publish Template"].value)
+            if proxy_template:
+                templates.append(proxy_template)
+        for template in templates:
+            format_error = self._get_export_format_error(template, export_options)
+            if format_error:
+                self.logger.error(format_error)
+                raise Exception(format_error)
+
+        # make sure there is enough space to write the textures:
+        if settings["Check Disk Space"].value:
+            disk_space_error = self._check_disk_space(settings, item)
+            if disk_space_error:
+                self.logger.error(disk_space_error)
+                raise Exception(disk_space_error)
+
         return True
 
+    @_traced_phase
     def publish(self, settings, item):
         """
         Executes the publish logic for the given item and settings.
@@ -234,46 +503,59 @@ class MariTexturesPublishPlugin(HookBaseClass):
         :param item: Item to process
         """
 
+        # time every stage of the publish:
+        item.properties["publish_timings"] = collections.OrderedDict()
+        item.properties["publish_start_time"] = time.time()
+
         # Currently there is no primary publish for Mari so just save the
         # current project to ensure nothing is lost if something goes wrong!
         proj = mari.projects.current()
         if proj:
             self.logger.info("Saving the current project...")
-            proj.save()
+            with self._timed_stage(item, "save"):
+                proj.save()
 
         publisher = self.parent
 
-        geo_name = item.properties["mari_geo_name"]
-        geo = mari.geo.find(geo_name)        
+        if self._publish_in_background(settings):
+            # the export and registration will be run by a worker process
+            # launched during finalize, from a copy of the saved project:
+            if self._get_background_archive(item):
+                self._queue_background_publish(item)
+                self.logger.info("Publish queued to run in the background!")
+                return
+            self.logger.warning("Publishing '%s' in this session instead." % item.name)
+
+        # look up the existing publishes for all items in the background while
+        # the textures are exported:
+        texture_items = self._get_texture_items(item)
+        if texture_items and texture_items[0] is item:
+            self._prefetch_publishes(settings, texture_items)
+
+        # let the process that launched this worker know what's happening:
+        publisher.engine.emit_worker_event(
+            "item_started", key=list(item.properties.get("mari_index_key") or []),
+            name=item.name)
+
+        with self._timed_stage(item, "resolve"):
+            geo, channel, layer = self._resolve_item(item)
         channel_name = item.properties["mari_channel_name"]
-        channel = geo.findChannel(channel_name)
         layer_name = item.properties.get("mari_layer_name")
 
         publish_template = item.properties["publish_template"]
 
-        # Get fields from the current context
-        fields = {}
-        ctx_fields = self.parent.context.as_template_fields(publish_template)
-        fields.update(ctx_fields)
-
-        # For geo name, strip out the non-alphanumeric characters because Mari's
-        # publish template filter does not allow non-alphanumeric characters in
-        # the geo name.
-        geo_name = re.sub(r"[\W_]+", "", geo_name)
-        fields["name"] = geo_name
-
-        fields["channel"] = channel_name
-        fields["layer"] = layer_name
-        fields["UDIM"] = "$UDIM"
+        # Get fields from the current context and item:
+        fields = self._get_publish_fields(item)
+        export_options = self._get_export_options(settings, channel_name)
+        self._apply_export_format(publish_template, fields, export_options)
 
         # get the publish name. This will ensure we get a
         # consistent name across version publishes of this file.
-        if layer_name:
-            publish_name = "%s, %s - %s" % (geo_name, channel_name, layer_name)
-        else:
-            publish_name = "%s, %s" % (geo_name, channel_name)
+        publish_name = self._get_publish_name(item, fields)
 
-        existing_publishes = self._find_publishes(self.parent.context, publish_name, settings["Publish Type"].value)
+        with self._timed_stage(item, "version_lookup"):
+            existing_publishes = self._find_publishes(self.parent.context, publish_name, settings["Publish Type"].value,
+                                                      item.properties.pop("publish_lookup", None))
         version = max([p["version_number"] for p in existing_publishes] or [0]) + 1
 
         fields["version"] = version
@@ -288,8 +570,8 @@ class MariTexturesPublishPlugin(HookBaseClass):
         self.logger.info("  %s" % (path,))
 
         if layer_name:
-            layer = channel.findLayer(layer_name)
-            layer.exportImages(path)
+            with self._timed_stage(item, "export"):
+                layer.exportImages(path)
         else:
             # publish the entire channel, flattened
             layers = channel.layerList()
@@ -299,26 +581,69 @@ class MariTexturesPublishPlugin(HookBaseClass):
                 # with only a single layer would cause Mari to crash - this bug was not reproducible by
                 # us but happened 100% for the client!
                 layer = layers[0]
-                layer.exportImages(path)
+                with self._timed_stage(item, "export"):
+                    layer.exportImages(path)
             elif len(layers) > 1:
                 # flatten layers in the channel and publish the flattened layer:
                 # remember the current channel:
                 current_channel = geo.currentChannel()
                 # duplicate the channel so we don't operate on the original:
-                duplicate_channel = geo.createDuplicateChannel(channel)
+                with self._timed_stage(item, "flatten"):
+                    duplicate_channel = geo.createDuplicateChannel(channel)
                 try:
                     # flatten it into a single layer:
-                    flattened_layer = duplicate_channel.flatten()
+                    with self._timed_stage(item, "flatten"):
+                        flattened_layer = duplicate_channel.flatten()
                     # export the images for it:
-                    flattened_layer.exportImages(path)
+                    with self._timed_stage(item, "export"):
+                        flattened_layer.exportImages(path)
                 finally:
-                    # set the current channel back - not doing this will result in Mari crashing
-                    # when the duplicated channel is removed!
-                    geo.setCurrentChannel(current_channel)
-                    # remove the duplicate channel, destroying the channel and the flattened layer:
-                    geo.removeChannel(duplicate_channel, geo.DESTROY_ALL)
+                    with self._timed_stage(item, "flatten"):
+                        # set the current channel back - not doing this will result in Mari crashing
+                        # when the duplicated channel is removed!
+                        geo.setCurrentChannel(current_channel)
+                        # remove the duplicate channel, destroying the channel and the flattened layer:
+                        geo.removeChannel(duplicate_channel, geo.DESTROY_ALL)
             else:
-                self.logger.error("Channel '%s' doesn't appear to have any layers!" % channel.name())            
+                self.logger.error("Channel '%s' doesn't appear to have any layers!" % channel.name())
+
+        # convert the exported tiles to the configured bit depth and compression
+        # where Mari can't write them directly:
+        if export_options["bit_depth"] or export_options["compression"]:
+            with self._timed_stage(item, "recompress"):
+                self._recompress_tiles(settings, path, export_options)
+
+        # convert the exported tiles to tiled/mip-mapped textures while they are
+        # still in the page cache:
+        tiled_path = None
+        if settings["Convert To Tiled"].value:
+            with self._timed_stage(item, "convert_to_tiled"):
+                tiled_path = self._convert_to_tiled(settings, path)
+            item.properties["tiled_path"] = tiled_path
+
+        # create the downscaled proxy tile sets:
+        proxy_paths = {}
+        if settings["Proxy Resolutions"].value:
+            with self._timed_stage(item, "proxies"):
+                proxy_paths = self._create_proxies(
+                    settings, item, path, fields, export_options, channel)
+            item.properties["proxy_paths"] = proxy_paths
+
+        # write the tile manifest so that consumers don't need to walk the
+        # published directories:
+        manifest_path = None
+        if settings["Write Manifest"].value:
+            with self._timed_stage(item, "manifest"):
+                manifest_path = self._write_manifest(
+                    settings, path, tiled_path, proxy_paths, geo, channel, layer_name)
+            item.properties["manifest_path"] = manifest_path
+
+        # record how much data was written for the throughput report:
+        item.properties["publish_bytes_written"] = self._get_bytes_written(
+            path, tiled_path, proxy_paths)
+
+        with self._timed_stage(item, "thumbnail"):
+            thumbnail_path = item.get_thumbnail_as_path()
 
         # arguments for publish registration
         self.logger.info("Registering publish...")
@@ -329,10 +654,25 @@ class MariTexturesPublishPlugin(HookBaseClass):
             "path": path,
             "name": publish_name,
             "version_number": version,
-            "thumbnail_path": item.get_thumbnail_as_path(),
+            "thumbnail_path": thumbnail_path,
             "published_file_type": settings["Publish Type"].value,
             "dependency_paths": [],
         }
+        # reference the manifest from the publish record, either through the
+        # configured field or as an upstream dependency:
+        if manifest_path and settings["Manifest Field"].value:
+            publish_data["sg_fields"] = {
+                settings["Manifest Field"].value: manifest_path
+            }
+        elif manifest_path:
+            manifest_publish_data = dict(publish_data)
+            manifest_publish_data.update({
+                "path": manifest_path,
+                "name": "%s (manifest)" % publish_name,
+                "published_file_type": settings["Manifest Publish Type"].value,
+            })
+            self._register_secondary_publish(settings, item, manifest_publish_data)
+            publish_data["dependency_paths"] = [manifest_path]
 
         # log the publish data for debugging
         self.logger.debug(
@@ -348,18 +688,42 @@ class MariTexturesPublishPlugin(HookBaseClass):
 
         # create the publish and stash it in the item properties for other
         # plugins to use.
-        item.properties["sg_publish_data"] = sgtk.util.register_publish(
-            **publish_data)
+        with self._timed_stage(item, "register"):
+            item.properties["sg_publish_data"] = sgtk.util.register_publish(
+                **publish_data)
+        item.properties["conflicts_cleared"] = False
+        self.logger.info("Publish registered!")
+
+        # register the tiled textures as a secondary publish:
+        if tiled_path and settings["Tiled Publish Type"].value:
+            tiled_publish_data = dict(publish_data)
+            tiled_publish_data.update({
+                "path": tiled_path,
+                "published_file_type": settings["Tiled Publish Type"].value,
+                "dependency_paths": [path],
+            })
+            self._register_secondary_publish(settings, item, tiled_publish_data)
+
+        # register each of the proxy tile sets:
+        for resolution, proxy_path in sorted(proxy_paths.items()):
+            proxy_publish_data = dict(publish_data)
+            proxy_publish_data.update({
+                "path": proxy_path,
+                "name": "%s (%s)" % (publish_name, resolution),
+                "published_file_type": settings["Proxy Publish Type"].value,
+                "dependency_paths": [path],
+            })
+            self._register_secondary_publish(settings, item, proxy_publish_data)
 
         # inject the publish path such that children can refer to it when
         # updating dependency information
         item.properties["sg_publish_path"] = path
 
-        self.logger.info("Publish registered!")
-
         # now that we've published. keep a handle on the path that was published
         item.properties["path"] = path
+        item.properties["publish_duration"] = time.time() - item.properties["publish_start_time"]
 
+    @_traced_phase
     def finalize(self, settings, item):
         """
         Execute the finalization pass. This pass executes once all the publish
@@ -373,12 +737,46 @@ class MariTexturesPublishPlugin(HookBaseClass):
 
         publisher = self.parent
 
-        # get the data for the publish that was just created in SG
-        publish_data = item.properties["sg_publish_data"]
+        if self._publish_in_background(settings):
+            self._launch_background_publish(settings, item)
+            self.logger.info("'%s' is being published in the background.  Progress "
+                             "will be reported in the Shotgun log." % item.name)
+            texture_items = self._get_texture_items(item)
+            if not texture_items or texture_items[-1] is item:
+                publisher.engine.stop_mari_api_trace(MARI_API_TRACE_NAME)
+            return
+
+        if settings["Batch Conflict Clearing"].value:
+            # clear the status of the publishes that conflict with those of
+            # every item published in this pass in as few Shotgun calls as
+            # possible.  The time taken is shared between the items:
+            if not item.properties.get("conflicts_cleared"):
+                cleared_items = [
+                    i for i in self._get_texture_items(item) or [item]
+                    if i.properties.get("sg_publish_data")
+                    and not i.properties.get("conflicts_cleared")
+                ]
+                if item not in cleared_items:
+                    cleared_items.append(item)
+                start_time = time.time()
+                self._clear_conflicting_publishes(settings, cleared_items)
+                duration = time.time() - start_time
+                for cleared_item in cleared_items:
+                    cleared_item.properties["conflicts_cleared"] = True
+                    self._add_stage_time(cleared_item, "clear_conflicts",
+                                         duration / len(cleared_items))
+            publish_data = item.properties["sg_publish_data"]
+        else:
+            # get the data for the publish that was just created in SG
+            publish_data = item.properties["sg_publish_data"]
 
-        # ensure conflicting publishes have their status cleared
-        publisher.util.clear_status_for_conflicting_publishes(
-            item.context, publish_data)
+            # ensure conflicting publishes have their status cleared
+            with self._timed_stage(item, "clear_conflicts"):
+                publisher.util.clear_status_for_conflicting_publishes(
+                    item.context, publish_data)
+                for secondary_publish_data in item.properties.get("sg_secondary_publish_data", []):
+                    publisher.util.clear_status_for_conflicting_publishes(
+                        item.context, secondary_publish_data)
 
         self.logger.info(
             "Cleared the status of all previous, conflicting publishes")
@@ -395,7 +793,1114 @@ class MariTexturesPublishPlugin(HookBaseClass):
             }
         )
 
-    def _find_publishes(self, ctx, publish_name, publish_type):
+        # report the timings once the last item has been finalized:
+        texture_items = self._get_texture_items(item)
+        if not texture_items or texture_items[-1] is item:
+            self._report_timings(settings, texture_items or [item])
+            publisher.engine.stop_mari_api_trace(MARI_API_TRACE_NAME)
+
+    @contextlib.contextmanager
+    def _timed_stage(self, item, stage):
+        """
+        Context manager that adds the time taken by the enclosed block to the
+        time recorded for a stage of an item's publish.  Stages entered more
+        than once accumulate their time.
+
+        :param item:    The item being published
+        :param stage:   The name of the stage
+        """
+        start_time = time.time()
+        try:
+            yield
+        finally:
+            self._add_stage_time(item, stage, time.time() - start_time)
+
+    def _add_stage_time(self, item, stage, seconds):
+        """
+        Add time to the time recorded for a stage of an item's publish.
+
+        :param item:    The item being published
+        :param stage:   The name of the stage
+        :param seconds: The time to add
+        """
+        timings = item.properties.get("publish_timings")
+        if timings is None:
+            timings = collections.OrderedDict()
+            item.properties["publish_timings"] = timings
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+    def _get_bytes_written(self, path, tiled_path, proxy_paths):
+        """
+        Get the total size of the files written for a publish.
+
+        :param path:        The path of the exported textures
+        :param tiled_path:  The path of the tiled textures or None
+        :param proxy_paths: Dictionary of proxy tile set paths
+        :returns:           The total size in bytes
+        """
+        total = 0
+        for set_path in [path, tiled_path] + proxy_paths.values():
+            if not set_path:
+                continue
+            for _, tile_path in self._get_exported_tiles(set_path):
+                try:
+                    total += os.path.getsize(tile_path)
+                except OSError:
+                    pass
+        return total
+
+    def _report_timings(self, settings, items):
+        """
+        Summarise the stage timings of all items published in the log and
+        write them to the timing report if one is configured.
+
+        :param settings:    Dictionary of Settings for this plugin
+        :param items:       The items that were published
+        """
+        items = [i for i in items if i.properties.get("publish_timings")]
+        if not items:
+            return
+
+        stages = []
+        report_items = []
+        stage_totals = collections.OrderedDict()
+        for item in items:
+            timings = item.properties["publish_timings"]
+            for stage, seconds in timings.iteritems():
+                if stage not in stages:
+                    stages.append(stage)
+                stage_totals[stage] = stage_totals.get(stage, 0.0) + seconds
+
+            total = sum(timings.values())
+            bytes_written = item.properties.get("publish_bytes_written", 0)
+            write_time = sum([timings.get(s, 0.0) for s in
+                              ("export", "recompress", "convert_to_tiled", "proxies")])
+            report_items.append({
+                "name": item.name,
+                "geo": item.properties["mari_geo_name"],
+                "channel": item.properties["mari_channel_name"],
+                "layer": item.properties.get("mari_layer_path"),
+                "path": item.properties.get("path"),
+                "stages": timings,
+                "total": total,
+                "wall_time": item.properties.get("publish_duration"),
+                "bytes_written": bytes_written,
+                "throughput": bytes_written / write_time if write_time else None,
+            })
+
+        # build a table with a row per item and a column per stage:
+        header = ["Item"] + stages + ["Total", "MB", "MB/s"]
+        rows = []
+        for report_item in report_items:
+            throughput = report_item["throughput"]
+            rows.append([report_item["name"]]
+                        + ["%.2f" % report_item["stages"].get(s, 0.0) for s in stages]
+                        + ["%.2f" % report_item["total"],
+                           "%.1f" % (report_item["bytes_written"] / 1048576.0),
+                           "%.1f" % (throughput / 1048576.0) if throughput else "-"])
+        rows.append(["Total"]
+                    + ["%.2f" % stage_totals[s] for s in stages]
+                    + ["%.2f" % sum(stage_totals.values()),
+                       "%.1f" % (sum([i["bytes_written"] for i in report_items]) / 1048576.0),
+                       ""])
+        widths = [max([len(row[c]) for row in [header] + rows]) for c in range(len(header))]
+        table = "\n".join(["  ".join([cell.ljust(width) for cell, width in zip(row, widths)])
+                            for row in [header] + rows])
+
+        slowest_stage = max(stage_totals, key=stage_totals.get)
+        self.logger.info(
+            "Published %d texture(s) in %.1fs - most time was spent in '%s' (%.1fs)"
+            % (len(report_items), sum(stage_totals.values()), slowest_stage,
+               stage_totals[slowest_stage]),
+            extra={
+                "action_show_more_info": {
+                    "label": "Show Timings",
+                    "tooltip": "Show the time taken by each stage of the publish",
+                    "text": "<pre>%s</pre>" % (table,)
+                }
+            }
+        )
+
+        report_path = settings["Timing Report Path"].value
+        if not report_path:
+            return
+        report_path = time.strftime(os.path.expandvars(report_path))
+        report = {
+            "created_at": time.time(),
+            "engine_version": self.parent.engine.version,
+            "app_version": self.parent.version,
+            "stage_totals": stage_totals,
+            "items": report_items,
+        }
+        try:
+            report_dir = os.path.dirname(report_path)
+            if report_dir and not os.path.exists(report_dir):
+                os.makedirs(report_dir)
+            with open(report_path, "w") as report_file:
+                json.dump(report, report_file, indent=1)
+            self.logger.info("Timing report written to %s" % report_path)
+        except Exception, e:
+            self.logger.warning("Failed to write the timing report '%s': %s" % (report_path, e))
+
+    def _publish_in_background(self, settings):
+        """
+        Determine if items should be handed to a background worker process
+        rather than being published in this session.
+
+        :param settings:    Dictionary of Settings for this plugin
+        :returns:           True if items should be published in the background
+        """
+        engine = self.parent.engine
+        # a worker process always publishes the items it was given itself:
+        return (settings["Background Publish"].value
+                and engine.has_ui
+                and not engine.worker_job)
+
+    def _queue_background_publish(self, item):
+        """
+        Queue an item to be published by the next background worker launched.
+        The queued state is kept on the item so that nothing queued in a
+        publish pass that fails can leak into a later pass.
+
+        :param item:    The item to publish
+        """
+        item.properties["background_publish_queued"] = True
+
+    def _get_background_archive(self, item):
+        """
+        Get the archive of the saved project that the background worker will
+        publish from, archiving the project the first time this is called in
+        a publish pass.  Mari won't open a project that is open in another
+        session, so the worker extracts the archive into its own cache.
+
+        :param item:    The item being published
+        :returns:       The path of the archive or None if the project
+                        couldn't be archived
+        """
+        for texture_item in self._get_texture_items(item) or [item]:
+            if "background_archive" in texture_item.properties:
+                return texture_item.properties["background_archive"]
+
+        archive_dir = os.path.join(self.parent.engine.cache_location, "worker_jobs")
+        archive_path = os.path.join(archive_dir, "%s.mra" % uuid.uuid4().hex)
+        self.logger.info("Archiving the project for the background publish...")
+        try:
+            if not os.path.exists(archive_dir):
+                os.makedirs(archive_dir)
+            with self._timed_stage(item, "archive"):
+                mari.projects.archive(mari.projects.current().name(), archive_path)
+        except Exception, e:
+            self.logger.warning("Failed to archive the project for the background "
+                                "publish: %s" % e)
+            archive_path = None
+        item.properties["background_archive"] = archive_path
+        return archive_path
+
+    def _launch_background_publish(self, settings, item):
+        """
+        Launch a worker process to publish all queued items in the same publish
+        tree as an item.  The project was saved and archived before the items
+        were queued so the worker sees the same state as this session.  The
+        worker is given its own Mari cache to extract the archive into, and
+        both are removed when the worker exits.
+
+        :param settings:    Dictionary of Settings for this plugin
+        :param item:        The item being finalized
+        """
+        queued_items = [
+            i for i in self._get_texture_items(item) or [item]
+            if i.properties.get("background_publish_queued")
+        ]
+        if not queued_items:
+            return
+        archive_path = None
+        for texture_item in self._get_texture_items(item) or [item]:
+            archive_path = archive_path or texture_item.properties.get("background_archive")
+            texture_item.properties.pop("background_archive", None)
+        if not archive_path:
+            self.logger.error("The project archive for the background publish is missing!")
+            return
+        pending = []
+        for queued_item in queued_items:
+            queued_item.properties["background_publish_queued"] = False
+            pending.append({
+                "key": list(queued_item.properties["mari_index_key"]),
+                "name": queued_item.name,
+                "description": queued_item.description,
+            })
+
+        publisher = self.parent
+        job = {
+            "kind": "texture_publish",
+            "project": mari.projects.current().name(),
+            "archive": archive_path,
+            "publisher": publisher.instance_name,
+            "items": pending,
+        }
+        cache_dir = "%s_cache" % os.path.splitext(archive_path)[0]
+
+        self.logger.info("Launching a background publish of %d item(s)..." % len(pending))
+        publisher.engine.launch_worker(settings["Background Worker Command"].value,
+                                       job, self._on_worker_event,
+                                       env={"MARI_CACHE": cache_dir},
+                                       temp_paths=[archive_path, cache_dir])
+
+    def _on_worker_event(self, event):
+        """
+        Report the progress of a background publish.  This is called from a
+        background thread for each event reported by the worker and may be
+        called after the publisher has been closed so messages are logged
+        through the engine.
+
+        :param event:   The event dictionary reported by the worker
+        """
+        engine = self.parent.engine
+        event_type = event.get("event")
+        if event_type == "progress":
+            engine.log_info("Background publish: %s" % event.get("message"))
+        elif event_type == "item_started":
+            engine.log_info("Background publish: exporting '%s'..." % event.get("name"))
+        elif event_type == "item_published":
+            engine.log_info("Background publish: published '%s' to %s"
+                            % (event.get("name"), event.get("path")))
+        elif event_type == "item_failed":
+            engine.log_error("Background publish: failed to publish '%s': %s"
+                             % (event.get("name"), event.get("message")))
+        elif event_type == "job_finished":
+            engine.log_info("Background publish: complete!")
+        elif event_type == "job_failed":
+            engine.log_error("Background publish failed: %s" % event.get("message"))
+        elif event_type == "worker_exited" and event.get("exit_code"):
+            engine.log_error("Background publish worker exited with code %s"
+                             % event.get("exit_code"))
+
+    def _register_secondary_publish(self, settings, item, publish_data):
+        """
+        Register an additional publish for an item, e.g. for files derived from
+        the exported textures.  The resulting publish records are stored on the
+        item in the 'sg_secondary_publish_data' list.
+
+        :param settings:        Dictionary of Settings for this plugin
+        :param item:            The item being published
+        :param publish_data:    The arguments to pass to sgtk.util.register_publish
+        """
+        item.properties.setdefault("sg_secondary_publish_data", [])
+        self.logger.info("Registering publish for %s..." % publish_data["path"])
+        with self._timed_stage(item, "register"):
+            item.properties["sg_secondary_publish_data"].append(
+                sgtk.util.register_publish(**publish_data))
+
+    def _clear_conflicting_publishes(self, settings, items):
+        """
+        Clear the status of all publishes that conflict with the publishes
+        registered for a list of items, using a single query to find them and
+        batched requests to update them.
+
+        :param settings:    Dictionary of Settings for this plugin
+        :param items:       The items whose publishes have been registered
+        """
+        publisher = self.parent
+        sg = publisher.shotgun
+        publish_entity_type = sgtk.util.get_published_file_entity_type(publisher.sgtk)
+
+        created = []
+        for item in items:
+            created.append(item.properties["sg_publish_data"])
+            created.extend(item.properties.get("sg_secondary_publish_data", []))
+        created = [p for p in created if p and p.get("code") and p.get("project")]
+        if not created:
+            return
+
+        # find all conflicting publishes - these are publishes of the same file
+        # with the same name in the same context that aren't one of the new
+        # publishes - with a single query and clear their status:
+        created_ids = set([p["id"] for p in created])
+        created_keys = set([self._get_conflict_key(p) for p in created])
+        filters = [
+            ["project", "in", list(dict([(p["project"]["id"], p["project"]) for p in created]).values())],
+            ["code", "in", list(set([p["code"] for p in created]))],
+            ["name", "in", list(set([p.get("name") for p in created]))],
+            ["sg_status_list", "is_not", None],
+        ]
+        try:
+            conflicting = sg.find(publish_entity_type, filters, ["code", "name", "entity", "task"])
+        except Exception, e:
+            self.logger.warning("Failed to find conflicting publishes: %s" % e)
+            return
+
+        requests = []
+        for sg_publish in conflicting:
+            key = self._get_conflict_key(sg_publish)
+            if sg_publish["id"] in created_ids or key not in created_keys:
+                continue
+            requests.append({
+                "request_type": "update",
+                "entity_type": publish_entity_type,
+                "entity_id": sg_publish["id"],
+                "data": {"sg_status_list": None}
+            })
+        if requests:
+            self._batch_requests(
+                requests, settings["Batch Size"].value, settings["Batch Retries"].value)
+
+    def _get_conflict_key(self, sg_publish):
+        """
+        Get the key used to find publishes that conflict with each other.
+        Publishes conflict if they have the same code and name and are linked
+        to the same entity and task.
+
+        :param sg_publish:  The publish dictionary
+        :returns:           A hashable key
+        """
+        entity = sg_publish.get("entity") or {}
+        task = sg_publish.get("task") or {}
+        return (sg_publish["code"], sg_publish.get("name"), entity.get("type"),
+                entity.get("id"), task.get("id"))
+
+    def _batch_requests(self, requests, batch_size, retries):
+        """
+        Submit requests to Shotgun in chunks using the batch() call.
+
+        Shotgun batches are transactional so when a chunk fails, it is retried
+        and if it still fails, its requests are submitted one at a time so that
+        a single bad request doesn't prevent the others from succeeding.
+
+        :param requests:    A list of batch request dictionaries
+        :param batch_size:  The maximum number of requests per batch call
+        :param retries:     The number of times to retry a failed chunk
+        :returns:           A list of results, one for each request.  The result
+                            is None for any request that failed.
+        """
+        sg = self.parent.shotgun
+        batch_size = max(batch_size, 1)
+
+        results = []
+        for start in range(0, len(requests), batch_size):
+            chunk = requests[start:start + batch_size]
+
+            chunk_results = None
+            for attempt in range(max(retries, 0) + 1):
+                try:
+                    chunk_results = sg.batch(chunk)
+                    break
+                except Exception, e:
+                    self.logger.warning("Shotgun batch of %d requests failed (attempt %d): %s"
+                                        % (len(chunk), attempt + 1, e))
+                    time.sleep(min(2 ** attempt, 10))
+
+            if chunk_results is None:
+                # fall back to submitting each request on its own:
+                chunk_results = []
+                for request in chunk:
+                    try:
+                        chunk_results.extend(sg.batch([request]))
+                    except Exception, e:
+                        self.logger.error("Shotgun %s request for %s failed: %s"
+                                          % (request["request_type"], request["entity_type"], e))
+                        chunk_results.append(None)
+
+            results.extend(chunk_results)
+
+        return results
+
+    def _resolve_item(self, item):
+        """
+        Find the live Mari geo, channel and layer for an item.
+
+        The collector stores an index of the Mari objects for every item it
+        creates on the root item so these are looked up there first.  If the
+        index is missing or an entry is no longer valid, the objects are found
+        by name, following the layer path through any layer groups, and the
+        index is updated.
+
+        :param item:    The item to resolve
+        :returns:       A tuple of (geo, channel, layer).  layer is None for
+                        channel items and any object that can't be found is None
+        """
+        root = item
+        while root.parent:
+            root = root.parent
+        session_index = root.properties.get("mari_session_index")
+        if session_index is None:
+            session_index = {}
+            root.properties["mari_session_index"] = session_index
+
+        geo_name = item.properties["mari_geo_name"]
+        channel_name = item.properties["mari_channel_name"]
+        layer_path = (item.properties.get("mari_layer_path")
+                      or item.properties.get("mari_layer_name"))
+        index_key = tuple(item.properties.get("mari_index_key")
+                          or (geo_name, channel_name, layer_path))
+
+        entry = session_index.get(index_key)
+        if entry:
+            geo, channel, layer = entry
+            try:
+                # make sure the objects are still valid and haven't been renamed:
+                if (geo.name() == geo_name and channel.name() == channel_name
+                        and (not layer or layer.name() == layer_path.split("/")[-1])):
+                    return entry
+            except Exception:
+                pass
+
+        # fall back to finding the objects by name:
+        geo = mari.geo.find(geo_name)
+        channel = geo.findChannel(channel_name) if geo else None
+        layer = None
+        if channel and layer_path:
+            layers = channel.layerList()
+            for name in layer_path.split("/"):
+                layer = None
+                for candidate in layers:
+                    if candidate.name() == name:
+                        layer = candidate
+                        break
+                if not layer:
+                    break
+                if layer.isGroupLayer():
+                    layers = layer.layerStack().layerList()
+
+        entry = (geo, channel, layer)
+        if geo and channel and (layer or not layer_path):
+            session_index[index_key] = entry
+        return entry
+
+    def _get_publish_fields(self, item, publish_template=None):
+        """
+        Get the fields used to build the publish path for an item.  The
+        version field is not included.
+
+        :param item:                The item being published
+        :param publish_template:    The publish template to get the fields for.
+                                    Defaults to the item's publish template.
+        :returns:                   A dictionary of template fields
+        """
+        publish_template = publish_template or item.properties["publish_template"]
+
+        # Get fields from the current context
+        fields = {}
+        ctx_fields = self.parent.context.as_template_fields(publish_template)
+        fields.update(ctx_fields)
+
+        # For geo name, strip out the non-alphanumeric characters because Mari's
+        # publish template filter does not allow non-alphanumeric characters in
+        # the geo name.
+        fields["name"] = re.sub(r"[\W_]+", "", item.properties["mari_geo_name"])
+
+        fields["channel"] = item.properties["mari_channel_name"]
+        fields["layer"] = item.properties.get("mari_layer_name")
+        fields["UDIM"] = "$UDIM"
+        return fields
+
+    def _check_disk_space(self, settings, item):
+        """
+        Check that there is enough free space to publish an item.
+
+        The first time this is called for a validation pass, the output size of
+        every checked mari.texture item is estimated and the totals for each
+        destination volume are compared against the free space on that volume,
+        querying each volume only once.  The result for each item is then
+        looked up in later calls.
+
+        :param settings:    Dictionary of Settings for this plugin
+        :param item:        The item being validated
+        :returns:           An error message if there isn't enough space to
+                            publish the item, otherwise None
+        """
+        texture_items = self._get_texture_items(item) or [item]
+        if (texture_items[0] is item
+                or id(item) not in getattr(self, "_disk_space_checked_items", set())):
+            # first item of a new validation pass so check all items:
+            self._disk_space_errors = self._estimate_disk_space(settings, texture_items)
+            self._disk_space_checked_items = set([id(i) for i in texture_items])
+        return self._disk_space_errors.get(id(item))
+
+    def _get_texture_items(self, item):
+        """
+        Get all checked mari.texture items in the publish tree an item is in.
+
+        :param item:    Any item in the publish tree
+        :returns:       A list of items in tree order
+        """
+        root = item
+        while root.parent:
+            root = root.parent
+        texture_items = []
+        for tree_item in root.descendants:
+            item_type = getattr(tree_item, "type_spec", None) or tree_item.type
+            if item_type == "mari.texture" and tree_item.checked:
+                texture_items.append(tree_item)
+        return texture_items
+
+    def _estimate_disk_space(self, settings, items):
+        """
+        Estimate the space needed to publish a list of items and compare the
+        totals for each destination volume with the free space available.
+
+        :param settings:    Dictionary of Settings for this plugin
+        :param items:       The items to be published
+        :returns:           A dictionary of id(item) to error message for each
+                            item that can't be published
+        """
+        publish_template = self.parent.engine.get_template_by_name(
+            settings["Publish Template"].value)
+        compression_ratio = max(settings["Estimated Compression Ratio"].value or 1.0, 0.01)
+
+        volume_items = {}
+        volume_bytes = {}
+        volume_paths = {}
+        for item in items:
+            geo, channel, _ = self._resolve_item(item)
+            if not channel:
+                continue
+
+            export_options = self._get_export_options(
+                settings, item.properties["mari_channel_name"])
+            bytes_per_component = {
+                "8": 1, "16": 2, "half": 2, "32": 4, "float": 4
+            }.get(str(export_options["bit_depth"]), max(channel.depth() / 8, 1))
+
+            # assume RGBA tiles at the full channel resolution for every patch:
+            tile_bytes = channel.width() * channel.height() * 4 * bytes_per_component
+            size_factor = 1.0
+            if settings["Convert To Tiled"].value:
+                # a mip-mapped copy is roughly 4/3 the size of the original:
+                size_factor += 4.0 / 3.0
+            channel_size = max(channel.width(), channel.height())
+            for size in settings["Proxy Resolutions"].value:
+                if size < channel_size:
+                    size_factor += (float(size) / channel_size) ** 2
+            estimated_bytes = int(len(geo.patchList()) * tile_bytes * size_factor
+                                  / compression_ratio)
+
+            # find the existing directory the item will be published to:
+            fields = self._get_publish_fields(item, publish_template)
+            self._apply_export_format(publish_template, fields, export_options)
+            fields["version"] = 1
+            publish_dir = os.path.dirname(publish_template.apply_fields(fields))
+            while publish_dir and not os.path.exists(publish_dir):
+                parent_dir = os.path.dirname(publish_dir)
+                if parent_dir == publish_dir:
+                    break
+                publish_dir = parent_dir
+
+            volume = os.stat(publish_dir).st_dev
+            volume_items.setdefault(volume, []).append(item)
+            volume_bytes[volume] = volume_bytes.get(volume, 0) + estimated_bytes
+            volume_paths[volume] = publish_dir
+
+        # compare the totals with the free space on each volume:
+        errors = {}
+        for volume, required_bytes in volume_bytes.items():
+            free_bytes = self._get_free_space(volume_paths[volume])
+            if free_bytes is None:
+                self.logger.debug("Estimated %.1f GB to publish to %s (unknown free space)"
+                                  % (required_bytes / 1e9, volume_paths[volume]))
+                continue
+            self.logger.debug("Estimated %.1f GB to publish to %s (%.1f GB free)"
+                              % (required_bytes / 1e9, volume_paths[volume], free_bytes / 1e9))
+            if required_bytes > free_bytes:
+                error_msg = ("Not enough disk space to publish! %d textures need an estimated "
+                             "%.1f GB on the volume containing '%s' but only %.1f GB is free."
+                             % (len(volume_items[volume]), required_bytes / 1e9,
+                                volume_paths[volume], free_bytes / 1e9))
+                for item in volume_items[volume]:
+                    errors[id(item)] = error_msg
+        return errors
+
+    def _get_free_space(self, path):
+        """
+        Get the free space available to the current user on the volume
+        containing a path.
+
+        :param path:    An existing path on the volume
+        :returns:       The number of free bytes or None if it couldn't be
+                        determined
+        """
+        try:
+            if hasattr(os, "statvfs"):
+                st = os.statvfs(path)
+                return st.f_bavail * st.f_frsize
+            free_bytes = ctypes.c_ulonglong(0)
+            ctypes.windll.kernel32.GetDiskFreeSpaceExW(
+                ctypes.c_wchar_p(path), None, None, ctypes.pointer(free_bytes))
+            return free_bytes.value
+        except Exception, e:
+            self.logger.warning("Failed to determine the free space for '%s': %s" % (path, e))
+        return None
+
+    def _get_export_options(self, settings, channel_name):
+        """
+        Get the export format, bit depth and compression to use for a channel.
+
+        :param settings:        Dictionary of Settings for this plugin
+        :param channel_name:    The name of the channel being exported
+        :returns:               A dictionary with the keys 'format', 'bit_depth'
+                                and 'compression'
+        """
+        export_options = {
+            "format": settings["Export Format"].value,
+            "bit_depth": settings["Export Bit Depth"].value,
+            "compression": settings["Export Compression"].value,
+        }
+        overrides = settings["Channel Export Overrides"].value or {}
+        for pattern in sorted(overrides.keys()):
+            if fnmatch.fnmatch(channel_name, pattern):
+                export_options.update(overrides[pattern])
+        return export_options
+
+    def _apply_export_format(self, template, fields, export_options):
+        """
+        Set the export format as the extension in the fields used to build a
+        path from a template, if the template has an extension key.
+
+        :param template:        The template the fields will be applied to
+        :param fields:          The dictionary of template fields to update
+        :param export_options:  The export options returned by _get_export_options
+        """
+        if export_options["format"] and "extension" in template.keys:
+            fields["extension"] = export_options["format"].lstrip(".")
+
+    def _get_export_format_error(self, template, export_options):
+        """
+        Check that paths built from a template will have the extension of the
+        export format.
+
+        :param template:        The template to check
+        :param export_options:  The export options returned by _get_export_options
+        :returns:               An error message or None if the format is valid
+        """
+        export_format = (export_options["format"] or "").lstrip(".")
+        if not export_format or "extension" in template.keys:
+            return None
+        template_ext = os.path.splitext(template.definition)[1].lstrip(".")
+        if template_ext.lower() == export_format.lower():
+            return None
+        return ("The export format '%s' doesn't match the extension '%s' of the "
+                "template '%s'. Add an {extension} key to the template or change "
+                "the export format." % (export_format, template_ext, template.name))
+
+    def _replace_file(self, src_path, dst_path):
+        """
+        Move a file over another, replacing it.  This is atomic on POSIX; on
+        Windows the destination has to be removed first so there is a moment
+        where neither file exists at the destination.
+
+        :param src_path:    The path of the file to move
+        :param dst_path:    The path to move the file to
+        """
+        if os.name == "nt" and os.path.exists(dst_path):
+            os.remove(dst_path)
+        os.rename(src_path, dst_path)
+
+    def _get_exported_tiles(self, path):
+        """
+        Find all UDIM tiles on disk for an exported path.
+
+        :param path:    The exported path containing the '$UDIM' token
+        :returns:       A list of (udim, tile path) tuples sorted by UDIM
+        """
+        tiles = []
+        tile_pattern = path.replace("$UDIM", "[1-9][0-9][0-9][0-9]")
+        udim_re = re.compile(
+            "^%s$" % re.escape(os.path.basename(path)).replace(re.escape("$UDIM"), "([0-9]{4})"))
+        for tile_path in glob.glob(tile_pattern):
+            match = udim_re.match(os.path.basename(tile_path))
+            if match:
+                tiles.append((int(match.group(1)), tile_path))
+        return sorted(tiles)
+
+    def _run_parallel(self, settings, func, args_list):
+        """
+        Run a function for each of a list of arguments on a bounded pool of
+        worker threads.  The functions used are expected to spend their time
+        in external processes or in I/O so threads are sufficient to spread
+        the work across all cores.
+
+        :param settings:    Dictionary of Settings for this plugin
+        :param func:        The function to run
+        :param args_list:   A list of argument tuples to run the function with
+        :returns:           A list of (result, error) tuples in the same order as
+                            args_list.  error is None if the function succeeded.
+        """
+        def run(args):
+            try:
+                return (func(*args), None)
+            except Exception, e:
+                return (None, e)
+
+        if not args_list:
+            return []
+
+        processes = settings["Post Export Processes"].value or multiprocessing.cpu_count()
+        pool = multiprocessing.pool.ThreadPool(min(processes, len(args_list)))
+        try:
+            return pool.map(run, args_list)
+        finally:
+            pool.close()
+            pool.join()
+
+    def _run_command(self, command):
+        """
+        Run a shell command, raising an exception if it fails.
+
+        :param command: The command line to run
+        """
+        process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE,
+                                   stderr=subprocess.STDOUT)
+        output = process.communicate()[0]
+        if process.returncode != 0:
+            raise Exception("Command '%s' failed with exit code %d: %s"
+                            % (command, process.returncode, output))
+
+    def _recompress_tiles(self, settings, path, export_options):
+        """
+        Convert all exported tiles for a path to the configured bit depth and
+        compression in parallel.
+
+        :param settings:        Dictionary of Settings for this plugin
+        :param path:            The exported path containing the '$UDIM' token
+        :param export_options:  The export options returned by _get_export_options
+        """
+        bit_depth_args = ""
+        if export_options["bit_depth"]:
+            bit_depth_args = "-d %s" % {
+                "8": "uint8", "16": "uint16"
+            }.get(str(export_options["bit_depth"]), export_options["bit_depth"])
+        compression_args = ""
+        if export_options["compression"]:
+            compression_args = "--compression %s" % export_options["compression"]
+
+        def recompress(tile_path):
+            base, ext = os.path.splitext(tile_path)
+            tmp_path = "%s.tmp%s" % (base, ext)
+            self._run_command(settings["Recompress Command"].value.format(
+                input=tile_path,
+                output=tmp_path,
+                bit_depth_args=bit_depth_args,
+                compression_args=compression_args
+            ))
+            self._replace_file(tmp_path, tile_path)
+
+        tiles = self._get_exported_tiles(path)
+        self.logger.info("Recompressing %d tiles..." % len(tiles))
+        results = self._run_parallel(settings, recompress, [(t,) for _, t in tiles])
+        errors = [str(e) for _, e in results if e]
+        if errors:
+            error_msg = "Failed to recompress %d tiles: %s" % (len(errors), errors[0])
+            self.logger.error(error_msg)
+            raise Exception(error_msg)
+
+    def _convert_to_tiled(self, settings, path):
+        """
+        Convert all exported tiles for a path to tiled, mip-mapped textures in
+        parallel using the configured converter command.
+
+        :param settings:    Dictionary of Settings for this plugin
+        :param path:        The exported path containing the '$UDIM' token
+        :returns:           The path of the converted textures, containing the
+                            '$UDIM' token
+        """
+        tiled_ext = settings["Tiled Extension"].value.lstrip(".")
+
+        def convert(tile_path):
+            tiled_tile_path = "%s.%s" % (os.path.splitext(tile_path)[0], tiled_ext)
+            self._run_command(settings["Tiled Converter Command"].value.format(
+                input=tile_path,
+                output=tiled_tile_path
+            ))
+            return tiled_tile_path
+
+        tiles = self._get_exported_tiles(path)
+        self.logger.info("Converting %d tiles to tiled textures..." % len(tiles))
+        results = self._run_parallel(settings, convert, [(t,) for _, t in tiles])
+        errors = [str(e) for _, e in results if e]
+        if errors:
+            error_msg = "Failed to convert %d tiles: %s" % (len(errors), errors[0])
+            self.logger.error(error_msg)
+            raise Exception(error_msg)
+
+        return "%s.%s" % (os.path.splitext(path)[0], tiled_ext)
+
+    def _create_proxies(self, settings, item, path, fields, export_options, channel):
+        """
+        Create downscaled proxy tile sets for all exported tiles of a path.  All
+        tiles for all resolutions are resized in parallel.
+
+        :param settings:        Dictionary of Settings for this plugin
+        :param item:            The item being published
+        :param path:            The exported path containing the '$UDIM' token
+        :param fields:          The fields used to build the publish path
+        :param export_options:  The export options returned by _get_export_options
+        :param channel:         The Mari channel that was exported
+        :returns:               A dictionary of resolution token to the path of the
+                                proxy tile set containing the '$UDIM' token
+        """
+        proxy_template = item.properties["publish_template"]
+        proxy_template_name = settings["Proxy Publish Template"].value
+        if proxy_template_name:
+            proxy_template = self.parent.engine.get_template_by_name(proxy_template_name)
+            if not proxy_template:
+                error_msg = "Proxy publish template '%s' not found" % proxy_template_name
+                self.logger.error(error_msg)
+                raise Exception(error_msg)
+
+        channel_size = max(channel.width(), channel.height())
+
+        proxy_paths = {}
+        proxy_sizes = {}
+        for size in sorted(set(settings["Proxy Resolutions"].value)):
+            if size >= channel_size:
+                self.logger.debug("Skipping %d proxy - the channel is only %d"
+                                  % (size, channel_size))
+                continue
+
+            if size % 1024 == 0:
+                resolution = "%dk" % (size / 1024)
+            else:
+                resolution = str(size)
+
+            if "resolution" in proxy_template.keys:
+                proxy_fields = dict(fields)
+                proxy_fields["resolution"] = resolution
+                self._apply_export_format(proxy_template, proxy_fields, export_options)
+                proxy_path = sgtk.util.ShotgunPath.normalize(
+                    proxy_template.apply_fields(proxy_fields))
+            else:
+                # no resolution key so put the proxies in a sub-folder:
+                proxy_path = os.path.join(os.path.dirname(path), resolution,
+                                          os.path.basename(path))
+            if proxy_path == path:
+                self.logger.warning("Proxy path for %s resolves to the publish path! "
+                                    "Skipping proxy." % resolution)
+                continue
+
+            proxy_paths[resolution] = proxy_path
+            proxy_sizes[resolution] = size
+
+        def resize(tile_path, proxy_tile_path, size):
+            proxy_dir = os.path.dirname(proxy_tile_path)
+            if not os.path.exists(proxy_dir):
+                try:
+                    os.makedirs(proxy_dir)
+                except OSError:
+                    # another thread may have created it
+                    pass
+            self._run_command(settings["Proxy Resize Command"].value.format(
+                input=tile_path,
+                output=proxy_tile_path,
+                size=size
+            ))
+
+        args_list = []
+        for udim, tile_path in self._get_exported_tiles(path):
+            for resolution, proxy_path in proxy_paths.items():
+                args_list.append((tile_path,
+                                  proxy_path.replace("$UDIM", str(udim)),
+                                  proxy_sizes[resolution]))
+
+        self.logger.info("Creating %d proxy tiles..." % len(args_list))
+        results = self._run_parallel(settings, resize, args_list)
+        errors = [str(e) for _, e in results if e]
+        if errors:
+            error_msg = "Failed to create %d proxy tiles: %s" % (len(errors), errors[0])
+            self.logger.error(error_msg)
+            raise Exception(error_msg)
+
+        return proxy_paths
+
+    def _get_manifest_path(self, path):
+        """
+        Get the path of the manifest for an exported path.  This is the
+        exported path with the '$UDIM' token and extension removed, e.g.
+        '/textures/diffuse.$UDIM.exr' has the manifest
+        '/textures/diffuse.manifest.json'.
+
+        :param path:    The exported path containing the '$UDIM' token
+        :returns:       The path of the manifest
+        """
+        base = os.path.splitext(os.path.basename(path))[0]
+        base = re.sub(r"([._-])[._-]+", r"\1", base.replace("$UDIM", "")).strip("._-")
+        return os.path.join(os.path.dirname(path), "%s.manifest.json" % base)
+
+    def _write_manifest(self, settings, path, tiled_path, proxy_paths, geo,
+                        channel, layer_name):
+        """
+        Write a manifest listing all tiles written for a publish together with
+        their sizes, checksums and resolutions.  Checksums are calculated in
+        parallel while the tiles are still in the page cache.
+
+        :param settings:    Dictionary of Settings for this plugin
+        :param path:        The exported path containing the '$UDIM' token
+        :param tiled_path:  The path of the tiled textures or None
+        :param proxy_paths: Dictionary of resolution token to proxy path
+        :param geo:         The Mari geo that was exported
+        :param channel:     The Mari channel that was exported
+        :param layer_name:  The name of the exported layer or None
+        :returns:           The path of the manifest that was written
+        """
+        channel_resolution = [channel.width(), channel.height()]
+
+        def describe_tile(udim, tile_path):
+            sha1 = hashlib.sha1()
+            with open(tile_path, "rb") as tile_file:
+                for chunk in iter(lambda: tile_file.read(1024 * 1024), b""):
+                    sha1.update(chunk)
+            return {
+                "udim": udim,
+                "file": os.path.basename(tile_path),
+                "bytes": os.path.getsize(tile_path),
+                "sha1": sha1.hexdigest(),
+                "resolution": self._read_image_resolution(tile_path),
+            }
+
+        # find the tiles for every set that was written:
+        tile_sets = [("", path)]
+        if tiled_path:
+            tile_sets.append(("tiled", tiled_path))
+        for resolution, proxy_path in sorted(proxy_paths.items()):
+            tile_sets.append((resolution, proxy_path))
+
+        args_list = []
+        for set_name, set_path in tile_sets:
+            for udim, tile_path in self._get_exported_tiles(set_path):
+                args_list.append((udim, tile_path))
+        results = self._run_parallel(settings, describe_tile, args_list)
+
+        described_tiles = {}
+        for (udim, tile_path), (tile, error) in zip(args_list, results):
+            if error:
+                error_msg = "Failed to read tile '%s' for the manifest: %s" % (tile_path, error)
+                self.logger.error(error_msg)
+                raise Exception(error_msg)
+            described_tiles[tile_path] = tile
+
+        def describe_set(set_path, resolution=None):
+            tiles = []
+            for _, tile_path in self._get_exported_tiles(set_path):
+                tile = described_tiles[tile_path]
+                if not tile["resolution"] and resolution:
+                    tile["resolution"] = resolution
+                tiles.append(tile)
+            return {
+                "path": set_path,
+                "bytes": sum([t["bytes"] for t in tiles]),
+                "tiles": tiles,
+            }
+
+        manifest = describe_set(path, channel_resolution)
+        manifest.update({
+            "manifest_version": 1,
+            "udim_token": "$UDIM",
+            "geo": geo.name(),
+            "channel": channel.name(),
+            "layer": layer_name,
+            "resolution": channel_resolution,
+            "bit_depth": channel.depth(),
+        })
+        if tiled_path:
+            manifest["tiled"] = describe_set(tiled_path, channel_resolution)
+        if proxy_paths:
+            manifest["proxies"] = dict([
+                (resolution, describe_set(proxy_path))
+                for resolution, proxy_path in proxy_paths.items()
+            ])
+
+        manifest_path = self._get_manifest_path(path)
+        tmp_path = "%s.tmp" % manifest_path
+        with open(tmp_path, "w") as manifest_file:
+            json.dump(manifest, manifest_file, indent=1, sort_keys=True)
+        self._replace_file(tmp_path, manifest_path)
+
+        self.logger.info("Wrote manifest for %d tiles to %s"
+                         % (len(manifest["tiles"]), manifest_path))
+        return manifest_path
+
+    def _read_image_resolution(self, image_path):
+        """
+        Read the resolution of an image from its header.  Only EXR and PNG
+        headers are understood.
+
+        :param image_path:  The path of the image to read
+        :returns:           A [width, height] list or None if the resolution
+                            couldn't be determined
+        """
+        try:
+            with open(image_path, "rb") as image_file:
+                header = image_file.read(8)
+                if header[:4] == b"\x76\x2f\x31\x01":
+                    # EXR - look for the dataWindow attribute:
+                    while True:
+                        name = self._read_null_terminated(image_file)
+                        if not name:
+                            return None
+                        attr_type = self._read_null_terminated(image_file)
+                        size = struct.unpack("<i", image_file.read(4))[0]
+                        if name == b"dataWindow" and attr_type == b"box2i":
+                            x_min, y_min, x_max, y_max = struct.unpack(
+                                "<iiii", image_file.read(16))
+                            return [x_max - x_min + 1, y_max - y_min + 1]
+                        image_file.seek(size, 1)
+                elif header == b"\x89PNG\r\n\x1a\n":
+                    # PNG - the IHDR chunk is always first:
+                    image_file.read(8)
+                    width, height = struct.unpack(">II", image_file.read(8))
+                    return [width, height]
+        except Exception:
+            pass
+        return None
+
+    def _read_null_terminated(self, image_file):
+        """
+        Read a null terminated string from a file.
+
+        :param image_file:  The file to read from
+        :returns:           The string read without the terminator
+        """
+        chars = []
+        while True:
+            char = image_file.read(1)
+            if not char or char == b"\x00":
+                break
+            chars.append(char)
+            if len(chars) > 255:
+                break
+        return b"".join(chars)
+
+    def _get_publish_name(self, item, fields=None):
+        """
+        Get the name of the publish for an item.
+
+        :param item:    The item being published
+        :param fields:  The publish fields for the item if already known
+        :returns:       The publish name
+        """
+        fields = fields or self._get_publish_fields(item)
+        channel_name = item.properties["mari_channel_name"]
+        layer_name = item.properties.get("mari_layer_name")
+        if layer_name:
+            return "%s, %s - %s" % (fields["name"], channel_name, layer_name)
+        return "%s, %s" % (fields["name"], channel_name)
+
+    def _prefetch_publishes(self, settings, items):
+        """
+        Start looking up the existing publishes for a list of items on the
+        engine's Shotgun connection pool.  The lookup is stored on each item
+        and picked up by _find_publishes when the item is published.
+
+        :param settings:    Dictionary of Settings for this plugin
+        :param items:       The items to look up the publishes for
+        """
+        publish_type = settings["Publish Type"].value
+        shotgun_pool = self.parent.engine.shotgun_pool
+        for item in items:
+            publish_name = self._get_publish_name(item)
+            publish_entity_type, filters = self._get_publish_filters(
+                self.parent.context, publish_name, publish_type)
+            item.properties["publish_lookup"] = shotgun_pool.find_async(
+                publish_entity_type, filters, ["version_number"])
+
+    def _find_publishes(self, ctx, publish_name, publish_type, lookup=None):
         """
         Given a context, publish name and type, find all publishes from Shotgun
         that match.
@@ -403,10 +1908,43 @@ class MariTexturesPublishPlugin(HookBaseClass):
         :param ctx:             Context to use when looking for publishes
         :param publish_name:    The name of the publishes to look for
         :param publish_type:    The type of publishes to look for
+        :param lookup:          Optional Future for the lookup started by
+                                _prefetch_publishes
         
         :returns:               A list of Shotgun publish records that match the search
                                 criteria        
         """
+        # use the result of the lookup started by _prefetch_publishes if there is one:
+        if lookup:
+            try:
+                return lookup.result()
+            except Exception, e:
+                self.logger.error("Failed to find publishes of type '%s', called '%s', for context %s: %s" 
+                                  % (publish_name, publish_type, ctx, e))
+                return []
+
+        publish_entity_type, filters = self._get_publish_filters(ctx, publish_name, publish_type)
+            
+        # retrieve a list of all matching publishes from Shotgun:
+        sg_publishes = []
+        try:
+            query_fields = ["version_number"]
+            sg_publishes = self.parent.shotgun.find(publish_entity_type, filters, query_fields)
+        except Exception, e:
+            self.logger.error("Failed to find publishes of type '%s', called '%s', for context %s: %s" 
+                              % (publish_name, publish_type, ctx, e))
+        return sg_publishes
+
+    def _get_publish_filters(self, ctx, publish_name, publish_type):
+        """
+        Build the Shotgun filters used to find the publishes with a name and
+        type in a context.
+
+        :param ctx:             Context to use when looking for publishes
+        :param publish_name:    The name of the publishes to look for
+        :param publish_type:    The type of publishes to look for
+        :returns:               A tuple of the publish entity type and the filters
+        """
         publish_entity_type = sgtk.util.get_published_file_entity_type(self.parent.sgtk)
         if publish_entity_type == "PublishedFile":
             publish_type_field = "published_file_type.PublishedFileType.code"
@@ -425,14 +1963,5 @@ class MariTexturesPublishPlugin(HookBaseClass):
             filters.append(["name", "is", publish_name])
         if publish_type:
             filters.append([publish_type_field, "is", publish_type])
-            
-        # retrieve a list of all matching publishes from Shotgun:
-        sg_publishes = []
-        try:
-            query_fields = ["version_number"]
-            sg_publishes = self.parent.shotgun.find(publish_entity_type, filters, query_fields)
-        except Exception, e:
-            self.logger.error("Failed to find publishes of type '%s', called '%s', for context %s: %s" 
-                              % (publish_name, publish_type, ctx, e))
-        return sg_publishes
+        return publish_entity_type, filters
 
@@ -12,3 +12,16 @@ from .menu_generation import MenuGenerator
 from .metadata import MetadataManager
 from .project import ProjectManager
 from .geometry import GeometryManager
+from .log_sink import ConsoleLogSink, create_file_log_handler
+from .error_reporter import ErrorReporter
+from .session_export import SessionExporter
+from .startup_commands import StartupCommandQueue
+from .worker import WorkerProcess, get_current_job, emit_event, run_texture_publish_job, run_build_project_job
+from .instrumentation import MariApiTracer, format_api_trace
+from .command_stats import CommandTimings, CommandProfiler
+from .publish_cache import PublishCache
+from .geometry_index import GeometryContentsIndex
+from .future import Future
+from .shotgun_pool import ShotgunConnectionPool
+from .dispatcher import MainThreadDispatcher
+from .scheduler import CooperativeScheduler
@@ -0,0 +1,156 @@
+# Copyright (c) 2014 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Timing and profiling of the commands run from the Shotgun menu
+"""
+
+import os
+import re
+import time
+import bisect
+import cProfile
+import collections
+
+try:
+    # tracemalloc is only available for Python 2 if the pytracemalloc backport is installed:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+import sgtk
+
+# upper bounds in seconds of the buckets in the latency histogram.  The last bucket
+# holds everything slower than the final bound:
+HISTOGRAM_BOUNDS = [0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0]
+
+class CommandTimings(object):
+    """
+    Keeps a rolling history of the time taken by each run of each command.
+    """
+    def __init__(self, history_size=100):
+        """
+        Construction
+
+        :param history_size:    The number of runs to keep for each command
+        """
+        self.__history_size = history_size
+        self.__timings = {}
+
+    def record(self, name, seconds):
+        """
+        Record a run of a command
+
+        :param name:    The name of the command
+        :param seconds: The time taken to run the command
+        """
+        history = self.__timings.get(name)
+        if history is None:
+            history = collections.deque(maxlen=self.__history_size)
+            self.__timings[name] = history
+        history.append(seconds)
+
+    def commands(self):
+        """
+        :returns:   A list of the names of all commands that have been run
+        """
+        return sorted(self.__timings.keys())
+
+    def summary(self, name):
+        """
+        Summarise the recorded runs of a command.
+
+        :param name:    The name of the command
+        :returns:       A dictionary containing the "count" of runs in the history together
+                        with the "mean", "median", "p95" and "max" times and the "histogram" -
+                        a list of (upper bound, count) tuples where the final bound is None.
+                        None is returned if the command hasn't been run.
+        """
+        history = self.__timings.get(name)
+        if not history:
+            return None
+
+        ordered = sorted(history)
+        histogram = [0] * (len(HISTOGRAM_BOUNDS) + 1)
+        for seconds in ordered:
+            histogram[bisect.bisect_left(HISTOGRAM_BOUNDS, seconds)] += 1
+
+        return {
+            "count": len(ordered),
+            "mean": sum(ordered) / len(ordered),
+            "median": ordered[len(ordered) // 2],
+            "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+            "max": ordered[-1],
+            "histogram": zip(HISTOGRAM_BOUNDS + [None], histogram),
+        }
+
+class CommandProfiler(object):
+    """
+    Runs a single command under cProfile (and tracemalloc if available) when armed and
+    writes the results to disk.
+    """
+    def __init__(self, output_dir):
+        """
+        Construction
+
+        :param output_dir:  The directory to write the profile results to
+        """
+        self.__output_dir = output_dir
+        self.armed = False
+
+    def run(self, name, callback):
+        """
+        Run a command, profiling it if the profiler is armed.  The profiler is disarmed
+        once a command has been profiled.
+
+        :param name:        The name of the command
+        :param callback:    The callback to run
+        :returns:           The path of the profile stats written or None if the command
+                            wasn't profiled
+        """
+        if not self.armed:
+            callback()
+            return None
+        self.armed = False
+
+        engine = sgtk.platform.current_bundle()
+
+        try:
+            if not os.path.exists(self.__output_dir):
+                os.makedirs(self.__output_dir)
+        except Exception, e:
+            engine.log_error("Unable to profile '%s' - failed to create the profile directory '%s': %s"
+                             % (name, self.__output_dir, e))
+            callback()
+            return None
+        file_name = "%s_%s" % (re.sub(r"\W+", "_", name).strip("_"), time.strftime("%Y%m%d_%H%M%S"))
+        stats_path = os.path.join(self.__output_dir, "%s.prof" % file_name)
+
+        trace_memory = tracemalloc is not None and not tracemalloc.is_tracing()
+        if trace_memory:
+            tracemalloc.start()
+
+        profile = cProfile.Profile()
+        try:
+            profile.runcall(callback)
+        finally:
+            profile.dump_stats(stats_path)
+            engine.log_info("Profile stats for '%s' written to: %s" % (name, stats_path))
+
+            if trace_memory:
+                snapshot = tracemalloc.take_snapshot()
+                tracemalloc.stop()
+                memory_path = os.path.join(self.__output_dir, "%s_memory.txt" % file_name)
+                with open(memory_path, "w") as memory_file:
+                    for stat in snapshot.statistics("lineno")[:100]:
+                        memory_file.write("%s\n" % stat)
+                engine.log_info("Memory allocations for '%s' written to: %s" % (name, memory_path))
+
+        return stats_path
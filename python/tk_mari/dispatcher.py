@@ -0,0 +1,118 @@
+# Copyright (c) 2014 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Dispatching of Mari API calls from worker threads to the main thread
+"""
+
+import threading
+import collections
+
+from sgtk import TankError
+from sgtk.platform.qt import QtCore
+
+from .future import Future, run_to_future
+
+class MainThreadDispatcher(QtCore.QObject):
+    """
+    Runs calls queued from any thread on the Qt main thread, returning a Future for the
+    result of each call.
+
+    Calls queued while the main thread is busy are all run in the same pass through the
+    event loop so many small calls only cost a single event-loop hop.  Calls made from the
+    main thread itself are run immediately.
+    """
+    # signal emitted when work is queued and the queue was previously empty:
+    _work_queued = QtCore.Signal()
+
+    def __init__(self):
+        """
+        Construction - this must be done on the main thread
+        """
+        QtCore.QObject.__init__(self)
+        self.__queue = collections.deque()
+        self.__lock = threading.Lock()
+        self.__closed = False
+        self._work_queued.connect(self.__run_queued, QtCore.Qt.QueuedConnection)
+
+    def call(self, fn, *args, **kwargs):
+        """
+        Queue a call to be run on the main thread.
+
+        :param fn:  The function to call
+        :returns:   A Future for the result of the call
+        """
+        return self.call_many([(fn, args, kwargs)])[0]
+
+    def call_many(self, calls):
+        """
+        Queue a list of calls to be run on the main thread in a single pass.
+
+        :param calls:   A list of (function, args, kwargs) tuples
+        :returns:       A list of Futures, one for the result of each call
+        """
+        futures = [Future() for _ in calls]
+        work = [(f, fn, args, kwargs) for f, (fn, args, kwargs) in zip(futures, calls)]
+
+        if self.__is_main_thread():
+            # no need to queue anything:
+            for future, fn, args, kwargs in work:
+                run_to_future(future, fn, *args, **kwargs)
+            return futures
+
+        with self.__lock:
+            if self.__closed:
+                raise TankError("Unable to run calls on the main thread - the dispatcher has been closed!")
+            was_idle = not self.__queue
+            self.__queue.extend(work)
+        if was_idle:
+            self._work_queued.emit()
+        return futures
+
+    def call_sync(self, fn, *args, **kwargs):
+        """
+        Run a call on the main thread and wait for the result.
+
+        :param fn:  The function to call
+        :returns:   The result of the call
+        """
+        return self.call(fn, *args, **kwargs).result()
+
+    def close(self):
+        """
+        Stop accepting calls and fail any calls that haven't been run yet
+        """
+        with self.__lock:
+            self.__closed = True
+            pending = list(self.__queue)
+            self.__queue.clear()
+        for future, _, _, _ in pending:
+            future.set_exception_info((TankError, TankError("The main thread dispatcher was closed"), None))
+
+    def __is_main_thread(self):
+        """
+        :returns:   True if the current thread is the thread this dispatcher runs calls on or
+                    if there is no Qt application to run an event loop
+        """
+        app = QtCore.QCoreApplication.instance()
+        return not app or QtCore.QThread.currentThread() == app.thread()
+
+    def __run_queued(self):
+        """
+        Run all queued calls.  This is run on the main thread.
+        """
+        while True:
+            with self.__lock:
+                if not self.__queue:
+                    return
+                work = list(self.__queue)
+                self.__queue.clear()
+            for future, fn, args, kwargs in work:
+                run_to_future(future, fn, *args, **kwargs)
@@ -0,0 +1,178 @@
+# Copyright (c) 2014 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Non-modal reporting of error messages emitted by Toolkit in Mari
+"""
+
+import threading
+import contextlib
+import collections
+
+from sgtk.platform.qt import QtCore, QtGui
+
+class ErrorPanel(QtGui.QDialog):
+    """
+    Non-modal dialog listing all errors that have been reported.  Duplicate errors
+    are only listed once together with the number of times they were reported.
+    """
+    def __init__(self, parent=None):
+        """
+        Construction
+
+        :param parent:  The parent widget for the dialog
+        """
+        QtGui.QDialog.__init__(self, parent)
+        self.setModal(False)
+        self.setWindowTitle("Shotgun Errors")
+        self.resize(600, 300)
+
+        layout = QtGui.QVBoxLayout(self)
+        self.__summary_label = QtGui.QLabel(self)
+        layout.addWidget(self.__summary_label)
+        self.__error_list = QtGui.QListWidget(self)
+        self.__error_list.setWordWrap(True)
+        layout.addWidget(self.__error_list)
+
+        button_layout = QtGui.QHBoxLayout()
+        button_layout.addStretch()
+        self.__clear_btn = QtGui.QPushButton("Clear", self)
+        button_layout.addWidget(self.__clear_btn)
+        close_btn = QtGui.QPushButton("Close", self)
+        close_btn.clicked.connect(self.close)
+        button_layout.addWidget(close_btn)
+        layout.addLayout(button_layout)
+
+    @property
+    def clear_button(self):
+        """
+        The button used to clear the list of errors
+        """
+        return self.__clear_btn
+
+    def set_errors(self, errors):
+        """
+        Update the dialog with the specified errors
+
+        :param errors:  A list of (message, count) tuples in the order they were first reported
+        """
+        self.__error_list.clear()
+        for msg, count in errors:
+            if count > 1:
+                msg = "%s (x%d)" % (msg, count)
+            self.__error_list.addItem(msg)
+        self.__error_list.scrollToBottom()
+
+        total = sum([count for _, count in errors])
+        self.__summary_label.setText("%d error(s) reported, %d unique:" % (total, len(errors)))
+
+class ErrorReporter(QtCore.QObject):
+    """
+    Collects error messages and shows them in a single, non-modal, de-duplicated error panel
+    rather than a modal dialog for each error.
+
+    The panel is refreshed at most once every 'min_interval' milliseconds so that a burst of
+    errors doesn't swamp the UI.  Errors reported while inside a 'batch()' block are held until
+    the block exits and then shown in one go.
+    """
+
+    # signal used to marshal error notifications to the main thread:
+    _error_reported = QtCore.Signal()
+
+    def __init__(self, min_interval=1000, parent=None):
+        """
+        Construction
+
+        :param min_interval:    The minimum interval in milliseconds between refreshes of the panel
+        :param parent:          The parent widget to use for the error panel
+        """
+        QtCore.QObject.__init__(self)
+        self.__lock = threading.Lock()
+        self.__errors = collections.OrderedDict()
+        self.__batch_depth = 0
+        self.__panel = None
+        self.__panel_parent = parent
+
+        self.__timer = QtCore.QTimer(self)
+        self.__timer.setSingleShot(True)
+        self.__timer.setInterval(min_interval)
+        self.__timer.timeout.connect(self.__show_panel)
+
+        self._error_reported.connect(self.__on_error_reported)
+
+    def report(self, msg):
+        """
+        Report an error.  This is safe to call from any thread.
+
+        :param msg: The error message to report
+        """
+        with self.__lock:
+            self.__errors[msg] = self.__errors.get(msg, 0) + 1
+        self._error_reported.emit()
+
+    @contextlib.contextmanager
+    def batch(self):
+        """
+        Context manager that holds back the error panel until the end of a batch
+        operation so that all errors can be summarised once.
+        """
+        self.__batch_depth += 1
+        try:
+            yield
+        finally:
+            self.__batch_depth -= 1
+            if self.__batch_depth == 0:
+                self.__timer.stop()
+                self.__show_panel()
+
+    def clear(self):
+        """
+        Clear all errors that have been reported
+        """
+        with self.__lock:
+            self.__errors.clear()
+        if self.__panel:
+            self.__panel.set_errors([])
+
+    def close(self):
+        """
+        Stop any pending refresh and close the error panel
+        """
+        self.__timer.stop()
+        if self.__panel:
+            self.__panel.close()
+            self.__panel.deleteLater()
+            self.__panel = None
+
+    def __on_error_reported(self):
+        """
+        Called on the main thread whenever an error is reported.  Schedules a refresh
+        of the panel unless one is already pending or a batch is in progress.
+        """
+        if self.__batch_depth or self.__timer.isActive():
+            return
+        self.__timer.start()
+
+    def __show_panel(self):
+        """
+        Show the error panel with all errors reported so far
+        """
+        with self.__lock:
+            errors = self.__errors.items()
+        if not errors:
+            return
+
+        if not self.__panel:
+            self.__panel = ErrorPanel(self.__panel_parent or QtGui.QApplication.activeWindow())
+            self.__panel.clear_button.clicked.connect(self.clear)
+
+        self.__panel.set_errors(errors)
+        self.__panel.show()
+        self.__panel.raise_()
@@ -0,0 +1,131 @@
+# Copyright (c) 2014 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+A minimal future for the results of work run in other threads
+"""
+
+import sys
+import threading
+
+import sgtk
+from sgtk import TankError
+
+class Future(object):
+    """
+    Holds the result of some work that may not have completed yet.  This follows the
+    interface of concurrent.futures.Future which isn't available in Python 2.
+    """
+    def __init__(self):
+        """
+        Construction
+        """
+        self.__done = threading.Event()
+        self.__lock = threading.Lock()
+        self.__result = None
+        self.__exc_info = None
+        self.__callbacks = []
+
+    def done(self):
+        """
+        :returns:   True if the work has completed
+        """
+        return self.__done.is_set()
+
+    def result(self, timeout=None):
+        """
+        Get the result of the work, waiting for it to complete if needed.  If the work
+        raised an exception then this is re-raised here.
+
+        :param timeout: The maximum time in seconds to wait or None to wait indefinitely
+        :returns:       The result of the work
+        """
+        if not self.__done.wait(timeout):
+            raise TankError("Timed out waiting for the result after %s seconds" % timeout)
+        if self.__exc_info:
+            raise self.__exc_info[0], self.__exc_info[1], self.__exc_info[2]
+        return self.__result
+
+    def exception(self, timeout=None):
+        """
+        Get the exception raised by the work, waiting for it to complete if needed.
+
+        :param timeout: The maximum time in seconds to wait or None to wait indefinitely
+        :returns:       The exception raised or None if the work succeeded
+        """
+        if not self.__done.wait(timeout):
+            raise TankError("Timed out waiting for the result after %s seconds" % timeout)
+        return self.__exc_info[1] if self.__exc_info else None
+
+    def add_done_callback(self, callback):
+        """
+        Add a callback to run when the work completes.  The callback is passed this future
+        and is run in the thread that completes the work, or immediately if the work has
+        already completed.
+
+        :param callback:    The callback to run
+        """
+        with self.__lock:
+            if not self.__done.is_set():
+                self.__callbacks.append(callback)
+                return
+        self.__run_callback(callback)
+
+    def set_result(self, result):
+        """
+        Complete the future with a result
+
+        :param result:  The result of the work
+        """
+        self.__result = result
+        self.__complete()
+
+    def set_exception_info(self, exc_info):
+        """
+        Complete the future with an exception
+
+        :param exc_info:    The exception info as returned by sys.exc_info()
+        """
+        self.__exc_info = exc_info
+        self.__complete()
+
+    def __complete(self):
+        """
+        Mark the future as done and run any callbacks
+        """
+        with self.__lock:
+            self.__done.set()
+            callbacks = self.__callbacks
+            self.__callbacks = []
+        for callback in callbacks:
+            self.__run_callback(callback)
+
+    def __run_callback(self, callback):
+        """
+        Run a done callback, logging any errors
+        """
+        try:
+            callback(self)
+        except Exception, e:
+            sgtk.platform.current_bundle().log_exception("Future callback failed: %s" % e)
+
+def run_to_future(future, fn, *args, **kwargs):
+    """
+    Run a function and complete a future with its result or exception
+
+    :param future:  The Future to complete
+    :param fn:      The function to run
+    """
+    try:
+        result = fn(*args, **kwargs)
+    except Exception:
+        future.set_exception_info(sys.exc_info())
+    else:
+        future.set_result(result)
@@ -16,10 +16,31 @@ import sgtk
 from sgtk import TankError
 
 import os
+import time
+import Queue
+import threading
 import mari
 
 from .metadata import MetadataManager
 from .utils import update_publish_records, get_publish_type_field
+from .geometry_index import scan_geometry_file
+from .future import Future, run_to_future
+
+# the format version of the geometry manifest stored on projects.  Manifests stored with a
+# different format version are ignored and rebuilt:
+MANIFEST_FORMAT_VERSION = 1
+
+# the geometry manifests read by the engine, keyed by project uuid, and a counter that is
+# bumped whenever geo is added to or removed from a project.  These are shared by all
+# GeometryManager instances:
+_manifests = {}
+_geometry_change_count = 0
+
+# geometry files are read on a thread of their own rather than on the Shotgun connection
+# pool so that reading a large file doesn't hold up Shotgun queries:
+_scan_queue = Queue.Queue()
+_scan_thread = None
+_scan_lock = threading.Lock()
 
 class GeometryManager(object):
     """
@@ -30,6 +51,8 @@ class GeometryManager(object):
         Construction
         """
         self.__md_mgr = MetadataManager()
+        # proxy swaps that are waiting for, or loading, the full resolution publish:
+        self.__proxy_swaps = []
     
     def find_geometry_for_publish(self, sg_publish):
         """
@@ -50,9 +73,11 @@ class GeometryManager(object):
         publish_task = sg_publish["task"]
         
         # enumerate through all geometry in project that has Shotgun metadata:
+        manifest = self.get_geometry_manifest()
         found_geo = None
         sg_publish_version_ids = None
-        for geo, entity, task in [(g.get("geo"), g.get("entity"), g.get("task")) for g in self.list_geometry()]:
+        for geo, entity, task in [(g.get("geo"), g.get("entity"), g.get("task"))
+                                  for g in self.__list_geometry(manifest)]:
             if not geo:
                 continue
             
@@ -66,7 +91,7 @@ class GeometryManager(object):
             
             # enumerate through all versions of this geo that have Shotgun metadata:
             matches_geo = False
-            for version_item in self.list_geometry_versions(geo):
+            for version_item in self.__list_geometry_versions(geo, manifest):
                 geo_version = version_item.get("geo_version")
                 if not geo_version:
                     continue
@@ -97,8 +122,13 @@ class GeometryManager(object):
                         try:
                             sg_res = engine.shotgun.find(sg_publish["type"], filters, [])
                         except Exception, e:
-                            raise TankError("Failed to query publish versions for publish '%s': %s" 
-                                            % (sg_publish["name"], e))
+                            # fall back to any versions of the publish in the local cache:
+                            sg_res = self.__find_cached_publish_versions([sg_publish], publish_type_field)
+                            if sg_res is None:
+                                raise TankError("Failed to query publish versions for publish '%s': %s" 
+                                                % (sg_publish["name"], e))
+                            engine.log_warning("Failed to query publish versions for publish '%s', "
+                                               "using cached publishes instead: %s" % (sg_publish["name"], e))
                         sg_publish_version_ids = set([res["id"] for res in sg_res])
                         
                     if geo_version_publish_id in sg_publish_version_ids:
@@ -112,7 +142,120 @@ class GeometryManager(object):
                 
         # didn't find a match :(
         return (None, None)
-    
+
+    def find_stale_geometry(self):
+        """
+        Find all Shotgun aware geometry in the project whose current version isn't the latest
+        version published to Shotgun.
+
+        The publish lineage of every geo is read from the metadata in a single pass and Shotgun
+        is then queried once to resolve the publishes used by the geo and once to find the latest
+        version of every (entity, task, name, type) found, regardless of the number of geo in the
+        project.
+
+        :returns:   A list of dictionaries, one for each out of date geo, containing the "geo", its
+                    current "geo_version", the "sg_publish" the current version was loaded from and
+                    the "latest_publish" that is available in Shotgun.
+        """
+        engine = sgtk.platform.current_bundle()
+        publish_type_field = get_publish_type_field()
+
+        # find the publish id for the current version of each geo:
+        manifest = self.get_geometry_manifest()
+        current_versions = []
+        for geo in [g.get("geo") for g in self.__list_geometry(manifest)]:
+            if not geo:
+                continue
+            geo_version = geo.currentVersion()
+            if not geo_version:
+                continue
+            publish_id = None
+            for version_item in self.__list_geometry_versions(geo, manifest):
+                if version_item["geo_version"].name() == geo_version.name():
+                    publish_id = version_item.get("publish_id")
+                    break
+            if publish_id == None:
+                # can't do much without a publish id!
+                continue
+            current_versions.append((geo, geo_version, publish_id))
+
+        if not current_versions:
+            return []
+
+        # resolve the name, type, entity & task for all of the current publishes at once:
+        publish_entity_type = sgtk.util.get_published_file_entity_type(engine.sgtk)
+        sg_publishes = dict([(publish_id, {"type":publish_entity_type, "id":publish_id})
+                             for _, _, publish_id in current_versions])
+        update_publish_records(sg_publishes.values(), ["project", "entity", "task", "name",
+                                                       "version_number", publish_type_field])
+
+        # build the filters for a single query that will return every version of every publish
+        # in use in the project:
+        lineage_keys = set()
+        for sg_publish in sg_publishes.values():
+            if "name" in sg_publish:
+                lineage_keys.add(self.__get_publish_lineage_key(sg_publish, publish_type_field))
+        if not lineage_keys:
+            return []
+
+        projects = dict(((k[0], {"type":"Project", "id":k[0]}) for k in lineage_keys if k[0]))
+        filters = [["project", "in", projects.values()],
+                   ["name", "in", list(set([k[3] for k in lineage_keys]))]]
+        publish_types = set([k[4] for k in lineage_keys])
+        if None not in publish_types:
+            filters.append([publish_type_field, "in", list(publish_types)])
+        entities = set([k[1] for k in lineage_keys])
+        if None not in entities:
+            filters.append(["entity", "in", [{"type":t, "id":i} for t, i in entities]])
+        tasks = set([k[2] for k in lineage_keys])
+        if None not in tasks:
+            filters.append(["task", "in", [{"type":"Task", "id":i} for i in tasks]])
+
+        sg_res = []
+        try:
+            sg_res = engine.shotgun.find(publish_entity_type, filters,
+                                         ["project", "entity", "task", "name", "path", "version_number",
+                                          publish_type_field])
+        except Exception, e:
+            # fall back to the publishes in the local cache:
+            sg_res = self.__find_cached_publish_versions(sg_publishes.values(), publish_type_field)
+            if sg_res is None:
+                raise TankError("Failed to query the latest publish versions: %s" % e)
+            engine.log_warning("Failed to query the latest publish versions, using cached "
+                               "publishes instead: %s" % e)
+        else:
+            if engine.publish_cache:
+                engine.publish_cache.store(publish_entity_type, sg_res)
+
+        # find the latest publish for each lineage:
+        latest_publishes = {}
+        for sg_res_publish in sg_res:
+            key = self.__get_publish_lineage_key(sg_res_publish, publish_type_field)
+            if key not in lineage_keys:
+                continue
+            latest = latest_publishes.get(key)
+            if not latest or (sg_res_publish.get("version_number") or 0) > (latest.get("version_number") or 0):
+                latest_publishes[key] = sg_res_publish
+
+        # and finally, compare the current version of each geo with the latest version:
+        stale_geo = []
+        for geo, geo_version, publish_id in current_versions:
+            sg_publish = sg_publishes[publish_id]
+            if "name" not in sg_publish:
+                # the publish no longer exists in Shotgun!
+                continue
+            latest = latest_publishes.get(self.__get_publish_lineage_key(sg_publish, publish_type_field))
+            if not latest or latest["id"] == publish_id:
+                continue
+            if (latest.get("version_number") or 0) <= (sg_publish.get("version_number") or 0):
+                continue
+            stale_geo.append({"geo":geo,
+                              "geo_version":geo_version,
+                              "sg_publish":sg_publish,
+                              "latest_publish":latest})
+
+        return stale_geo
+
     def list_geometry(self):
         """
         Find all Shotgun aware geometry in the scene.  Any non-Shotgun aware geometry is ignored!
@@ -120,16 +263,7 @@ class GeometryManager(object):
         :returns:   A list of dictionaries containing the geo together with any Shotgun metadata
                     that was found on it
         """
-        all_geo = []
-        for geo in mari.geo.list():
-            metadata = self.__md_mgr.get_geo_metadata(geo)
-            if not metadata:
-                continue
-
-            metadata["geo"] = geo
-            all_geo.append(metadata)
-            
-        return all_geo
+        return self.__list_geometry(self.get_geometry_manifest())
     
     def list_geometry_versions(self, geo):
         """
@@ -140,17 +274,85 @@ class GeometryManager(object):
         :returns:   A list of dictionaries containing the geo_version together with any Shotgun metadata
                     that was found on it
         """
-        all_geo_versions = []
-        for geo_version in geo.versionList():
-            metadata = self.__md_mgr.get_geo_version_metadata(geo_version)
-            if not metadata:
-                continue
-            
-            metadata["geo_version"] = geo_version
-            all_geo_versions.append(metadata)
-            
-        return all_geo_versions
+        return self.__list_geometry_versions(geo, self.get_geometry_manifest())
+
+    def get_geometry_manifest(self, mari_project=None):
+        """
+        Get the manifest of all geometry in a project.  The manifest is stored in a single metadata
+        value on the project and is kept up to date as geometry is loaded, swapped and versioned
+        through the engine.  It's read once per project and then kept in memory - if it's missing,
+        or geo has been added or removed outside of the engine, then it's updated in memory from
+        the metadata on the geometry.  Reading the manifest never modifies the project; any
+        changes are stored the next time the engine writes geometry metadata.
+
+        :param mari_project:    The project to get the manifest for.  Defaults to the current project.
+        :returns:               The manifest dictionary or None if there is no project.  The "geo"
+                                entry maps each geo name to a dictionary containing the Shotgun
+                                "project", "entity" and "task" for the geo together with "versions",
+                                a dictionary mapping each version name to the "path", "publish_id"
+                                and "version" of the version.  Geo and versions that aren't Shotgun
+                                aware map to None.
+        """
+        mari_project = mari_project or mari.projects.current()
+        if not mari_project:
+            return None
+
+        cached = _manifests.get(mari_project.uuid())
+        if cached is None:
+            manifest = self.__read_manifest(mari_project)
+            if manifest is None:
+                sgtk.platform.current_bundle().log_debug("Building the geometry manifest for project '%s'"
+                                                         % mari_project.name())
+                manifest = self.__build_manifest()
+            else:
+                self.__sync_manifest(manifest)
+            cached = {"manifest":manifest, "change_count":_geometry_change_count}
+            _manifests[mari_project.uuid()] = cached
+        elif cached["change_count"] != _geometry_change_count:
+            self.__sync_manifest(cached["manifest"])
+            cached["change_count"] = _geometry_change_count
+        return cached["manifest"]
+
+    def geometry_changed(self, geo=None):
+        """
+        Note that geo has been added to or removed from the current project so that the manifest
+        is brought up to date the next time it's read.  The engine calls this from Mari's geo
+        signals.
+
+        :param geo: The Mari GeoEntity that was added or removed
+        """
+        global _geometry_change_count
+        _geometry_change_count += 1
+
+    def release_geometry_manifest(self, mari_project):
+        """
+        Forget the manifest held in memory for a project, e.g. when the project is closed
+
+        :param mari_project:    The mari Project to forget the manifest for
+        """
+        _manifests.pop(mari_project.uuid(), None)
     
+    def list_geometry_objects(self, sg_publish):
+        """
+        List the objects contained in a geometry publish, using the engine's geometry contents
+        index if available so that the file is only read the first time.  The file is read on a
+        background thread so that the main thread isn't blocked.  Files are read one at a time.
+
+        :param sg_publish:  The Shotgun publish to list the objects for.  This should be a Shotgun
+                            entity dictionary containing at least the entity "type" and "id".
+        :returns:           A Future for a list of dictionaries containing the "name", "polygons"
+                            and "uv_tiles" of each object, or None if the file format isn't
+                            supported
+        """
+        engine = sgtk.platform.current_bundle()
+
+        # ensure that sg_publish contains the information we need:
+        update_publish_records([sg_publish], min_fields = ["id", "path"])
+
+        publish_path = self.__get_publish_path(sg_publish)
+        return _submit_scan(_read_geometry_objects, engine.geometry_contents_index,
+                            sg_publish["id"], publish_path)
+
     def load_geometry(self, sg_publish, options, objects_to_load):
         """
         Wraps the Mari GeoManager.load() method and additionally tags newly loaded geometry with Shotgun 
@@ -184,10 +386,83 @@ class GeometryManager(object):
         
         # and initialize all new geo:
         for geo in new_geo:
-            self.initialise_new_geometry(geo, publish_path, sg_publish)
+            self.initialise_new_geometry(geo, publish_path, sg_publish, update_manifest=False)
+        self.__update_manifest(new_geo)
             
         return new_geo
 
+    def load_geometry_progressive(self, sg_publish, options, objects_to_load):
+        """
+        Load the latest proxy published for the same entity as sg_publish and then swap it for
+        sg_publish in the background once it's available on disk.  If there is no proxy then
+        sg_publish is loaded immediately.
+
+        :param sg_publish:      The shotgun publish to load.  This should be a Shotgun entity
+                                dictionary containing at least the entity "type" and "id".
+        :param options:         [Mari arg] - Options to be passed to the file loader when loading the geometry
+        :param objects_to_load: [Mari arg] - A list of objects to load from the full resolution file
+        :returns:               Tuple containing the list of GeoEntity instances that were loaded and
+                                a Future for the list of GeoEntity instances once the full resolution
+                                publish has been loaded
+        """
+        engine = sgtk.platform.current_bundle()
+
+        sg_proxy = self.__find_proxy_publish(sg_publish)
+        if not sg_proxy:
+            # nothing to be progressive with so just load the publish:
+            new_geo = self.load_geometry(sg_publish, options, objects_to_load)
+            future = Future()
+            future.set_result(new_geo)
+            return (new_geo, future)
+
+        engine.log_debug("Loading proxy '%s' v%03d while '%s' loads"
+                         % (sg_proxy["name"], sg_proxy.get("version_number") or 0, sg_publish["name"]))
+        proxy_geo = self.load_geometry(sg_proxy, options, None)
+
+        # remember the project and geo the proxy was loaded into so that the swap can be
+        # abandoned if either has gone by the time the full resolution publish is available:
+        swap = {"name":sg_publish["name"],
+                "project_uuid":mari.projects.current().uuid(),
+                "proxy_geo_names":[geo.name() for geo in proxy_geo],
+                "cancelled":threading.Event(),
+                "task":None,
+                "future":Future()}
+        self.__proxy_swaps = [s for s in self.__proxy_swaps if not s["future"].done()] + [swap]
+
+        # wait for the full resolution publish in the background and then swap it in on the
+        # main thread, a geo at a time:
+        def _on_available(available_future):
+            if swap["cancelled"].is_set():
+                return
+            if available_future.exception():
+                engine.log_warning("Keeping the proxy for '%s': %s"
+                                   % (sg_publish["name"], available_future.exception()))
+                _fail_swap(swap, available_future.exception())
+                return
+            try:
+                engine.main_thread_dispatcher.call(self.__schedule_proxy_swap, swap, sg_publish,
+                                                   options, objects_to_load)
+            except TankError, e:
+                _fail_swap(swap, e)
+        publish_path = self.__get_publish_path(sg_publish)
+        engine.shotgun_pool.submit(_wait_for_path, publish_path, engine.get_setting("proxy_swap_timeout"),
+                                   swap["cancelled"]).add_done_callback(_on_available)
+        return (proxy_geo, swap["future"])
+
+    def cancel_proxy_swaps(self):
+        """
+        Cancel all proxy swaps started by load_geometry_progressive that haven't completed yet,
+        e.g. because the project they were started in is being closed.  The proxies are left
+        in place.
+        """
+        swaps = self.__proxy_swaps
+        self.__proxy_swaps = []
+        for swap in swaps:
+            swap["cancelled"].set()
+            if swap["task"]:
+                swap["task"].cancel()
+            _fail_swap(swap, TankError("The swap of the proxy for '%s' was cancelled" % swap["name"]))
+
     def swap_geometry(self, geo, sg_publish, options):
         """
         Swap out an existing geometry for the new one in the path from sg_publish.
@@ -222,6 +497,8 @@ class GeometryManager(object):
         for geo_version in old_version_names:
             geo.removeVersion(geo_version)
 
+        self.__update_manifest([geo])
+
         return geo
 
     
@@ -271,10 +548,11 @@ class GeometryManager(object):
         
         # initialise the version:
         self.initialise_new_geometry_version(geo_version, publish_path, sg_publish)
+        self.__update_manifest([geo])
         
         return geo_version
 
-    def initialise_new_geometry(self, geo, publish_path, sg_publish):
+    def initialise_new_geometry(self, geo, publish_path, sg_publish, update_manifest=True):
         """
         Initialise a new geometry.  This sets the name and updates the Shotgun metadata
         of a geometry and the contained versions.
@@ -283,6 +561,9 @@ class GeometryManager(object):
         :param publish_path:    The path of the publish this geometry was loaded from
         :param sg_publish:      The Shotgun publish record for this geometry.  This should be a Shotgun
                                 entity dictionary containing at least the entity "type" and "id".
+        :param update_manifest: If True then the project's geometry manifest is updated with the geo.
+                                This can be disabled when initialising several geo at once and the
+                                manifest is updated separately.
         """
         self._update_geo_metadata(geo, publish_path, sg_publish)
 
@@ -295,6 +576,9 @@ class GeometryManager(object):
         # finally, initialize the geometry version:
         self.initialise_new_geometry_version(geo_versions[0], publish_path, sg_publish)
 
+        if update_manifest:
+            self.__update_manifest([geo])
+
     def _update_geo_metadata(self, geo, publish_path, sg_publish):
         """
         This sets the name and updates the Shotgun metadata.
@@ -358,6 +642,259 @@ class GeometryManager(object):
         # and store metadata:
         self.__md_mgr.set_geo_version_metadata(geo_version, publish_path, sg_publish_id, sg_version)  
 
+    def update_geometry_manifest(self, geos):
+        """
+        Update the entries for the specified geo in the current project's geometry manifest.  Entries
+        for geo that no longer exist are removed and any geo missing from the manifest is added.
+
+        :param geos:    The list of Mari GeoEntity instances whose Shotgun metadata has changed
+        """
+        self.__update_manifest(geos)
+
+    def __list_geometry(self, manifest):
+        """
+        Find all Shotgun aware geometry in the scene, using the manifest if available
+
+        :param manifest:    The geometry manifest for the current project or None
+        :returns:           A list of dictionaries containing the geo together with any Shotgun
+                            metadata that was found on it
+        """
+        all_geo = []
+        for geo in mari.geo.list():
+            if manifest is not None:
+                if geo.name() not in manifest["geo"]:
+                    # e.g. the geo was renamed outside of the engine:
+                    manifest["geo"][geo.name()] = self.__build_manifest_entry(geo)
+                entry = manifest["geo"][geo.name()]
+                metadata = dict([(k, v) for k, v in (entry or {}).iteritems() if k != "versions"])
+            else:
+                metadata = self.__md_mgr.get_geo_metadata(geo)
+            if not metadata:
+                continue
+
+            metadata["geo"] = geo
+            all_geo.append(metadata)
+            
+        return all_geo
+
+    def __list_geometry_versions(self, geo, manifest):
+        """
+        Find all Shotgun aware versions for the specified geometry, using the manifest if available
+
+        :param geo:         The Mari GeoEntity to find all versions for
+        :param manifest:    The geometry manifest for the current project or None
+        :returns:           A list of dictionaries containing the geo_version together with any
+                            Shotgun metadata that was found on it
+        """
+        versions = None
+        if manifest is not None:
+            versions = (manifest["geo"].get(geo.name()) or {}).get("versions")
+
+        all_geo_versions = []
+        for geo_version in geo.versionList():
+            if versions is not None:
+                if geo_version.name() not in versions:
+                    # e.g. the version was added outside of the engine:
+                    versions[geo_version.name()] = self.__md_mgr.get_geo_version_metadata(geo_version) or None
+                metadata = dict(versions[geo_version.name()] or {})
+            else:
+                metadata = self.__md_mgr.get_geo_version_metadata(geo_version)
+            if not metadata:
+                continue
+            
+            metadata["geo_version"] = geo_version
+            all_geo_versions.append(metadata)
+            
+        return all_geo_versions
+
+    def __read_manifest(self, mari_project):
+        """
+        Read the geometry manifest stored on a project
+
+        :param mari_project:    The project to read the manifest from
+        :returns:               The manifest or None if the project doesn't have a manifest in the
+                                current format
+        """
+        manifest = self.__md_mgr.get_geometry_manifest(mari_project)
+        if not manifest or manifest.get("format") != MANIFEST_FORMAT_VERSION:
+            return None
+        if not isinstance(manifest.get("geo"), dict):
+            return None
+        return manifest
+
+    def __sync_manifest(self, manifest):
+        """
+        Bring a manifest up to date with the geo in the current project, removing entries for geo
+        that no longer exist and adding entries for any geo that's missing.  Only the geo names are
+        compared - versions are checked as they are listed.
+
+        :param manifest:    The manifest to update in place
+        """
+        entries = manifest["geo"]
+        geo_names = set(mari.geo.names())
+        for name in [n for n in entries if n not in geo_names]:
+            del entries[name]
+        for name in [n for n in geo_names if n not in entries]:
+            entries[name] = self.__build_manifest_entry(mari.geo.find(name))
+
+    def __build_manifest(self):
+        """
+        Build the geometry manifest for the current project by walking the metadata on all geo
+        and versions
+
+        :returns:   The new manifest
+        """
+        return {"format":MANIFEST_FORMAT_VERSION,
+                "geo":dict([(geo.name(), self.__build_manifest_entry(geo)) for geo in mari.geo.list()])}
+
+    def __build_manifest_entry(self, geo):
+        """
+        Build the manifest entry for a geo from its metadata and the metadata of its versions
+
+        :param geo: The Mari GeoEntity to build the entry for
+        :returns:   The manifest entry or None if the geo isn't Shotgun aware
+        """
+        entry = self.__md_mgr.get_geo_metadata(geo)
+        if not entry:
+            return None
+        entry["versions"] = dict([(geo_version.name(), self.__md_mgr.get_geo_version_metadata(geo_version) or None)
+                                  for geo_version in geo.versionList()])
+        return entry
+
+    def __update_manifest(self, geos):
+        """
+        Update the entries for the specified geo in the current project's manifest and store it
+        on the project.  This is only called when the engine has modified geometry metadata.
+
+        :param geos:    The list of Mari GeoEntity instances to update the manifest for
+        """
+        mari_project = mari.projects.current()
+        if not mari_project:
+            return
+
+        # make sure any geo added or removed by the caller is picked up:
+        self.geometry_changed()
+        manifest = self.get_geometry_manifest(mari_project)
+        for geo in geos:
+            manifest["geo"][geo.name()] = self.__build_manifest_entry(geo)
+
+        self.__md_mgr.set_geometry_manifest(mari_project, manifest)
+
+    def __find_proxy_publish(self, sg_publish):
+        """
+        Find the latest proxy published for the same entity as a publish, preferring proxies
+        published with the same name.
+
+        :param sg_publish:  The full resolution publish to find the proxy for
+        :returns:           The proxy publish or None if there isn't one
+        """
+        engine = sgtk.platform.current_bundle()
+        proxy_types = engine.get_setting("proxy_geometry_publish_types")
+        if not proxy_types:
+            return None
+
+        publish_type_field = get_publish_type_field()
+        update_publish_records([sg_publish])
+        if not sg_publish.get("entity") or sg_publish.get(publish_type_field) in proxy_types:
+            return None
+
+        filters = [["project", "is", sg_publish["project"]],
+                   ["entity", "is", sg_publish["entity"]],
+                   [publish_type_field, "in", proxy_types]]
+        try:
+            sg_proxies = engine.shotgun.find(sg_publish["type"], filters,
+                                             ["project", "entity", "task", "name", "path", "version_number",
+                                              publish_type_field],
+                                             order=[{"field_name":"version_number", "direction":"desc"}])
+        except Exception, e:
+            engine.log_warning("Failed to find a proxy for publish '%s': %s" % (sg_publish["name"], e))
+            return None
+
+        sg_proxies = [p for p in sg_proxies if os.path.exists(self.__get_publish_path(p) or "")]
+        for sg_proxy in sg_proxies:
+            if sg_proxy["name"] == sg_publish["name"]:
+                return sg_proxy
+        return sg_proxies[0] if sg_proxies else None
+
+    def __schedule_proxy_swap(self, swap, sg_publish, options, objects_to_load):
+        """
+        Schedule the swap of proxy geometry for the full resolution publish.  This is run on the
+        main thread.
+
+        :param swap:            The proxy swap being run
+        :param sg_publish:      The full resolution publish
+        :param options:         [Mari arg] - Options to be passed to the file loader
+        :param objects_to_load: [Mari arg] - A list of objects to load from the full resolution file
+        """
+        if swap["cancelled"].is_set():
+            return
+
+        engine = sgtk.platform.current_bundle()
+        task = engine.scheduler.schedule(self.__swap_proxy_geometry(swap, sg_publish, options,
+                                                                    objects_to_load),
+                                         name="Swap proxy for '%s'" % sg_publish["name"])
+        swap["task"] = task
+        def _on_swapped(task_future):
+            if task_future.exception():
+                engine.log_warning("Keeping the proxy for '%s': %s" % (swap["name"], task_future.exception()))
+                _fail_swap(swap, task_future.exception())
+            elif not swap["future"].done():
+                swap["future"].set_result(task_future.result())
+        task.future.add_done_callback(_on_swapped)
+
+    def __swap_proxy_geometry(self, swap, sg_publish, options, objects_to_load):
+        """
+        Generator that swaps proxy geometry for the full resolution publish, yielding after each
+        geo.  A single proxy geo is swapped in place so that its channels, layers and shaders are
+        kept, otherwise the full resolution geometry is loaded alongside and the proxies removed.
+        The final value yielded is the list of full resolution GeoEntity instances.
+
+        The swap is abandoned if the project the proxy was loaded into is no longer the current
+        project or if none of the proxy geometry remains in it.
+
+        :param swap:            The proxy swap being run
+        :param sg_publish:      The full resolution publish
+        :param options:         [Mari arg] - Options to be passed to the file loader
+        :param objects_to_load: [Mari arg] - A list of objects to load from the full resolution file
+        """
+        engine = sgtk.platform.current_bundle()
+
+        _check_swap_project(swap)
+        current_geo = dict([(geo.name(), geo) for geo in mari.geo.list()])
+        proxy_geo = [current_geo[name] for name in swap["proxy_geo_names"] if name in current_geo]
+        if not proxy_geo:
+            raise TankError("None of the proxy geometry for '%s' remains in the project" % swap["name"])
+
+        if len(proxy_geo) == 1 and not objects_to_load:
+            geo = proxy_geo[0]
+            # rename a proxy version that would clash with the full resolution version:
+            renamed_versions = {}
+            version_name = "v%03d" % (sg_publish.get("version_number") or 0)
+            if version_name in geo.versionNames():
+                geo.version(version_name).setName("%s_proxy" % version_name)
+                renamed_versions["%s_proxy" % version_name] = version_name
+            try:
+                self.swap_geometry(geo, sg_publish, options)
+            except Exception:
+                # put the proxy back the way it was:
+                for proxy_version_name, original_name in renamed_versions.iteritems():
+                    if proxy_version_name in geo.versionNames():
+                        geo.version(proxy_version_name).setName(original_name)
+                raise
+            engine.log_debug("Swapped proxy geometry '%s' for the full resolution publish" % geo.name())
+            yield [geo]
+            return
+
+        new_geo = self.load_geometry(sg_publish, options, objects_to_load)
+        yield new_geo
+        for geo in proxy_geo:
+            _check_swap_project(swap)
+            if geo.name() in mari.geo.names():
+                mari.geo.remove(geo)
+            yield new_geo
+        self.__update_manifest([])
+        yield new_geo
+
     def __get_publish_path(self, sg_publish):
         """
         Get the publish path from a Shotgun publish record.
@@ -368,3 +905,129 @@ class GeometryManager(object):
         """
         return sg_publish.get("path", {}).get("local_path")
 
+    def __find_cached_publish_versions(self, sg_publishes, publish_type_field):
+        """
+        Find all versions of a list of publishes in the local publish cache.  This is used
+        when Shotgun can't be reached.
+
+        :param sg_publishes:        The publish records to find the versions of
+        :param publish_type_field:  The field containing the publish type name
+        :returns:                   A list of the cached publish records for all versions found,
+                                    or None if the publish cache isn't enabled
+        """
+        engine = sgtk.platform.current_bundle()
+        if not engine.publish_cache or not sg_publishes:
+            return None
+
+        lineage_keys = set([self.__get_publish_lineage_key(p, publish_type_field) for p in sg_publishes])
+        entity_type = sg_publishes[0]["type"]
+        return engine.publish_cache.find(
+            entity_type,
+            lambda r: self.__get_publish_lineage_key(r, publish_type_field) in lineage_keys)
+
+    def __get_publish_lineage_key(self, sg_publish, publish_type_field):
+        """
+        Get a key that identifies all versions of a publish.
+
+        :param sg_publish:          The Shotgun publish record to get the key for
+        :param publish_type_field:  The field containing the publish type name
+        :returns:                   Tuple of (project id, (entity type, entity id), task id, name, type)
+        """
+        project = sg_publish.get("project")
+        entity = sg_publish.get("entity")
+        task = sg_publish.get("task")
+        return ((project or {}).get("id"),
+                (entity["type"], entity["id"]) if entity else None,
+                task["id"] if task else None,
+                sg_publish.get("name"),
+                sg_publish.get(publish_type_field))
+
+
+def _wait_for_path(sg, path, timeout, cancelled):
+    """
+    Wait for a path to exist on disk.  This is run on a Shotgun pool worker thread.
+
+    :param sg:          The worker's Shotgun connection (unused)
+    :param path:        The path to wait for
+    :param timeout:     The maximum time in seconds to wait
+    :param cancelled:   A threading.Event that is set to stop waiting
+    """
+    wait_until = time.time() + timeout
+    while not path or not os.path.exists(path):
+        if time.time() > wait_until:
+            raise TankError("Timed out waiting for '%s' to become available" % path)
+        if cancelled.wait(1.0):
+            raise TankError("Stopped waiting for '%s' as the swap was cancelled" % path)
+
+def _submit_scan(fn, *args):
+    """
+    Run a function on the geometry scan thread, starting the thread if needed
+
+    :param fn:  The function to run
+    :returns:   A Future for the result of the function
+    """
+    global _scan_thread
+    future = Future()
+    with _scan_lock:
+        _scan_queue.put((future, fn, args))
+        if not _scan_thread or not _scan_thread.is_alive():
+            _scan_thread = threading.Thread(target=_run_scans, name="GeometryScanWorker")
+            _scan_thread.daemon = True
+            _scan_thread.start()
+    return future
+
+def _run_scans():
+    """
+    Geometry scan thread loop - runs queued scans until the queue has been empty for a while
+    """
+    global _scan_thread
+    while True:
+        try:
+            future, fn, args = _scan_queue.get(timeout=30)
+        except Queue.Empty:
+            with _scan_lock:
+                if _scan_queue.empty():
+                    _scan_thread = None
+                    return
+            continue
+        run_to_future(future, fn, *args)
+
+def _read_geometry_objects(contents_index, publish_id, path):
+    """
+    Read the objects contained in a geometry publish.  This is run on the geometry scan thread.
+
+    :param contents_index:  The GeometryContentsIndex to use or None to read the file directly
+    :param publish_id:      The id of the publish
+    :param path:            The path of the publish on disk
+    :returns:               The list of object dictionaries or None if the file format isn't
+                            supported
+    """
+    if not path or not os.path.exists(path):
+        raise TankError("Publish '%s' couldn't be found on disk!" % path)
+
+    try:
+        if contents_index:
+            return contents_index.get_contents(publish_id, path)
+        return scan_geometry_file(path)
+    except Exception, e:
+        raise TankError("Failed to read the objects in '%s': %s" % (path, e))
+
+def _check_swap_project(swap):
+    """
+    Check that the project a proxy swap was started in is still the current project
+
+    :param swap:    The proxy swap being run
+    """
+    mari_project = mari.projects.current()
+    if not mari_project or mari_project.uuid() != swap["project_uuid"]:
+        raise TankError("The project the proxy for '%s' was loaded into is no longer open" % swap["name"])
+
+def _fail_swap(swap, error):
+    """
+    Complete the Future of a proxy swap with an error if it hasn't already completed
+
+    :param swap:    The proxy swap that failed
+    :param error:   The exception to complete the Future with
+    """
+    if not swap["future"].done():
+        swap["future"].set_exception_info((TankError, error, None))
@@ -0,0 +1,211 @@
+# Copyright (c) 2014 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Local index of the objects contained in geometry publishes
+"""
+
+import os
+import json
+import time
+import array
+import sqlite3
+import threading
+import contextlib
+
+class GeometryContentsIndex(object):
+    """
+    A SQLite backed index of the objects contained in geometry publishes, keyed by publish id.
+    The contents of a publish are read from the file the first time they are requested and the
+    file's path, size and modification time are stored with them so that the contents are read
+    again if the publish path changes or the file changes on disk.
+    """
+    def __init__(self, db_path):
+        """
+        Construction
+
+        :param db_path: The path of the SQLite database file
+        """
+        self.__db_path = db_path
+        self.__lock = threading.Lock()
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+
+        with self.__connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS contents ("
+                         " publish_id INTEGER PRIMARY KEY,"
+                         " path TEXT NOT NULL,"
+                         " size INTEGER NOT NULL,"
+                         " mtime REAL NOT NULL,"
+                         " indexed_at REAL NOT NULL,"
+                         " data TEXT NOT NULL)")
+
+    def get_contents(self, publish_id, path):
+        """
+        Get the objects contained in a geometry publish, reading them from the file if they
+        aren't already indexed.
+
+        :param publish_id:  The id of the publish
+        :param path:        The path of the publish on disk
+        :returns:           A list of dictionaries, one for each object in the file, containing the
+                            object "name" together with the number of "polygons" and the list of
+                            "uv_tiles" (UDIM numbers) used by the object where these can be
+                            determined, otherwise None.  Returns None if the file format isn't
+                            supported.
+        """
+        stat = os.stat(path)
+        with self.__connect() as conn:
+            row = conn.execute("SELECT path, size, mtime, data FROM contents WHERE publish_id = ?",
+                               (publish_id,)).fetchone()
+        if row and row[0] == path and row[1] == stat.st_size and row[2] == stat.st_mtime:
+            return json.loads(row[3])
+
+        contents = scan_geometry_file(path)
+        if contents is None:
+            return None
+
+        with self.__connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO contents (publish_id, path, size, mtime, indexed_at, data)"
+                         " VALUES (?, ?, ?, ?, ?, ?)",
+                         (publish_id, path, stat.st_size, stat.st_mtime, time.time(), json.dumps(contents)))
+        return contents
+
+    @contextlib.contextmanager
+    def __connect(self):
+        """
+        Context manager that provides a connection to the database, committing any changes
+        when the block exits.  A new connection is used each time so that the index can be
+        used from any thread.
+        """
+        with self.__lock:
+            conn = sqlite3.connect(self.__db_path, timeout=30)
+            try:
+                yield conn
+                conn.commit()
+            finally:
+                conn.close()
+
+def scan_geometry_file(path):
+    """
+    Read the objects contained in a geometry file
+
+    :param path:    The path of the file to read
+    :returns:       A list of dictionaries describing each object in the file (see
+                    GeometryContentsIndex.get_contents) or None if the file format isn't supported
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".obj":
+        return _scan_obj(path)
+    elif ext == ".abc":
+        return _scan_alembic(path)
+    return None
+
+def _scan_obj(path):
+    """
+    Read the objects, polygon counts and UV tiles from an OBJ file.  Objects are defined by 'o'
+    statements, or by 'g' statements if the file doesn't contain any objects.
+
+    :param path:    The path of the OBJ file
+    :returns:       A list of object dictionaries
+    """
+    # coordinates of each texture vertex, indexed from 1 as in the file:
+    vt_u = array.array("d", [0.0])
+    vt_v = array.array("d", [0.0])
+    objects = {"o":{}, "g":{}}
+    order = {"o":[], "g":[]}
+    current = {"o":None, "g":None}
+
+    def _get_object(kind, name):
+        obj = objects[kind].get(name)
+        if obj is None:
+            obj = {"name":name, "polygons":0, "uv_tiles":set()}
+            objects[kind][name] = obj
+            order[kind].append(name)
+        return obj
+
+    with open(path, "r") as obj_file:
+        for line in obj_file:
+            if line.startswith("vt "):
+                parts = line.split()
+                try:
+                    vt_u.append(float(parts[1]))
+                    vt_v.append(float(parts[2]) if len(parts) > 2 else 0.0)
+                except (ValueError, IndexError):
+                    vt_u.append(-1.0)
+                    vt_v.append(-1.0)
+            elif line.startswith("f "):
+                # the tile of a face is the tile containing the centre of its UVs:
+                u_sum = v_sum = 0.0
+                num_uvs = 0
+                for vertex in line.split()[1:]:
+                    indices = vertex.split("/")
+                    if len(indices) > 1 and indices[1]:
+                        vt_index = int(indices[1])
+                        if vt_index < 0:
+                            vt_index += len(vt_u)
+                        u_sum += vt_u[vt_index]
+                        v_sum += vt_v[vt_index]
+                        num_uvs += 1
+                tile = None
+                if num_uvs:
+                    u, v = u_sum / num_uvs, v_sum / num_uvs
+                    if 0.0 <= u < 10.0 and v >= 0.0:
+                        tile = 1001 + int(u) + 10 * int(v)
+                for kind in ("o", "g"):
+                    obj = current[kind] or _get_object(kind, "default")
+                    current[kind] = obj
+                    obj["polygons"] += 1
+                    if tile:
+                        obj["uv_tiles"].add(tile)
+            elif line.startswith("o "):
+                current["o"] = _get_object("o", line[2:].strip())
+            elif line.startswith("g "):
+                current["g"] = _get_object("g", line[2:].strip() or "default")
+
+    kind = "o" if [n for n in order["o"] if n != "default"] else "g"
+    contents = []
+    for name in order[kind]:
+        obj = objects[kind][name]
+        if not obj["polygons"]:
+            continue
+        contents.append({"name":name, "polygons":obj["polygons"], "uv_tiles":sorted(obj["uv_tiles"])})
+    return contents
+
+def _scan_alembic(path):
+    """
+    Read the meshes and polygon counts from an Alembic file.  This requires the Alembic Python
+    bindings - if they aren't available then the file can't be indexed.  UV tiles aren't read
+    as this would require reading all UV samples in the file.
+
+    :param path:    The path of the Alembic file
+    :returns:       A list of object dictionaries or None if Alembic isn't available
+    """
+    try:
+        import alembic
+    except ImportError:
+        return None
+
+    contents = []
+    archive = alembic.Abc.IArchive(path)
+    to_visit = [archive.getTop()]
+    while to_visit:
+        obj = to_visit.pop(0)
+        if alembic.AbcGeom.IPolyMesh.matches(obj.getMetaData()):
+            mesh = alembic.AbcGeom.IPolyMesh(obj, alembic.Abc.WrapExistingFlag.kWrapExisting)
+            polygons = None
+            try:
+                polygons = len(mesh.getSchema().getValue().getFaceCounts())
+            except Exception:
+                pass
+            contents.append({"name":obj.getName(), "polygons":polygons, "uv_tiles":None})
+        to_visit.extend([obj.getChild(i) for i in range(obj.getNumChildren())])
+    return contents
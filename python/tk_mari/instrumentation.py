@@ -0,0 +1,262 @@
+# Copyright (c) 2014 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Instrumentation used to count the calls made from Python into the Mari API
+"""
+
+import os
+import sys
+import time
+import threading
+
+from sgtk.platform.qt import QtCore
+
+import mari
+
+# the attributes of the mari module that are replaced by tracing proxies.  Mari objects
+# returned by calls made through these are also wrapped so that calls on geo, channels,
+# layers, etc. are counted as well:
+TRACED_MARI_ATTRS = ["app", "actions", "current", "geo", "history", "menus",
+                     "palettes", "projects", "resources", "session"]
+
+# types that are never wrapped when returned from the Mari API:
+_UNWRAPPED_TYPES = (basestring, int, long, float, bool, dict, type(None), QtCore.QObject)
+
+class _TracingProxy(object):
+    """
+    Proxy that wraps a Mari object and counts all method calls made through it.  The proxy
+    reports the class of the wrapped object so isinstance() checks continue to work.
+    """
+    def __init__(self, target, tracer):
+        object.__setattr__(self, "_target", target)
+        object.__setattr__(self, "_tracer", tracer)
+
+    @property
+    def __class__(self):
+        return type(object.__getattribute__(self, "_target"))
+
+    def __getattr__(self, name):
+        target = object.__getattribute__(self, "_target")
+        value = getattr(target, name)
+        if not callable(value) or "signal" in type(value).__name__.lower():
+            # plain attributes and signals are returned as is so that they can be
+            # connected to with mari.utils.connect:
+            return value
+        tracer = object.__getattribute__(self, "_tracer")
+        if not tracer.active:
+            # nothing is being recorded so there is no need to wrap the method:
+            return value
+        return tracer.wrap_method(value, "%s.%s" % (type(target).__name__, name))
+
+    def __setattr__(self, name, value):
+        setattr(object.__getattribute__(self, "_target"), name, value)
+
+    def __eq__(self, other):
+        return object.__getattribute__(self, "_target") == _unwrap(other)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash(object.__getattribute__(self, "_target"))
+
+    def __repr__(self):
+        return repr(object.__getattribute__(self, "_target"))
+
+def _unwrap(value):
+    """
+    Replace any tracing proxies in a value with the objects they wrap so that they
+    can be passed to the Mari API.
+
+    :param value:   The value to unwrap
+    :returns:       The unwrapped value
+    """
+    if type(value) is _TracingProxy:
+        return object.__getattribute__(value, "_target")
+    elif isinstance(value, list):
+        return [_unwrap(v) for v in value]
+    elif isinstance(value, tuple):
+        return tuple([_unwrap(v) for v in value])
+    return value
+
+class MariApiTracer(object):
+    """
+    Counts the number of calls and the cumulative time spent in each Mari API method,
+    broken down by the Python function that made the call.
+
+    Calls are only recorded, and Mari objects returned from the API are only wrapped, while at
+    least one named scope is active, e.g. for the duration of an engine command or a publish.
+    Scopes may overlap, in which case calls are recorded in each of them.  A scope can be paused
+    so that it only records calls made while a particular piece of code is running.
+    """
+    def __init__(self):
+        """
+        Construction
+        """
+        self.__original_attrs = {}
+        self.__scopes = {}
+        self.__paused_scopes = {}
+        self.__lock = threading.Lock()
+        self.__this_file = os.path.splitext(os.path.abspath(__file__))[0]
+
+    def install(self):
+        """
+        Replace the traced attributes of the mari module with tracing proxies
+        """
+        for attr in TRACED_MARI_ATTRS:
+            if attr in self.__original_attrs or not hasattr(mari, attr):
+                continue
+            original = getattr(mari, attr)
+            self.__original_attrs[attr] = original
+            setattr(mari, attr, _TracingProxy(original, self))
+
+    def uninstall(self):
+        """
+        Restore the original attributes of the mari module
+        """
+        for attr, original in self.__original_attrs.iteritems():
+            setattr(mari, attr, original)
+        self.__original_attrs = {}
+
+    @property
+    def active(self):
+        """
+        True if calls are currently being recorded in at least one scope
+        """
+        return bool(self.__scopes)
+
+    def start_scope(self, name):
+        """
+        Start recording calls in a named scope.  Starting a scope that is already active
+        or paused resets it.
+
+        :param name:    The name of the scope, e.g. the command being run
+        """
+        with self.__lock:
+            self.__paused_scopes.pop(name, None)
+            self.__scopes[name] = {"start_time": time.time(), "calls": {}}
+
+    def pause_scope(self, name):
+        """
+        Stop recording calls in a named scope without ending it.  Calls recorded so far are
+        kept until the scope is resumed or stopped.
+
+        :param name:    The name of the scope
+        """
+        with self.__lock:
+            if name in self.__scopes:
+                self.__paused_scopes[name] = self.__scopes.pop(name)
+
+    def resume_scope(self, name):
+        """
+        Resume recording calls in a paused scope.  This does nothing if the scope isn't paused.
+
+        :param name:    The name of the scope
+        """
+        with self.__lock:
+            if name in self.__paused_scopes:
+                self.__scopes[name] = self.__paused_scopes.pop(name)
+
+    def stop_scope(self, name):
+        """
+        Stop recording calls in a named scope.
+
+        :param name:    The name of the scope
+        :returns:       A dictionary containing the "duration" of the scope and the "calls"
+                        recorded, keyed by (api method, calling function) with each value a
+                        list of [call count, cumulative seconds].  None is returned if the
+                        scope wasn't active or paused.
+        """
+        with self.__lock:
+            scope = self.__scopes.pop(name, None) or self.__paused_scopes.pop(name, None)
+        if not scope:
+            return None
+        return {"duration": time.time() - scope["start_time"], "calls": scope["calls"]}
+
+    def wrap_method(self, method, api_name):
+        """
+        Wrap a Mari API method so that calls to it are recorded.
+
+        :param method:      The bound method to wrap
+        :param api_name:    The name to record calls against, e.g. "GeoEntity.metadata"
+        :returns:           The wrapped method
+        """
+        def traced_method(*args, **kwargs):
+            args = _unwrap(args)
+            kwargs = dict([(k, _unwrap(v)) for k, v in kwargs.iteritems()])
+            if not self.__scopes:
+                return method(*args, **kwargs)
+
+            start_time = time.time()
+            try:
+                result = method(*args, **kwargs)
+            finally:
+                self.__record(api_name, time.time() - start_time)
+            return self.__wrap_result(result)
+        return traced_method
+
+    def __wrap_result(self, result):
+        """
+        Wrap any Mari objects returned from the Mari API with tracing proxies
+
+        :param result:  The value returned from the API call
+        :returns:       The wrapped value
+        """
+        if isinstance(result, _UNWRAPPED_TYPES) or type(result) is _TracingProxy:
+            return result
+        elif isinstance(result, list):
+            return [self.__wrap_result(r) for r in result]
+        elif isinstance(result, tuple):
+            return tuple([self.__wrap_result(r) for r in result])
+        return _TracingProxy(result, self)
+
+    def __record(self, api_name, seconds):
+        """
+        Record a call in all active scopes against the first calling function found
+        outside of this module.
+
+        :param api_name:    The name of the API method called
+        :param seconds:     The time taken by the call
+        """
+        caller = "<unknown>"
+        frame = sys._getframe(1)
+        while frame:
+            file_path = os.path.splitext(os.path.abspath(frame.f_code.co_filename))[0]
+            if file_path != self.__this_file:
+                caller = "%s:%s" % (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name)
+                break
+            frame = frame.f_back
+
+        key = (api_name, caller)
+        with self.__lock:
+            for scope in self.__scopes.values():
+                stats = scope["calls"].setdefault(key, [0, 0.0])
+                stats[0] += 1
+                stats[1] += seconds
+
+def format_api_trace(trace, limit=30):
+    """
+    Format the calls recorded for a scope as a table, busiest first.
+
+    :param trace:   The dictionary returned by MariApiTracer.stop_scope()
+    :param limit:   The maximum number of rows to include
+    :returns:       The formatted table
+    """
+    calls = sorted(trace["calls"].items(), key=lambda (k, v): (-v[0], -v[1]))
+    rows = [("Calls", "Time (s)", "API method", "Caller")]
+    for (api_name, caller), (count, seconds) in calls[:limit]:
+        rows.append((str(count), "%.3f" % seconds, api_name, caller))
+    if len(calls) > limit:
+        rows.append(("...", "", "%d more" % (len(calls) - limit), ""))
+
+    widths = [max([len(row[c]) for row in rows]) for c in range(len(rows[0]))]
+    return "\n".join(["  ".join([cell.ljust(width) for cell, width in zip(row, widths)]).rstrip()
+                      for row in rows])
@@ -0,0 +1,102 @@
+# Copyright (c) 2014 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Log sinks used by the engine to write log messages to the Mari script console and to disk
+"""
+
+import os
+import logging
+import logging.handlers
+import threading
+import collections
+
+from sgtk.platform.qt import QtCore
+
+class ConsoleLogSink(object):
+    """
+    Buffers log messages and writes them to the Mari script console in batches.
+
+    Mari's script console gets very slow once it holds a lot of lines so rather than
+    writing each message as it's emitted, messages are queued and written together
+    at a fixed interval from the main thread.  The queue is bounded so that a flood
+    of messages can't grow without limit - when full, the oldest messages are dropped
+    and a note of how many were dropped is written instead.
+    """
+    def __init__(self, flush_interval=250, max_messages=2000):
+        """
+        Construction
+
+        :param flush_interval:  The interval in milliseconds between writes to the console
+        :param max_messages:    The maximum number of messages to buffer between writes
+        """
+        self.__lock = threading.Lock()
+        self.__messages = collections.deque(maxlen=max(max_messages, 1))
+        self.__dropped = 0
+
+        self.__timer = QtCore.QTimer()
+        self.__timer.setInterval(flush_interval)
+        self.__timer.timeout.connect(self.flush)
+        self.__timer.start()
+
+    def write(self, msg):
+        """
+        Queue a message to be written to the console.  This is safe to call from any thread.
+
+        :param msg: The formatted message to write
+        """
+        with self.__lock:
+            if len(self.__messages) == self.__messages.maxlen:
+                self.__dropped += 1
+            self.__messages.append(msg)
+
+    def flush(self):
+        """
+        Write all queued messages to the console in a single write.  This must be called
+        from the main thread.
+        """
+        with self.__lock:
+            if not self.__messages:
+                return
+            messages = list(self.__messages)
+            self.__messages.clear()
+            dropped = self.__dropped
+            self.__dropped = 0
+
+        if dropped:
+            messages.insert(0, "Shotgun: %d log messages were dropped!" % dropped)
+
+        print "\n".join(messages)
+
+    def close(self):
+        """
+        Stop the flush timer and write any remaining messages to the console
+        """
+        self.__timer.stop()
+        self.flush()
+
+def create_file_log_handler(path, max_bytes, backup_count):
+    """
+    Create a rotating log file handler that writes full log records to disk.
+
+    :param path:            The path of the log file to write to.  Environment variables and
+                            '~' are expanded.
+    :param max_bytes:       The size in bytes at which the log file is rolled over
+    :param backup_count:    The number of rolled over log files to keep
+    :returns:               A logging.Handler instance
+    """
+    path = os.path.expanduser(os.path.expandvars(path))
+    log_dir = os.path.dirname(path)
+    if log_dir and not os.path.exists(log_dir):
+        os.makedirs(log_dir)
+
+    handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count)
+    handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s %(name)s] %(message)s"))
+    return handler
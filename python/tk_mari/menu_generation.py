@@ -41,12 +41,15 @@ class ActionFactory(object):
     # Mari can find and execute them
     ACTION_COMMANDS_ATTR = "_shotgun_menu_callbacks"
     
-    def create_action(self, name, callback):
+    def create_action(self, name, callback, instrument=True):
         """
         Create a Mari action for the specified callback
         
         :param name:        The name of the action/Toolkit command
         :param callback:    The callback that should be run when the action is executed
+        :param instrument:  If True then the engine times and, if requested, profiles the
+                            command.  This should be disabled for commands that control the
+                            instrumentation itself.
         
         :returns:           A Mari Action that will execute the Toolkit callback
         """
@@ -60,11 +63,19 @@ class ActionFactory(object):
         action_id = self.__action_id
         self.__action_id += 1
 
+        def run_command():
+            if not instrument:
+                callback()
+                return
+            # let the engine time/profile the command:
+            engine = sgtk.platform.current_engine()
+            engine.execute_menu_command(name, callback)
+
         # store the callback in the dictionary of commands on the mari module.  Use
         # a QTimer single shot event to ensure that command execution is completely
         # separated from the action of clicking the menu.
         all_commands = getattr(mari, ActionFactory.ACTION_COMMANDS_ATTR)
-        all_commands[action_id] = lambda: QtCore.QTimer.singleShot(100, callback)
+        all_commands[action_id] = lambda: QtCore.QTimer.singleShot(100, run_command)
         setattr(mari, ActionFactory.ACTION_COMMANDS_ATTR, all_commands)
         callback_string = "mari.%s[%d]()" % (ActionFactory.ACTION_COMMANDS_ATTR, action_id)
         
@@ -126,6 +137,12 @@ class MenuGenerator(object):
 
         self.__build_app_menu(commands_by_app, shotgun_menu)
 
+        # add the developer commands:
+        mari.menus.addSeparator(shotgun_menu)
+        action = self.__action_factory.create_action("Profile Next Command",
+                                                     self._engine.toggle_command_profiling,
+                                                     instrument=False)
+        mari.menus.addAction(action, shotgun_menu)
 
     def destroy_menu(self):
         """
@@ -157,7 +174,7 @@ class MenuGenerator(object):
         actions = mari.menus.actions(MenuGenerator.MAIN_MENU_SET, MenuGenerator.SHOTGUN_MENU_ROOT)
         for action in actions:
             mari.menus.removeAction("%s/%s/%s" % (MenuGenerator.MAIN_MENU_SET, MenuGenerator.SHOTGUN_MENU_ROOT, 
-                                                  action.name()))        
+                                                  action.name()))
 
     def _jump_to_sg(self):
         """
@@ -44,6 +44,8 @@ for geo in mari.geo.list():
         print "     - %s" % geo_version.metadata("tk_version")
 """
 
+import json
+
 import mari
 
 class MetadataManager(object):
@@ -62,6 +64,11 @@ class MetadataManager(object):
         "version":{"display_name":"Project Version", "visible":True}
     }
 
+    # Metadata definition for the manifest of Shotgun geometry stored on a Mari Project entity
+    __PROJECT_MANIFEST_METADATA_INFO = {
+        "geometry_manifest":{"display_name":"Shotgun Geometry Manifest", "visible":False}
+    }
+
     # Shotgun metadata definition for a Mari GeoEntity entity
     __GEO_METADATA_INFO = {
         "project_id":{"display_name":"Shotgun Project Id", "visible":False},
@@ -184,6 +191,33 @@ class MetadataManager(object):
         """
         return self.__get_metadata(mari_project, MetadataManager.__PROJECT_METADATA_INFO)
 
+    def set_geometry_manifest(self, mari_project, manifest):
+        """
+        Set the manifest of Shotgun geometry on a project
+
+        :param mari_project:    The mari project entity to set the manifest on
+        :param manifest:        The manifest dictionary to store
+        """
+        metadata = {"geometry_manifest":json.dumps(manifest)}
+        self.__set_metadata(mari_project, metadata, MetadataManager.__PROJECT_MANIFEST_METADATA_INFO)
+
+    def get_geometry_manifest(self, mari_project):
+        """
+        Get the manifest of Shotgun geometry stored on a project
+
+        :param mari_project:    The mari project entity to retrieve the manifest from
+        :returns:               The manifest dictionary or None if the project doesn't have a
+                                valid manifest
+        """
+        metadata = self.__get_metadata(mari_project, MetadataManager.__PROJECT_MANIFEST_METADATA_INFO)
+        if not metadata.get("geometry_manifest"):
+            return None
+        try:
+            manifest = json.loads(metadata["geometry_manifest"])
+        except ValueError:
+            return None
+        return manifest if isinstance(manifest, dict) else None
+
     def set_geo_metadata(self, geo, project, entity, task):
         """
         Set the Toolkit metadata on a GeoEntity
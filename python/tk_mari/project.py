@@ -97,16 +97,33 @@ class ProjectManager(object):
         self.md_mgr.set_project_metadata(new_project, engine.context)
         self.md_mgr.set_project_version(new_project, 1)
         
-        # update the metadata, name and version on the geometry that was
-        # loaded as part of the project creation:
+        # update the metadata, name and version on the geometry that was loaded as part
+        # of the project creation and then load in any additional geometry that was
+        # selected, letting Mari redraw between each geo:
+        engine.scheduler.run_sync(self.__initialise_project_geometry(sg_publishes, publish_path,
+                                                                     project_meta_options, objects_to_load),
+                                  "Initialise project geometry")
+            
+        return new_project
+
+    def __initialise_project_geometry(self, sg_publishes, publish_path, project_meta_options, objects_to_load):
+        """
+        Generator that tags the geometry loaded when a project is created and loads any
+        additional geometry, yielding after each geo.
+
+        :param sg_publishes:            The list of publishes the project is being created with
+        :param publish_path:            The path of the first publish that the project was created from
+        :param project_meta_options:    [Mari arg] - A dictionary of project creation meta options
+        :param objects_to_load:         [Mari arg] - A list of objects to load from the files
+        """
         for geo in mari.geo.list():
-            self.geo_mgr.initialise_new_geometry(geo, publish_path, sg_publishes[0])
-        
-        # finally, load in any additional geometry that was selected:
+            self.geo_mgr.initialise_new_geometry(geo, publish_path, sg_publishes[0], update_manifest=False)
+            yield
+        self.geo_mgr.update_geometry_manifest(mari.geo.list())
+
         for sg_publish in sg_publishes[1:]:
             self.geo_mgr.load_geometry(sg_publish, project_meta_options, objects_to_load)
-            
-        return new_project
+            yield
 
 
 
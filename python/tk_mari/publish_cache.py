@@ -0,0 +1,163 @@
+# Copyright (c) 2014 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Local cache of the Shotgun publish records used by the engine
+"""
+
+import os
+import json
+import time
+import sqlite3
+import calendar
+import datetime
+import threading
+import contextlib
+
+class PublishCache(object):
+    """
+    A SQLite backed store of Shotgun publish records.  Each record is stored together with
+    its Shotgun 'updated_at' time and the time it was last fetched so that records can be
+    refreshed incrementally and used when Shotgun can't be reached.
+    """
+    def __init__(self, db_path, max_age=300):
+        """
+        Construction
+
+        :param db_path: The path of the SQLite database file
+        :param max_age: The time in seconds a record can be used for after it was fetched
+                        before it should be checked for changes in Shotgun
+        """
+        self.__db_path = db_path
+        self.__max_age = max_age
+        self.__lock = threading.Lock()
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+
+        with self.__connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS publishes ("
+                         " entity_type TEXT NOT NULL,"
+                         " id INTEGER NOT NULL,"
+                         " updated_at REAL,"
+                         " fetched_at REAL NOT NULL,"
+                         " data TEXT NOT NULL,"
+                         " PRIMARY KEY (entity_type, id))")
+
+    @property
+    def max_age(self):
+        """
+        The time in seconds a record can be used for before it should be refreshed
+        """
+        return self.__max_age
+
+    def get(self, entity_type, ids):
+        """
+        Get the cached records for a list of publishes.
+
+        :param entity_type: The publish entity type
+        :param ids:         The ids of the publishes to get
+        :returns:           A dictionary of (record, updated_at, fetched_at) tuples keyed by
+                            id for all publishes found in the cache
+        """
+        ids = list(ids)
+        cached = {}
+        with self.__connect() as conn:
+            # query in chunks to stay within SQLite's variable limit:
+            for i in range(0, len(ids), 500):
+                chunk = ids[i:i+500]
+                rows = conn.execute("SELECT id, updated_at, fetched_at, data FROM publishes"
+                                    " WHERE entity_type = ? AND id IN (%s)" % ",".join(["?"] * len(chunk)),
+                                    [entity_type] + chunk)
+                for publish_id, updated_at, fetched_at, data in rows:
+                    cached[publish_id] = (json.loads(data), updated_at, fetched_at)
+        return cached
+
+    def find(self, entity_type, match_fn):
+        """
+        Find cached records of a publish entity type.  This is used when Shotgun can't be
+        queried so scans all records of the type.
+
+        :param entity_type: The publish entity type
+        :param match_fn:    Function that is passed each record and returns True if it matches
+        :returns:           A list of matching records
+        """
+        with self.__connect() as conn:
+            rows = conn.execute("SELECT data FROM publishes WHERE entity_type = ?", (entity_type,))
+            records = [json.loads(data) for (data,) in rows]
+        return [r for r in records if match_fn(r)]
+
+    def store(self, entity_type, records, touched_ids=None):
+        """
+        Store publish records from Shotgun, merging them with any fields already cached.
+
+        :param entity_type: The publish entity type
+        :param records:     The records returned from Shotgun
+        :param touched_ids: Ids of cached records that were checked against Shotgun and found
+                            to be unchanged.  Their fetch time is reset.
+        """
+        now = time.time()
+        records = list(records)
+        existing = self.get(entity_type, [r["id"] for r in records])
+        with self.__connect() as conn:
+            for record in records:
+                data = dict(existing.get(record["id"], ({}, None, None))[0])
+                data.update(record)
+                updated_at = _to_timestamp(data.get("updated_at"))
+                conn.execute("INSERT OR REPLACE INTO publishes (entity_type, id, updated_at, fetched_at, data)"
+                             " VALUES (?, ?, ?, ?, ?)",
+                             (entity_type, record["id"], updated_at, now,
+                              json.dumps(data, default=_json_default)))
+            touched_ids = list(set(touched_ids or []) - set([r["id"] for r in records]))
+            for i in range(0, len(touched_ids), 500):
+                chunk = touched_ids[i:i+500]
+                conn.execute("UPDATE publishes SET fetched_at = ?"
+                             " WHERE entity_type = ? AND id IN (%s)" % ",".join(["?"] * len(chunk)),
+                             [now, entity_type] + chunk)
+
+    @contextlib.contextmanager
+    def __connect(self):
+        """
+        Context manager that provides a connection to the database, committing any changes
+        when the block exits.  A new connection is used each time so that the cache can be
+        used from any thread.
+        """
+        with self.__lock:
+            conn = sqlite3.connect(self.__db_path, timeout=30)
+            try:
+                yield conn
+                conn.commit()
+            finally:
+                conn.close()
+
+def _to_timestamp(value):
+    """
+    Convert a Shotgun datetime to seconds since the epoch
+
+    :param value:   The datetime value, or a timestamp already converted
+    :returns:       The timestamp or None
+    """
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo:
+            return calendar.timegm(value.utctimetuple())
+        return time.mktime(value.timetuple())
+    elif isinstance(value, (int, long, float)):
+        return float(value)
+    return None
+
+def _json_default(value):
+    """
+    Serialise values that json can't handle natively, e.g. datetimes.
+    """
+    timestamp = _to_timestamp(value)
+    if timestamp is not None:
+        return timestamp
+    return str(value)
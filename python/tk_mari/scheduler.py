@@ -0,0 +1,195 @@
+# Copyright (c) 2014 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Cooperative scheduling of long running work on the main thread
+"""
+
+import sys
+import time
+import itertools
+
+import sgtk
+from sgtk import TankError
+from sgtk.platform.qt import QtCore, QtGui
+
+from .future import Future
+
+class Task(object):
+    """
+    A generator based task run by the CooperativeScheduler.  Each step of the generator is a
+    unit of work - the scheduler may process Qt events between any two steps.  The last value
+    yielded by the generator is used as the result of the task.
+    """
+    def __init__(self, generator, priority, name):
+        """
+        Construction
+
+        :param generator:   The generator to run
+        :param priority:    The priority of the task - higher priority tasks run first
+        :param name:        The name of the task
+        """
+        self.name = name
+        self.priority = priority
+        self.future = Future()
+        self.__generator = generator
+        self.__last_value = None
+        self.__cancelled = False
+
+    @property
+    def cancelled(self):
+        """
+        True if the task was cancelled
+        """
+        return self.__cancelled
+
+    def cancel(self):
+        """
+        Cancel the task.  It will be stopped before its next step is run.
+        """
+        if not self.future.done():
+            self.__cancelled = True
+            self.__generator.close()
+            self.future.set_exception_info(
+                (TankError, TankError("Task '%s' was cancelled" % self.name), None))
+
+    def step(self):
+        """
+        Run the next step of the task.
+
+        :returns:   False if the task has finished, otherwise True
+        """
+        if self.future.done():
+            return False
+        try:
+            self.__last_value = self.__generator.next()
+        except StopIteration:
+            self.future.set_result(self.__last_value)
+            return False
+        except Exception:
+            self.future.set_exception_info(sys.exc_info())
+            return False
+        return True
+
+class CooperativeScheduler(QtCore.QObject):
+    """
+    Runs generator based tasks on the main thread in time slices between Qt events so that
+    Mari keeps redrawing while long running work is done.  Tasks run with schedule() share the
+    event loop with user input; run_sync() doesn't process user input so Mari isn't interactive
+    until it returns.
+    """
+    def __init__(self, slice_ms=16):
+        """
+        Construction
+
+        :param slice_ms:    The time in milliseconds to run tasks for before letting Qt process
+                            events
+        """
+        QtCore.QObject.__init__(self)
+        self.__slice = slice_ms / 1000.0
+        self.__tasks = []
+        self.__counter = itertools.count()
+        self.__sync_depth = 0
+
+        self.__timer = QtCore.QTimer(self)
+        self.__timer.setInterval(0)
+        self.__timer.timeout.connect(self.__run_slice)
+
+    def schedule(self, generator, priority=0, name=None):
+        """
+        Schedule a generator to be run in the background of the main thread.
+
+        :param generator:   The generator to run
+        :param priority:    Tasks with a higher priority are run before those with a lower one.
+                            Tasks with the same priority share the time slices.
+        :param name:        Optional name for the task
+        :returns:           The Task - its future can be used to wait for the result
+        """
+        task = Task(generator, priority, name or "task_%d" % self.__counter.next())
+        self.__tasks.append(task)
+        if QtCore.QCoreApplication.instance():
+            self.__timer.start()
+        else:
+            # there is no event loop so just run the task:
+            while task.step():
+                pass
+            self.__tasks.remove(task)
+        return task
+
+    def run_sync(self, generator, name=None, process_events=True):
+        """
+        Run a generator to completion before returning.  Other scheduled tasks don't run until
+        this has completed.
+
+        If process_events is True then Qt events, excluding user input, are processed between
+        time slices so that Mari keeps redrawing.  Mari isn't interactive while this runs but
+        queued signals and timers are delivered, so callers must be able to cope with other
+        code running between the steps of the generator.  Events are never processed when
+        run_sync() is called from within another run_sync() so that a handler delivered by the
+        outer call can't interleave further work with it.
+
+        :param generator:       The generator to run
+        :param name:            Optional name for the task
+        :param process_events:  If False then the generator is run straight through without
+                                processing any events
+        :returns:               The last value yielded by the generator
+        """
+        task = Task(generator, sys.maxint, name or "task_%d" % self.__counter.next())
+        app = None
+        if process_events and not self.__sync_depth:
+            app = QtCore.QCoreApplication.instance()
+        slice_end = time.time() + self.__slice
+        self.__sync_depth += 1
+        try:
+            while task.step():
+                if app and time.time() >= slice_end:
+                    QtGui.QApplication.processEvents(QtCore.QEventLoop.ExcludeUserInputEvents)
+                    slice_end = time.time() + self.__slice
+        finally:
+            self.__sync_depth -= 1
+        return task.future.result()
+
+    def cancel_all(self):
+        """
+        Cancel all scheduled tasks
+        """
+        tasks = self.__tasks
+        self.__tasks = []
+        self.__timer.stop()
+        for task in tasks:
+            task.cancel()
+
+    def __run_slice(self):
+        """
+        Run the highest priority tasks for one time slice
+        """
+        if self.__sync_depth:
+            # a task is being run synchronously so wait for it to complete:
+            return
+
+        self.__tasks = [t for t in self.__tasks if not t.future.done()]
+        if not self.__tasks:
+            self.__timer.stop()
+            return
+
+        top_priority = max([t.priority for t in self.__tasks])
+        tasks = [t for t in self.__tasks if t.priority == top_priority]
+
+        slice_end = time.time() + self.__slice
+        while tasks and time.time() < slice_end:
+            # round-robin between the tasks with the same priority:
+            for task in list(tasks):
+                if not task.step():
+                    tasks.remove(task)
+                    if not task.cancelled and task.future.exception():
+                        sgtk.platform.current_bundle().log_error(
+                            "Task '%s' failed: %s" % (task.name, task.future.exception()))
+                if time.time() >= slice_end:
+                    break
@@ -0,0 +1,177 @@
+# Copyright (c) 2014 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Export of Mari session files when a project is saved
+"""
+
+import os
+import uuid
+import threading
+
+import sgtk
+from sgtk import TankError
+from sgtk.platform.qt import QtCore
+
+import mari
+
+class SessionExporter(QtCore.QObject):
+    """
+    Exports a Mari session file for the current project each time it's saved.
+
+    Exports are debounced so that a series of rapid saves only results in a single export
+    once the saves have stopped for 'delay' milliseconds.  Only the call to export the session
+    itself is run on the main thread - working out whether the project has changed since the
+    last export, resolving the export path and moving the exported file into place are all
+    done in a background thread.
+    """
+    def __init__(self, prepare_callback, delay=2000):
+        """
+        Construction
+
+        :param prepare_callback:    Callback run on the main thread when an export is due.  This
+                                    is passed the Mari project and should return a tuple containing
+                                    the work template and the fields to apply to it or None if the
+                                    project shouldn't be exported.
+        :param delay:               The time in milliseconds to wait after the last save before
+                                    exporting the session
+        """
+        QtCore.QObject.__init__(self)
+        self.__prepare_callback = prepare_callback
+        self.__project_name = None
+        self.__export_thread = None
+        # fingerprints of the project data for each path that has been exported:
+        self.__exported_fingerprints = {}
+
+        self.__timer = QtCore.QTimer(self)
+        self.__timer.setSingleShot(True)
+        self.__timer.setInterval(delay)
+        self.__timer.timeout.connect(self.__on_timeout)
+
+    def schedule(self, project):
+        """
+        Schedule an export of the session for the specified project.  Any previously scheduled
+        export that hasn't started yet is replaced by this one.
+
+        :param project: The Mari project that was saved
+        """
+        self.__project_name = project.name()
+        self.__timer.start()
+
+    def close(self):
+        """
+        Cancel any scheduled export.  An export that is already in progress will complete.
+        """
+        self.__timer.stop()
+        self.__project_name = None
+
+    def __on_timeout(self):
+        """
+        Called on the main thread when the debounce timer expires
+        """
+        if self.__export_thread and self.__export_thread.is_alive():
+            # wait for the current export to finish before starting another:
+            self.__timer.start()
+            return
+
+        project = mari.projects.current()
+        if not project or project.name() != self.__project_name:
+            # the saved project is no longer open
+            return
+
+        export_info = self.__prepare_callback(project)
+        if not export_info:
+            return
+        work_template, fields = export_info
+
+        project_dir = None
+        try:
+            project_dir = os.path.join(mari.resources.path(mari.resources.CACHE), project.uuid())
+        except Exception:
+            # can't determine where the project data is stored so will always export
+            pass
+
+        self.__export_thread = threading.Thread(target=self.__export,
+                                                args=(work_template, fields, project_dir))
+        self.__export_thread.daemon = True
+        self.__export_thread.start()
+
+    def __export(self, work_template, fields, project_dir):
+        """
+        Export the session.  This is run in a background thread.
+
+        :param work_template:   The template to use to build the path of the session file
+        :param fields:          The fields to apply to the work template
+        :param project_dir:     The directory where Mari stores the data for the project
+        """
+        engine = sgtk.platform.current_bundle()
+        try:
+            work_file_path = work_template.apply_fields(fields)
+
+            # skip the export if nothing has changed since the session was last exported:
+            fingerprint = self.__get_fingerprint(project_dir)
+            if (fingerprint is not None
+                and self.__exported_fingerprints.get(work_file_path) == fingerprint
+                and os.path.exists(work_file_path)):
+                engine.log_debug("Project unchanged since the last session export to: %s" % work_file_path)
+                return
+
+            work_dir = os.path.dirname(work_file_path)
+            if not os.path.exists(work_dir):
+                os.makedirs(work_dir)
+
+            # export to a temporary file alongside the work file and then move it into place so that
+            # the work file is never left half written:
+            base, ext = os.path.splitext(work_file_path)
+            tmp_path = "%s.%s.tmp%s" % (base, uuid.uuid4().hex, ext)
+
+            engine.log_debug("Exporting mari session file to: %s" % work_file_path)
+            engine.main_thread_dispatcher.call_sync(mari.session.exportSession, tmp_path)
+            if not os.path.exists(tmp_path):
+                raise TankError("Mari didn't write the session file '%s'" % tmp_path)
+
+            # rename over the work file - this is atomic on POSIX but Windows won't
+            # rename over an existing file so it has to be removed first:
+            if os.name == "nt" and os.path.exists(work_file_path):
+                os.remove(work_file_path)
+            os.rename(tmp_path, work_file_path)
+
+            self.__exported_fingerprints[work_file_path] = fingerprint
+        except Exception, e:
+            engine.log_error("Failed to export the mari session file: %s" % e)
+
+    def __get_fingerprint(self, project_dir):
+        """
+        Build a cheap fingerprint of the project data on disk that changes whenever
+        the project is saved with modifications.  Only the top level entries of the
+        project directory are checked - the project cache can hold many thousands of
+        files so walking all of it could take longer than the export it's meant to
+        avoid.  Mari rewrites the project's top level files on every save that
+        modifies it, which changes their size or modification time.
+
+        :param project_dir: The directory where Mari stores the data for the project
+        :returns:           A tuple of (entry count, total file size, latest modification
+                            time) or None if the project directory couldn't be found
+        """
+        if not project_dir or not os.path.isdir(project_dir):
+            return None
+
+        entries = os.listdir(project_dir)
+        total_size = 0
+        latest_mtime = 0
+        for entry in entries:
+            try:
+                st = os.stat(os.path.join(project_dir, entry))
+            except OSError:
+                continue
+            if not os.path.isdir(os.path.join(project_dir, entry)):
+                total_size += st.st_size
+            latest_mtime = max(latest_mtime, st.st_mtime)
+        return (len(entries), total_size, latest_mtime)
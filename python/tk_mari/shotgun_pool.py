@@ -0,0 +1,130 @@
+# Copyright (c) 2014 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Shotgun connections that can be used from threads other than the main thread
+"""
+
+import Queue
+import threading
+
+import sgtk
+from sgtk import TankError
+
+from .future import Future, run_to_future
+
+class ShotgunConnectionPool(object):
+    """
+    Hands out a Shotgun connection per thread and runs Shotgun queries on a bounded set of
+    worker threads.
+
+    The Shotgun API isn't thread safe so each thread gets its own connection, created from the
+    current authenticated user so that all connections share the same credentials.  Connections
+    are kept for the life of the thread so the underlying HTTP connection is reused between
+    requests.
+    """
+    def __init__(self, max_workers=4):
+        """
+        Construction
+
+        :param max_workers: The maximum number of queries that will be run concurrently
+        """
+        self.__max_workers = max(1, max_workers)
+        self.__thread_data = threading.local()
+        self.__queue = Queue.Queue()
+        self.__workers = []
+        self.__lock = threading.Lock()
+        self.__closed = False
+
+    def connection(self):
+        """
+        Get the Shotgun connection for the current thread, creating it if needed.  On the
+        main thread this is the engine's own connection.
+
+        :returns:   A Shotgun API instance that can be used on the current thread
+        """
+        if isinstance(threading.current_thread(), threading._MainThread):
+            return sgtk.platform.current_bundle().shotgun
+
+        sg = getattr(self.__thread_data, "connection", None)
+        if sg is None:
+            user = sgtk.get_authenticated_user()
+            if user:
+                sg = user.create_sg_connection()
+            else:
+                sg = sgtk.util.shotgun.create_sg_connection()
+            self.__thread_data.connection = sg
+        return sg
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Run a function on one of the pool's worker threads.  The function is passed the
+        worker's Shotgun connection followed by the specified arguments.
+
+        :param fn:  The function to run
+        :returns:   A Future for the result of the function
+        """
+        with self.__lock:
+            if self.__closed:
+                raise TankError("The Shotgun connection pool has been shut down!")
+            future = Future()
+            self.__queue.put((future, fn, args, kwargs))
+            if len(self.__workers) < self.__max_workers:
+                worker = threading.Thread(target=self.__run_worker, name="ShotgunPoolWorker")
+                worker.daemon = True
+                self.__workers.append(worker)
+                worker.start()
+        return future
+
+    def find_async(self, entity_type, filters, fields=None, *args, **kwargs):
+        """
+        Run a Shotgun find() on a worker thread.  The arguments are the same as for
+        Shotgun.find().
+
+        :returns:   A Future for the list of entities found
+        """
+        return self.submit(lambda sg: sg.find(entity_type, filters, fields, *args, **kwargs))
+
+    def find_one_async(self, entity_type, filters, fields=None, *args, **kwargs):
+        """
+        Run a Shotgun find_one() on a worker thread.  The arguments are the same as for
+        Shotgun.find_one().
+
+        :returns:   A Future for the entity found or None
+        """
+        return self.submit(lambda sg: sg.find_one(entity_type, filters, fields, *args, **kwargs))
+
+    def shutdown(self):
+        """
+        Stop the worker threads once all queued work has completed
+        """
+        with self.__lock:
+            if self.__closed:
+                return
+            self.__closed = True
+            for _ in self.__workers:
+                self.__queue.put(None)
+            self.__workers = []
+
+    def __run_worker(self):
+        """
+        Worker thread loop - runs queued work until the pool is shut down
+        """
+        while True:
+            work = self.__queue.get()
+            if work is None:
+                break
+            future, fn, args, kwargs = work
+            try:
+                sg = self.connection()
+            except Exception, e:
+                future.set_exception_info((TankError, TankError("Failed to connect to Shotgun: %s" % e), None))
+                continue
+            run_to_future(future, fn, sg, *args, **kwargs)
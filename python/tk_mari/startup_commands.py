@@ -0,0 +1,98 @@
+# Copyright (c) 2014 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Scheduling of the commands run when the engine starts or the context changes
+"""
+
+import time
+import collections
+
+import sgtk
+from sgtk.platform.qt import QtCore
+
+class StartupCommandQueue(QtCore.QObject):
+    """
+    Runs a list of commands one at a time once the Qt event loop is idle.
+
+    Each command is run from its own zero-length timer so that Mari can process any pending
+    events (e.g. UI updates) between commands rather than being blocked until all of them
+    have completed.  The time taken by each command is recorded.
+    """
+    def __init__(self):
+        """
+        Construction
+        """
+        QtCore.QObject.__init__(self)
+        self.__queue = collections.deque()
+        self.__timings = []
+
+    @property
+    def timings(self):
+        """
+        A list of (command name, seconds) tuples for all commands that have been run
+        """
+        return list(self.__timings)
+
+    def run(self, commands, run_now=False):
+        """
+        Queue the specified commands to be run.
+
+        :param commands:    A list of (name, callback) tuples for the commands to run
+        :param run_now:     If True then the commands are all run immediately rather than
+                            being queued.  This should be used when there is no event loop
+                            available to run the queued commands.
+        """
+        if run_now:
+            for name, callback in commands:
+                self.__run_command(name, callback)
+            return
+
+        was_idle = not self.__queue
+        self.__queue.extend(commands)
+        if was_idle and self.__queue:
+            QtCore.QTimer.singleShot(0, self.__run_next)
+
+    def cancel(self):
+        """
+        Cancel all commands that haven't been run yet
+        """
+        self.__queue.clear()
+
+    def __run_next(self):
+        """
+        Run the next command in the queue and then schedule the one after it
+        """
+        if not self.__queue:
+            return
+
+        name, callback = self.__queue.popleft()
+        self.__run_command(name, callback)
+
+        if self.__queue:
+            QtCore.QTimer.singleShot(0, self.__run_next)
+
+    def __run_command(self, name, callback):
+        """
+        Run a single command, recording how long it took
+
+        :param name:        The name of the command
+        :param callback:    The callback to run
+        """
+        engine = sgtk.platform.current_bundle()
+
+        start_time = time.time()
+        try:
+            callback()
+        except Exception, e:
+            engine.log_exception("Startup command '%s' failed: %s" % (name, e))
+        duration = time.time() - start_time
+        self.__timings.append((name, duration))
+        engine.log_debug("Startup command '%s' took %.3fs" % (name, duration))
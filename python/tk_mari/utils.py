@@ -8,6 +8,9 @@
 # agreement to the Shotgun Pipeline Toolkit Source Code License. All rights 
 # not expressly granted therein are reserved by Shotgun Software Inc.        
         
+import time
+import datetime
+
 import sgtk
 from sgtk import TankError
 
@@ -55,7 +58,11 @@ def update_publish_records(sg_publishes, min_fields = None):
                 to_update[sg_publish["id"]] = sg_publish
                 break
             
-    if to_update:
+    if not to_update:
+        return
+
+    publish_cache = engine.publish_cache
+    if not publish_cache:
         try:
             # query shotgun for the record of any publishes that need updating:
             filters = [["id", "in", to_update.keys()]]
@@ -66,3 +73,77 @@ def update_publish_records(sg_publishes, min_fields = None):
                 to_update[sg_item["id"]].update(sg_item)
         except Exception, e:
             raise TankError("Failed to retrieve publish details from Shotgun: %s" % e)
+        return
+
+    _update_publish_records_from_cache(publish_cache, sg_publishes[0]["type"], to_update, required_fields)
+
+def _update_publish_records_from_cache(publish_cache, entity_type, to_update, required_fields):
+    """
+    Update publish records using the local publish cache.  Cached records fetched within the
+    cache's max age are used as is, older records are only re-fetched if they have changed in
+    Shotgun since they were cached and anything not cached is fetched.  If Shotgun can't be
+    reached then older cached records are used rather than failing.
+
+    :param publish_cache:   The PublishCache to use
+    :param entity_type:     The publish entity type
+    :param to_update:       Dictionary of the publish records to update keyed by id
+    :param required_fields: The fields required in each publish record
+    """
+    engine = sgtk.platform.current_bundle()
+
+    now = time.time()
+    fresh = set()
+    stale = {}
+    for publish_id, (record, updated_at, fetched_at) in publish_cache.get(entity_type, to_update.keys()).iteritems():
+        if [f for f in required_fields if f not in record]:
+            # the cached record doesn't have all the fields needed:
+            continue
+        if now - fetched_at < publish_cache.max_age:
+            _apply_cached_record(to_update[publish_id], record)
+            fresh.add(publish_id)
+        elif updated_at is not None:
+            stale[publish_id] = (record, updated_at)
+    uncached = [i for i in to_update if i not in fresh and i not in stale]
+    if not uncached and not stale:
+        return
+
+    # build a single query that returns all uncached records and any stale records that have
+    # changed since they were cached:
+    filters = []
+    if uncached:
+        filters.append(["id", "in", uncached])
+    if stale:
+        changed_since = datetime.datetime.fromtimestamp(min([u for _, u in stale.values()]))
+        filters.append({"filter_operator":"all",
+                        "filters":[["id", "in", stale.keys()], ["updated_at", "greater_than", changed_since]]})
+
+    try:
+        sg_res = engine.shotgun.find(entity_type, [{"filter_operator":"any", "filters":filters}],
+                                     required_fields + ["updated_at"])
+    except Exception, e:
+        if uncached:
+            raise TankError("Failed to retrieve publish details from Shotgun: %s" % e)
+        # Shotgun can't be reached but all records are cached so carry on with those:
+        engine.log_warning("Failed to refresh publish details from Shotgun, using cached details instead: %s" % e)
+        for publish_id, (record, _) in stale.iteritems():
+            _apply_cached_record(to_update[publish_id], record)
+        return
+
+    publish_cache.store(entity_type, sg_res, touched_ids=stale.keys())
+
+    sg_res = dict([(sg_item["id"], sg_item) for sg_item in sg_res])
+    for publish_id in uncached:
+        if publish_id in sg_res:
+            _apply_cached_record(to_update[publish_id], sg_res[publish_id])
+    for publish_id, (record, _) in stale.iteritems():
+        _apply_cached_record(to_update[publish_id], sg_res.get(publish_id) or record)
+
+def _apply_cached_record(sg_publish, record):
+    """
+    Update a publish record with the fields from a cached or fetched record.  The
+    'updated_at' field is only used by the cache so isn't copied.
+
+    :param sg_publish:  The publish record to update
+    :param record:      The record to copy fields from
+    """
+    sg_publish.update([(k, v) for k, v in record.iteritems() if k != "updated_at"])
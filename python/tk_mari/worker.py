@@ -0,0 +1,424 @@
+# Copyright (c) 2014 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Running work in headless Mari worker processes.
+
+A job is described by a JSON file containing a dictionary with at least a "kind" key.  The
+worker process is started with the path to the job file in the SGTK_MARI_WORKER_JOB environment
+variable and reports back to the process that launched it by writing events to stdout, one per
+line, as JSON prefixed by EVENT_PREFIX.  Every event is a dictionary with an "event" key, e.g.:
+
+    SGTK_MARI_EVENT {"event": "item_published", "key": ["geo", "diffuse", null], "publish_id": 123}
+
+Any process that reads the job file and writes events in this form can act as a worker.
+
+This module only depends on sgtk so that it can also be used to launch workers from outside
+of Mari, e.g. by scripts/batch_build_projects.py.
+"""
+
+import os
+import sys
+import json
+import time
+import shlex
+import shutil
+import threading
+import subprocess
+
+import sgtk
+from sgtk import TankError
+
+# environment variable used to pass the job file to the worker:
+JOB_ENV_VAR = "SGTK_MARI_WORKER_JOB"
+
+# prefix used to identify event lines in the worker output:
+EVENT_PREFIX = "SGTK_MARI_EVENT "
+
+# the script run by the worker process:
+WORKER_SCRIPT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, os.pardir,
+                                             "scripts", "mari_worker.py"))
+
+# the directory containing the script Mari runs at startup to bootstrap the engine:
+STARTUP_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, os.pardir,
+                                           "startup"))
+
+def write_job(job, path):
+    """
+    Write a job description to disk.
+
+    :param job:     The job dictionary to write
+    :param path:    The path to write the job to
+    """
+    job_dir = os.path.dirname(path)
+    if job_dir and not os.path.exists(job_dir):
+        os.makedirs(job_dir)
+    with open(path, "w") as job_file:
+        json.dump(job, job_file, indent=1, sort_keys=True)
+
+def read_job(path):
+    """
+    Read a job description from disk.
+
+    :param path:    The path of the job file
+    :returns:       The job dictionary
+    """
+    with open(path, "r") as job_file:
+        return json.load(job_file)
+
+def remove_job(path):
+    """
+    Remove a job description from disk once the job has completed.  Failures are ignored as
+    the job file is only used to start the worker.
+
+    :param path:    The path of the job file
+    """
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+def get_current_job():
+    """
+    Get the job the current process is running as a worker for.
+
+    :returns:   The job dictionary or None if this isn't a worker process
+    """
+    job_path = os.environ.get(JOB_ENV_VAR)
+    if not job_path or not os.path.exists(job_path):
+        return None
+    return read_job(job_path)
+
+def emit_event(event, **data):
+    """
+    Report an event from a worker process to the process that launched it.
+
+    :param event:   The name of the event
+    :param data:    Additional data to include with the event.  This must be JSON serializable.
+    """
+    data["event"] = event
+    data["time"] = time.time()
+    sys.stdout.write("%s%s\n" % (EVENT_PREFIX, json.dumps(data)))
+    sys.stdout.flush()
+
+class WorkerProcess(object):
+    """
+    A worker process running a job.  Events written by the worker are parsed from its output
+    in a background thread and passed to a callback.
+    """
+    def __init__(self, command, job, job_path, context, on_event=None,
+                 engine_name=None, mari_path=None, on_output=None, env=None, temp_paths=None):
+        """
+        Construction - writes the job file and launches the worker process.  The job file and
+        any temporary paths are removed once the worker process exits.
+
+        :param command:     The command line used to run the worker.  "{mari}", "{script}" and
+                            "{job}" are replaced with the path to the Mari executable, the worker
+                            script and the job file respectively.
+        :param job:         The job dictionary to run
+        :param job_path:    The path to write the job file to
+        :param context:     The context to start the engine in within the worker
+        :param on_event:    Callback run for each event reported by the worker.  This is passed
+                            the event dictionary and is called from a background thread.
+        :param engine_name: The instance name of the engine to start in the worker.  Defaults to
+                            the current engine.
+        :param mari_path:   The path of the Mari executable.  Defaults to the executable of the
+                            current process.
+        :param on_output:   Callback run for each line of output from the worker that isn't an
+                            event.  Defaults to logging the line as debug with the current engine.
+        :param env:         Additional environment variables to set for the worker
+        :param temp_paths:  Files and directories used by the job that should be removed once
+                            the worker exits, e.g. a copy of the project the worker opens
+        """
+        self.__on_event = on_event
+        self.__on_output = on_output or _log_worker_output
+        self.__job_path = job_path
+        self.__temp_paths = list(temp_paths or [])
+        write_job(job, job_path)
+
+        command_line = command.format(mari=mari_path or sys.executable, script=WORKER_SCRIPT,
+                                      job=job_path)
+
+        # the worker bootstraps the engine in the same way that Mari does when launched
+        # through Toolkit:
+        worker_env = os.environ.copy()
+        worker_env["TANK_ENGINE"] = engine_name or sgtk.platform.current_bundle().instance_name
+        worker_env["TANK_CONTEXT"] = sgtk.context.serialize(context)
+        worker_env[JOB_ENV_VAR] = job_path
+
+        # Mari only runs the engine's startup script if it's on the script path.  This is
+        # normally set when Mari is launched through Toolkit but not when the worker is
+        # launched from a plain shell, e.g. by scripts/batch_build_projects.py:
+        script_paths = [p for p in worker_env.get("MARI_SCRIPT_PATH", "").split(os.pathsep) if p]
+        if STARTUP_DIR not in script_paths:
+            script_paths.insert(0, STARTUP_DIR)
+        worker_env["MARI_SCRIPT_PATH"] = os.pathsep.join(script_paths)
+        worker_env.update(env or {})
+
+        self.__on_output("Launching Mari worker: %s" % command_line)
+        try:
+            self.__process = subprocess.Popen(shlex.split(command_line, posix=(os.name != "nt")),
+                                              stdout=subprocess.PIPE,
+                                              stderr=subprocess.STDOUT,
+                                              env=worker_env)
+        except Exception, e:
+            self.__remove_temp_files()
+            raise TankError("Failed to launch Mari worker '%s': %s" % (command_line, e))
+
+        self.__reader = threading.Thread(target=self.__read_output)
+        self.__reader.daemon = True
+        self.__reader.start()
+
+    @property
+    def job_path(self):
+        """
+        The path of the job file the worker is running
+        """
+        return self.__job_path
+
+    def is_running(self):
+        """
+        :returns:   True if the worker process is still running
+        """
+        return self.__process.poll() is None
+
+    def wait(self):
+        """
+        Wait for the worker process to finish.
+
+        :returns:   The exit code of the worker process
+        """
+        self.__reader.join()
+        return self.__process.wait()
+
+    def __remove_temp_files(self):
+        """
+        Remove the job file and any temporary paths used by the job
+        """
+        remove_job(self.__job_path)
+        for path in self.__temp_paths:
+            try:
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                elif os.path.exists(path):
+                    os.remove(path)
+            except (IOError, OSError), e:
+                self.__on_output("Failed to remove '%s': %s" % (path, e))
+
+    def __read_output(self):
+        """
+        Read the worker output, dispatching any events found.  Runs in a background thread.
+        """
+        for line in iter(self.__process.stdout.readline, b""):
+            line = line.rstrip()
+            if not line.startswith(EVENT_PREFIX):
+                self.__on_output("[worker] %s" % line)
+                continue
+            try:
+                event = json.loads(line[len(EVENT_PREFIX):])
+            except ValueError:
+                self.__on_output("[worker] %s" % line)
+                continue
+            if self.__on_event:
+                try:
+                    self.__on_event(event)
+                except Exception, e:
+                    self.__on_output("Failed to handle worker event %s: %s" % (event, e))
+
+        exit_code = self.__process.wait()
+        self.__remove_temp_files()
+        if self.__on_event:
+            self.__on_event({"event": "worker_exited", "exit_code": exit_code, "time": time.time()})
+
+def _log_worker_output(line):
+    """
+    Log a line of output from a worker process with the current engine
+    """
+    engine = sgtk.platform.current_bundle()
+    if engine:
+        engine.log_debug(line)
+
+def run_texture_publish_job(job):
+    """
+    Publish textures in a worker process.  This opens the project, collects the session with the
+    publisher and publishes only the mari.texture items listed in the job using the same
+    collector and publish plugins as an interactive publish.
+
+    Mari won't open a project that is still open in the session that launched the publish, so
+    that session archives the saved project and launches the worker with its own Mari cache.  The
+    archive is extracted into the worker's cache and the copy is published.
+
+    :param job: The job dictionary.  This should contain the "project" to open, the "archive"
+                of the project to extract if it isn't already in the cache, the "publisher"
+                app instance name and the list of "items" to publish, each a dictionary with
+                the "key" of the item and its "description".
+    """
+    import mari
+
+    engine = sgtk.platform.current_bundle()
+
+    publisher = engine.apps.get(job.get("publisher") or "tk-multi-publish2")
+    if not publisher:
+        raise TankError("The publisher app isn't available in the worker!")
+
+    project = mari.projects.current()
+    if not project or project.name() != job["project"]:
+        if project:
+            mari.projects.close()
+        if job.get("archive") and job["project"] not in mari.projects.names():
+            emit_event("progress", message="Extracting project %s" % job["project"])
+            try:
+                mari.projects.extract(job["archive"])
+            except Exception, e:
+                raise TankError("Failed to extract project '%s' from '%s': %s"
+                                % (job["project"], job["archive"], e))
+        emit_event("progress", message="Opening project %s" % job["project"])
+        mari.projects.open(job["project"])
+        project = mari.projects.current()
+        if not project or project.name() != job["project"]:
+            raise TankError("Failed to open project '%s'!" % job["project"])
+
+    emit_event("progress", message="Collecting the session")
+    manager = publisher.create_publish_manager()
+    manager.collect_session()
+
+    # only publish the items listed in the job:
+    job_items = dict([(tuple(i["key"]), i) for i in job["items"]])
+    publish_items = []
+    for item in manager.tree:
+        item_type = getattr(item, "type_spec", None) or item.type
+        if item_type != "mari.texture":
+            continue
+        job_item = job_items.pop(tuple(item.properties.get("mari_index_key") or ()), None)
+        item.checked = job_item is not None
+        if not job_item:
+            continue
+        if job_item.get("description"):
+            item.description = job_item["description"]
+        publish_items.append(item)
+
+    # report any items that no longer exist in the project:
+    for key, job_item in job_items.iteritems():
+        emit_event("item_failed", key=list(key), name=job_item.get("name"),
+                   message="The item wasn't found in the project")
+
+    try:
+        emit_event("progress", message="Validating")
+        failed_validation = manager.validate()
+        if failed_validation:
+            raise TankError("Validation failed for %d task(s)" % len(failed_validation))
+        emit_event("progress", message="Publishing")
+        manager.publish()
+        emit_event("progress", message="Finalizing")
+        manager.finalize()
+    finally:
+        # report the result for each item:
+        for item in publish_items:
+            key = list(item.properties["mari_index_key"])
+            sg_publish_data = item.properties.get("sg_publish_data")
+            if sg_publish_data:
+                emit_event("item_published", key=key, name=item.name,
+                           publish_id=sg_publish_data["id"], path=item.properties.get("path"))
+            else:
+                emit_event("item_failed", key=key, name=item.name,
+                           message="The publish wasn't registered")
+
+def run_build_project_job(job):
+    """
+    Build a Mari project in a worker process using the engine's create_project so that the
+    project and all of its geometry are tagged with Shotgun metadata.  The project is saved
+    and closed once it has been built.
+
+    :param job: The job dictionary.  This should contain:
+                "name":             The name of the project to create
+                "entity":           Optional entity dictionary whose context the project is
+                                    created in
+                "publishes":        The list of geometry publishes to build the project from,
+                                    each a Shotgun entity dictionary.  If empty, the latest
+                                    publish of each name matching "publish_types" for the
+                                    entity is used.
+                "publish_types":    The publish types to look for when no publishes are given.
+                                    Defaults to the engine's geometry_publish_types setting.
+                "channels":         The channels to create, each a dictionary with the "name",
+                                    "size" and "depth" (8, 16 or 32) of the channel
+                "mesh_options":     Optional project meta options used when loading the geometry
+    """
+    import mari
+
+    engine = sgtk.platform.current_bundle()
+    started_at = time.time()
+
+    # build the project in the context of the entity so that it's tagged correctly:
+    entity = job.get("entity")
+    if entity:
+        ctx = engine.sgtk.context_from_entity(entity["type"], entity["id"])
+        if ctx != engine.context:
+            emit_event("progress", message="Changing context to %s" % ctx)
+            sgtk.platform.change_context(ctx)
+            engine = sgtk.platform.current_engine()
+
+    sg_publishes = job.get("publishes") or []
+    if not sg_publishes:
+        if not entity:
+            raise TankError("No publishes or entity specified to build the project '%s' from!"
+                            % job["name"])
+        publish_types = job.get("publish_types") or engine.get_setting("geometry_publish_types")
+        if not publish_types:
+            raise TankError("No geometry publish types specified to build the project '%s' from!"
+                            % job["name"])
+        sg_publishes = _find_latest_publishes(engine, entity, publish_types)
+        if not sg_publishes:
+            raise TankError("No geometry publishes found for %s %s" % (entity["type"], entity["id"]))
+
+    depths = {8: mari.Image.DEPTH_BYTE, 16: mari.Image.DEPTH_HALF, 32: mari.Image.DEPTH_FLOAT}
+    channels_to_create = []
+    for channel in job.get("channels") or [{"name": "diffuse", "size": 4096, "depth": 8}]:
+        size = channel.get("size", 4096)
+        channels_to_create.append(mari.ChannelInfo(channel["name"], size, size,
+                                                   depths.get(channel.get("depth", 8), mari.Image.DEPTH_BYTE)))
+
+    emit_event("progress", message="Creating project '%s' from %d publish(es)"
+               % (job["name"], len(sg_publishes)))
+    project = engine.create_project(job["name"], sg_publishes, channels_to_create,
+                                    project_meta_options=job.get("mesh_options"))
+    if not project:
+        raise TankError("The project '%s' wasn't created!" % job["name"])
+
+    project_uuid = project.uuid()
+    mari.projects.current().save()
+    mari.projects.close()
+
+    emit_event("project_built", name=job["name"], uuid=project_uuid,
+               publish_ids=[p["id"] for p in sg_publishes],
+               duration=time.time() - started_at)
+
+def _find_latest_publishes(engine, entity, publish_types):
+    """
+    Find the latest version of every publish for an entity
+
+    :param engine:          The current engine
+    :param entity:          The entity to find the publishes for
+    :param publish_types:   The publish types to include
+    :returns:               A list of the latest publishes, one per publish name
+    """
+    publish_entity_type = sgtk.util.get_published_file_entity_type(engine.sgtk)
+    if publish_entity_type == "PublishedFile":
+        publish_type_field = "published_file_type.PublishedFileType.code"
+    else:
+        publish_type_field = "tank_type.TankType.code"
+
+    filters = [["entity", "is", entity], [publish_type_field, "in", publish_types]]
+    sg_res = engine.shotgun.find(publish_entity_type, filters, ["name", "version_number", publish_type_field],
+                                 order=[{"field_name": "version_number", "direction": "asc"}])
+
+    latest = {}
+    for sg_publish in sg_res:
+        latest[(sg_publish["name"], sg_publish.get(publish_type_field))] = sg_publish
+    return sorted(latest.values(), key=lambda p: p["name"])
@@ -0,0 +1,270 @@
+# Copyright (c) 2014 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Build Shotgun aware Mari projects in bulk using headless Mari worker processes.
+
+One project is built per entity, either from the latest geometry publishes for the entity or
+from the publishes given on the command line, using the engine's create_project so that the
+project and geometry are fully tagged.  Several Mari processes are run side by side and the
+status and timings of every project are written to a JSON report.
+
+This must be run with a Python interpreter that can import the Toolkit core (sgtk) for the
+pipeline configuration, e.g.:
+
+    python batch_build_projects.py --config /path/to/pipeline_config \\
+        --mari /path/to/mari --entity Asset:1234 --entity Asset:1235 \\
+        --publish-type "Alembic Cache" --channel diffuse:4096:8 --workers 4
+"""
+
+import os
+import sys
+import imp
+import json
+import time
+import uuid
+import optparse
+import tempfile
+import threading
+
+import sgtk
+
+# load the worker module directly as the rest of tk_mari can only be imported inside Mari:
+worker = imp.load_source("tk_mari_worker", os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                        os.pardir, "python", "tk_mari", "worker.py"))
+
+class ProjectBuild(object):
+    """
+    The build of a single project, tracking its status from the events reported by the worker
+    """
+    def __init__(self, name, entity, publishes):
+        """
+        Construction
+
+        :param name:        The name of the project to build
+        :param entity:      The entity to build the project for
+        :param publishes:   The publishes to build the project from.  If empty, the latest
+                            publishes for the entity are used.
+        """
+        self.name = name
+        self.entity = entity
+        self.publishes = publishes
+        self.status = "pending"
+        self.message = None
+        self.started_at = None
+        self.finished_at = None
+        self.worker = None
+        self.__lock = threading.Lock()
+
+    def on_event(self, event):
+        """
+        Handle an event reported by the worker building this project.  Called from a
+        background thread.
+
+        :param event:   The event dictionary
+        """
+        with self.__lock:
+            event_type = event.get("event")
+            if event_type == "progress":
+                _log("%s: %s" % (self.name, event.get("message")))
+            elif event_type == "project_built":
+                self.status = "built"
+                self.message = "Built from publishes %s" % event.get("publish_ids")
+            elif event_type == "job_failed":
+                self.status = "failed"
+                self.message = event.get("message")
+            elif event_type == "worker_exited":
+                if self.status not in ("built", "failed"):
+                    self.status = "failed"
+                    self.message = "The worker exited with code %s" % event.get("exit_code")
+                self.finished_at = time.time()
+
+    def as_dict(self):
+        """
+        :returns:   A dictionary describing the build for the report
+        """
+        duration = None
+        if self.started_at and self.finished_at:
+            duration = self.finished_at - self.started_at
+        return {"name": self.name,
+                "entity": self.entity,
+                "publish_ids": [p["id"] for p in self.publishes],
+                "status": self.status,
+                "message": self.message,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "duration": duration}
+
+def _log(msg):
+    """
+    Write a message to stdout
+    """
+    sys.stdout.write("%s %s\n" % (time.strftime("%H:%M:%S"), msg))
+    sys.stdout.flush()
+
+def _parse_entity(value):
+    """
+    Parse an entity given as 'Type:id'
+    """
+    entity_type, entity_id = value.rsplit(":", 1)
+    return {"type": entity_type, "id": int(entity_id)}
+
+def _parse_channel(value):
+    """
+    Parse a channel given as 'name[:size[:depth]]'
+    """
+    parts = value.split(":")
+    return {"name": parts[0],
+            "size": int(parts[1]) if len(parts) > 1 else 4096,
+            "depth": int(parts[2]) if len(parts) > 2 else 8}
+
+def _get_builds(tk, options):
+    """
+    Build the list of projects to build from the entities and publishes given on the
+    command line.  Publishes are grouped by their entity so one project is built per entity.
+
+    :param tk:      The Toolkit API instance
+    :param options: The parsed command line options
+    :returns:       A list of ProjectBuild instances
+    """
+    entities = [_parse_entity(e) for e in options.entity]
+    publishes_by_entity = {}
+
+    if options.publish:
+        publish_entity_type = sgtk.util.get_published_file_entity_type(tk)
+        sg_publishes = tk.shotgun.find(publish_entity_type,
+                                       [["id", "in", [int(p) for p in options.publish]]],
+                                       ["entity"])
+        for sg_publish in sg_publishes:
+            entity = sg_publish.get("entity")
+            if not entity:
+                _log("Skipping publish %d as it isn't linked to an entity" % sg_publish["id"])
+                continue
+            key = (entity["type"], entity["id"])
+            publishes_by_entity.setdefault(key, []).append({"type": sg_publish["type"],
+                                                            "id": sg_publish["id"]})
+            if key not in [(e["type"], e["id"]) for e in entities]:
+                entities.append({"type": entity["type"], "id": entity["id"]})
+
+    builds = []
+    for entity in entities:
+        sg_entity = tk.shotgun.find_one(entity["type"], [["id", "is", entity["id"]]], ["code", "name"])
+        if not sg_entity:
+            _log("Skipping %s %d as it doesn't exist in Shotgun" % (entity["type"], entity["id"]))
+            continue
+        code = sg_entity.get("code") or sg_entity.get("name") or str(entity["id"])
+        name = options.name.format(code=code, type=entity["type"], id=entity["id"])
+        builds.append(ProjectBuild(name, entity,
+                                   publishes_by_entity.get((entity["type"], entity["id"]), [])))
+    return builds
+
+def main():
+    """
+    Entry point
+    """
+    parser = optparse.OptionParser(usage="%prog --config PATH --mari PATH [options]")
+    parser.add_option("--config", help="Path of the pipeline configuration to use")
+    parser.add_option("--mari", help="Path of the Mari executable")
+    parser.add_option("--engine", default="tk-mari", help="Instance name of the Mari engine [%default]")
+    parser.add_option("--entity", action="append", default=[],
+                      help="Entity to build a project for as Type:id, e.g. Asset:1234.  May be repeated.")
+    parser.add_option("--publish", action="append", default=[],
+                      help="Id of a geometry publish to build a project from.  Publishes are grouped "
+                           "by entity.  May be repeated.")
+    parser.add_option("--publish-type", action="append", default=[],
+                      help="Publish type to use when finding the latest publishes for an entity.  "
+                           "May be repeated.  Defaults to the engine's geometry_publish_types setting.")
+    parser.add_option("--channel", action="append", default=[],
+                      help="Channel to create as name[:size[:depth]], e.g. diffuse:4096:8.  "
+                           "May be repeated.")
+    parser.add_option("--name", default="{code}",
+                      help="Project name, {code}, {type} and {id} are replaced [%default]")
+    parser.add_option("--workers", type="int", default=2,
+                      help="Number of Mari processes to run side by side [%default]")
+    parser.add_option("--command", default='"{mari}" -t "{script}"',
+                      help="Command used to run each worker [%default]")
+    parser.add_option("--report", default="mari_project_build_report.json",
+                      help="Path of the JSON report to write [%default]")
+    parser.add_option("--job-dir", default=None, help="Directory to write job files to")
+    options, _ = parser.parse_args()
+
+    if not options.config or not options.mari:
+        parser.error("--config and --mari must be specified")
+    if not options.entity and not options.publish:
+        parser.error("At least one --entity or --publish must be specified")
+
+    # authenticate once and share the user with every worker through the serialized context:
+    authenticator = sgtk.authentication.ShotgunAuthenticator()
+    sgtk.set_authenticated_user(authenticator.get_user())
+    tk = sgtk.sgtk_from_path(options.config)
+
+    builds = _get_builds(tk, options)
+    if not builds:
+        _log("Nothing to build!")
+        return 1
+
+    job_dir = options.job_dir or tempfile.mkdtemp(prefix="mari_build_")
+    channels = [_parse_channel(c) for c in options.channel]
+
+    pending = list(builds)
+    running = []
+    started_at = time.time()
+    while pending or running:
+        running = [b for b in running if b.finished_at is None]
+        while pending and len(running) < max(1, options.workers):
+            build = pending.pop(0)
+            job = {"kind": "build_project",
+                   "name": build.name,
+                   "entity": build.entity,
+                   "publishes": build.publishes,
+                   "publish_types": options.publish_type,
+                   "channels": channels}
+            ctx = tk.context_from_entity(build.entity["type"], build.entity["id"])
+            job_path = os.path.join(job_dir, "%s.json" % uuid.uuid4().hex)
+            _log("Building project '%s' for %s %d..." % (build.name, build.entity["type"], build.entity["id"]))
+            build.started_at = time.time()
+            build.status = "running"
+            try:
+                build.worker = worker.WorkerProcess(options.command, job, job_path, ctx, build.on_event,
+                                                    engine_name=options.engine, mari_path=options.mari,
+                                                    on_output=lambda line: None)
+            except Exception, e:
+                build.status = "failed"
+                build.message = str(e)
+                build.finished_at = time.time()
+                continue
+            running.append(build)
+        time.sleep(0.5)
+
+    report = {"started_at": started_at,
+              "duration": time.time() - started_at,
+              "workers": options.workers,
+              "projects": [b.as_dict() for b in builds]}
+    with open(options.report, "w") as report_file:
+        json.dump(report, report_file, indent=1)
+
+    # the workers remove their job files when they exit so remove the job directory if
+    # it was created for this run:
+    if not options.job_dir:
+        try:
+            os.rmdir(job_dir)
+        except OSError:
+            pass
+
+    failed = [b for b in builds if b.status != "built"]
+    for build in builds:
+        _log("%-40s %-8s %6.1fs  %s" % (build.name, build.status,
+                                         build.as_dict()["duration"] or 0.0, build.message or ""))
+    _log("Built %d of %d projects in %.1fs.  Report written to %s"
+         % (len(builds) - len(failed), len(builds), report["duration"], options.report))
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,42 @@
+# Copyright (c) 2014 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Script run by a headless Mari worker process (e.g. 'mari -t mari_worker.py').  The engine is
+started by the Toolkit startup script from the TANK_ENGINE and TANK_CONTEXT environment variables
+before this is run, after which the job passed in the SGTK_MARI_WORKER_JOB environment variable
+is run and Mari exits.
+"""
+
+import sys
+
+import mari
+
+def run_job():
+    """
+    Run the worker job with the current engine
+    """
+    import sgtk
+
+    engine = sgtk.platform.current_engine()
+    if not engine:
+        sys.stdout.write("The Shotgun engine isn't running in this Mari worker!\n")
+        return False
+
+    return engine.run_worker_job()
+
+if __name__ == "__main__":
+    succeeded = False
+    try:
+        succeeded = run_job()
+    finally:
+        sys.stdout.flush()
+        mari.app.quit()
+    sys.exit(0 if succeeded else 1)